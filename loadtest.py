@@ -0,0 +1,458 @@
+"""
+Нагрузочный клиент для обоих проектов: сценарии пользователей поверх пула keep-alive соединений
+HTTP/1.1 на asyncio. Только стандартная библиотека, ходит только на loopback.
+
+    python loadtest.py shop --url http://127.0.0.1:8000 --concurrency 20 --duration 30
+    python loadtest.py library --url http://127.0.0.1:8001 --rate 50 --duration 60 --histogram
+
+Сервер запускается отдельно, например: cd myproject && uvicorn myproject.asgi:application --port 8000
+
+Сценарии:
+    shop    - вход -> категории -> товары категории -> карточка товара -> в корзину -> оформление.
+              Отдельного эндпоинта оформления в API нет: это пересчёт корзины (пустой order/batch
+              под блокировкой заказа) и просмотр заказа. Все пользователи входят под одной учётной
+              записью (--username/--password, по умолчанию пользователь команды seed_bench),
+              поэтому корзина у них общая.
+    library - страница каталога (каждый пользователь листает его дальше по next_cursor)
+              -> произведение -> список глав -> текст главы.
+
+--concurrency - виртуальных пользователей, каждый проходит сценарий по кругу.
+--rate        - сколько сценариев в секунду запускать на всех (0 - без ограничения: следующий
+                сразу после предыдущего).
+--connections - размер пула соединений (по умолчанию = concurrency); если соединений меньше,
+                чем пользователей, ожидание свободного соединения входит в задержку.
+Задержки собираются в гистограммы с логарифмическими корзинами (погрешность ~5%) по каждому шагу.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import math
+import random
+import socket
+import sys
+import time
+from collections import Counter
+from urllib.parse import quote, urlsplit
+
+DEFAULT_USERNAME = "bench"
+DEFAULT_PASSWORD = "bench-password"
+
+
+class StepFailed(Exception):
+    pass
+
+
+# ----- HTTP/1.1 с keep-alive -----
+
+class Response:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+class Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method: str, target: str, headers: dict, body: bytes) -> Response:
+        head = [f"{method} {target} HTTP/1.1"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        head.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        if not status_line.startswith(b"HTTP/1."):
+            raise ConnectionError(f"Bad status line: {status_line[:80]!r}")
+        status = int(status_line.split(None, 2)[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return Response(status, response_headers, await self._read_body(method, status, response_headers))
+
+    async def _read_body(self, method: str, status: int, headers: dict) -> bytes:
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return b""
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+                if size == 0:
+                    # trailer-заголовки до пустой строки
+                    while await self.reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    return b"".join(chunks)
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+        if "content-length" in headers:
+            return await self.reader.readexactly(int(headers["content-length"]))
+        # без длины тело идёт до закрытия соединения
+        headers["connection"] = "close"
+        return await self.reader.read()
+
+    def close(self):
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    Не больше size соединений одновременно; после ответа соединение возвращается в пул,
+    если сервер не попросил его закрыть.
+    """
+    def __init__(self, host: str, port: int, size: int):
+        self.host = host
+        self.port = port
+        self.authority = f"{host}:{port}" if ":" not in host else f"[{host}]:{port}"
+        self._slots = asyncio.Semaphore(size)
+        self._idle = []
+        self.opened = 0
+
+    async def _connect(self) -> Connection:
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        self.opened += 1
+        return Connection(reader, writer)
+
+    async def request(self, method: str, target: str, headers: dict, body: bytes = b"") -> Response:
+        headers = {"Host": self.authority, **headers}
+        async with self._slots:
+            reused = bool(self._idle)
+            connection = self._idle.pop() if reused else await self._connect()
+            try:
+                response = await connection.request(method, target, headers, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection.close()
+                if not reused:
+                    raise
+                # сервер закрыл простаивавшее соединение - повторяем один раз на новом
+                connection = await self._connect()
+                response = await connection.request(method, target, headers, body)
+            except BaseException:
+                connection.close()
+                raise
+            if response.keep_alive:
+                self._idle.append(connection)
+            else:
+                connection.close()
+            return response
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+
+# ----- статистика -----
+
+class Histogram:
+    """
+    Логарифмические корзины: верхняя граница i-й - LOWEST * GROWTH**i мс,
+    квантили - с относительной погрешностью не больше GROWTH - 1.
+    """
+    LOWEST = 0.05
+    GROWTH = 1.05
+    # границы строк при выводе (--histogram), мс
+    DISPLAY = tuple(m * 10 ** e for e in range(-1, 5) for m in (1, 2, 5)) + (100_000,)
+
+    def __init__(self):
+        self.counts = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, ms: float):
+        index = 0 if ms <= self.LOWEST else math.ceil(math.log(ms / self.LOWEST, self.GROWTH))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def upper(self, index: int) -> float:
+        return self.LOWEST * self.GROWTH ** index
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank, seen = max(1, math.ceil(q * self.count)), 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.upper(index), self.max)
+        return self.max
+
+    def render(self, width: int = 40) -> list:
+        rows = Counter()
+        for index, count in self.counts.items():
+            upper = self.upper(index)
+            rows[next((bound for bound in self.DISPLAY if upper <= bound), self.DISPLAY[-1])] += count
+        if not rows:
+            return []
+        bounds = [bound for bound in self.DISPLAY if min(rows) <= bound <= max(rows)]
+        peak = max(rows.values())
+        return [
+            f"  <= {bound:>8g} мс {rows[bound]:>8} {'#' * math.ceil(rows[bound] / peak * width)}"
+            for bound in bounds
+        ]
+
+
+class Stats:
+    def __init__(self):
+        self.steps = {}
+        self.errors = Counter()
+        self.error_samples = []
+        self.scenarios = Histogram()
+        self.failed = 0
+
+    def record(self, step: str, ms: float, error: str = None):
+        self.steps.setdefault(step, [Histogram(), 0])
+        self.steps[step][0].record(ms)
+        if error:
+            self.steps[step][1] += 1
+            self.errors[step] += 1
+            if len(self.error_samples) < 10:
+                self.error_samples.append(f"{step}: {error}")
+
+
+class Session:
+    """
+    Состояние одного виртуального пользователя: генератор, токен, курсор каталога.
+    """
+    def __init__(self, pool: ConnectionPool, stats: Stats, rng: random.Random, options):
+        self.pool = pool
+        self.stats = stats
+        self.rng = rng
+        self.options = options
+        self.token = None
+        self.cursor = None
+
+    async def call(self, step: str, method: str, path: str, payload=None, parse: bool = True):
+        headers = {"Accept": "application/json"}
+        body = b""
+        if payload is not None:
+            body = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        try:
+            response = await self.pool.request(method, path, headers, body)
+        except (OSError, asyncio.IncompleteReadError) as exc:
+            self.stats.record(step, (time.perf_counter() - started) * 1000, f"{type(exc).__name__}: {exc}")
+            raise StepFailed(step)
+        error = f"HTTP {response.status} {method} {path}" if response.status >= 400 else None
+        self.stats.record(step, (time.perf_counter() - started) * 1000, error)
+        if error:
+            raise StepFailed(step)
+        return response.json() if parse else response
+
+    async def get(self, step: str, path: str, parse: bool = True):
+        return await self.call(step, "GET", path, parse=parse)
+
+    async def post(self, step: str, path: str, payload):
+        return await self.call(step, "POST", path, payload)
+
+
+# ----- сценарии -----
+
+async def shop(session: Session):
+    tokens = await session.post("login", "/api/login", {
+        "username": session.options.username, "password": session.options.password,
+    })
+    session.token = tokens["access"]
+    categories = await session.get("categories", "/api/categories")
+    query = "/api/products/query?limit=20&fields=id,title,price"
+    if categories:
+        query += f"&category={session.rng.choice(categories)['id']}"
+    page = await session.get("products_query", query)
+    if not page["items"]:
+        return
+    product = session.rng.choice(page["items"])["id"]
+    await session.get("product_detail", f"/api/products/{product}")
+    await session.post("cart_add", "/api/order/add", {"product": product, "count": 1})
+    cart = await session.post("checkout", "/api/order/batch", [])
+    await session.get("order", f"/api/order/{cart['id']}")
+
+
+async def library(session: Session):
+    path = "/api/works/list?limit=20"
+    if session.cursor:
+        path += f"&cursor={quote(session.cursor)}"
+    page = await session.get("works_list", path)
+    session.cursor = page.get("next_cursor")
+    if not page["items"]:
+        return
+    work = session.rng.choice(page["items"])["id"]
+    await session.get("work_detail", f"/api/works/{work}")
+    chapters = await session.get("work_chapters", f"/api/works/{work}/chapters")
+    if chapters:
+        chapter = session.rng.choice(chapters)["id"]
+        await session.get("chapter_content", f"/api/works/{work}/chapters/{chapter}/content", parse=False)
+
+
+SCENARIOS = {"shop": shop, "library": library}
+
+
+# ----- запуск -----
+
+class Pacer:
+    """
+    Общий темп запуска сценариев: не больше rate в секунду на всех пользователей.
+    """
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.next = time.monotonic()
+
+    async def wait(self):
+        now = time.monotonic()
+        slot = max(now, self.next)
+        self.next = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+def loopback_target(url: str):
+    """
+    (host, port) из --url; всё, что резолвится не в loopback, - ошибка.
+    """
+    parts = urlsplit(url)
+    if parts.scheme != "http" or not parts.hostname:
+        raise SystemExit(f"Нужен адрес вида http://127.0.0.1:8000, получено {url!r}")
+    port = parts.port or 80
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as exc:
+        raise SystemExit(f"{parts.hostname}: {exc}")
+    if not all(ipaddress.ip_address(address.split("%", 1)[0]).is_loopback for address in addresses):
+        raise SystemExit(f"{parts.hostname} - не loopback-адрес, нагрузка подаётся только на локальный сервер")
+    return parts.hostname, port
+
+
+async def run(options) -> tuple:
+    host, port = loopback_target(options.url)
+    pool = ConnectionPool(host, port, options.connections or options.concurrency)
+    scenario = SCENARIOS[options.scenario]
+    stats = Stats()
+    pacer = Pacer(options.rate) if options.rate else None
+    remaining = [options.iterations]
+    clock = {}
+    ready = asyncio.Event()
+
+    def more() -> bool:
+        if options.iterations:
+            remaining[0] -= 1
+            return remaining[0] >= 0
+        return time.monotonic() < clock["deadline"]
+
+    async def user(number: int):
+        rng = random.Random(options.seed * 100_003 + number)
+        # прогрев: свои соединения и кэши сервера, в статистику не попадает
+        warm = Session(pool, Stats(), rng, options)
+        for _ in range(options.warmup):
+            try:
+                await scenario(warm)
+            except StepFailed:
+                pass
+        # время засекаем, когда прогрелись все
+        clock["warmed"] = clock.get("warmed", 0) + 1
+        if clock["warmed"] == options.concurrency:
+            clock["started"] = time.monotonic()
+            clock["deadline"] = clock["started"] + options.duration
+            ready.set()
+        await ready.wait()
+        session = Session(pool, stats, rng, options)
+        session.cursor = warm.cursor
+        while more():
+            if pacer:
+                await pacer.wait()
+            started = time.perf_counter()
+            try:
+                await scenario(session)
+            except StepFailed:
+                stats.failed += 1
+            stats.scenarios.record((time.perf_counter() - started) * 1000)
+
+    try:
+        await asyncio.gather(*(user(n) for n in range(options.concurrency)))
+    finally:
+        pool.close()
+    return stats, time.monotonic() - clock["started"], pool.opened
+
+
+def report(options, stats: Stats, elapsed: float, opened: int):
+    print(f"{'шаг':<18}{'запросов':>10}{'ошибок':>8}{'p50 мс':>10}{'p90 мс':>10}{'p99 мс':>10}{'max мс':>10}")
+    total = 0
+    rows = list(stats.steps.items()) + [("сценарий целиком", [stats.scenarios, stats.failed])]
+    for step, (histogram, errors) in rows:
+        if histogram is not stats.scenarios:
+            total += histogram.count
+        print(f"{step:<18}{histogram.count:>10}{errors:>8}{histogram.quantile(0.5):>10.2f}"
+              f"{histogram.quantile(0.9):>10.2f}{histogram.quantile(0.99):>10.2f}{histogram.max:>10.2f}")
+    print(f"\nсценариев: {stats.scenarios.count} (с ошибкой {stats.failed}) за {elapsed:.1f} с - "
+          f"{stats.scenarios.count / elapsed:.1f}/с, запросов {total / elapsed:.1f}/с, "
+          f"соединений открыто: {opened}")
+    if options.histogram:
+        for step, (histogram, _) in rows:
+            print(f"\n{step}:")
+            print("\n".join(histogram.render()))
+    if stats.error_samples:
+        print("\nпервые ошибки:")
+        print("\n".join(f"  {sample}" for sample in stats.error_samples))
+    if options.json:
+        summary = {
+            "scenario": options.scenario, "concurrency": options.concurrency, "rate": options.rate,
+            "elapsed": elapsed, "scenarios": stats.scenarios.count, "failed": stats.failed,
+            "connections_opened": opened,
+            "steps": {
+                step: {"count": h.count, "errors": errors, "mean": h.total / h.count if h.count else 0.0,
+                       "p50": h.quantile(0.5), "p90": h.quantile(0.9), "p99": h.quantile(0.99), "max": h.max}
+                for step, (h, errors) in rows
+            },
+        }
+        with open(options.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный клиент: сценарии поверх keep-alive HTTP/1.1")
+    parser.add_argument("scenario", choices=sorted(SCENARIOS))
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--connections", type=int, default=0)
+    parser.add_argument("--rate", type=float, default=0, help="сценариев в секунду на всех, 0 - без ограничения")
+    parser.add_argument("--duration", type=float, default=10, help="секунд, если не задан --iterations")
+    parser.add_argument("--iterations", type=int, default=0, help="сколько сценариев выполнить всего")
+    parser.add_argument("--warmup", type=int, default=1, help="сценариев прогрева на пользователя")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--username", default=DEFAULT_USERNAME)
+    parser.add_argument("--password", default=DEFAULT_PASSWORD)
+    parser.add_argument("--histogram", action="store_true", help="вывести гистограммы задержек")
+    parser.add_argument("--json", help="записать сводку в файл")
+    options = parser.parse_args(argv)
+    if options.concurrency < 1 or options.connections < 0 or options.rate < 0:
+        parser.error("--concurrency >= 1, --connections и --rate не отрицательные")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    stats, elapsed, opened = asyncio.run(run(options))
+    report(options, stats, elapsed, opened)
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+
+async def acache(backend, method: str, *args, **kwargs):
+    """
+    backend.<method>(...) из async-кода. Асинхронные методы кэшей Django - это sync_to_async над
+    синхронными, т.е. переход в поток на каждый вызов; LocMemCache живёт в памяти процесса и не
+    блокирует, поэтому его зовём напрямую.
+    """
+    if isinstance(backend, LocMemCache):
+        return getattr(backend, method)(*args, **kwargs)
+    return await getattr(backend, "a" + method)(*args, **kwargs)
+
+
+class LRUCache:
+    """
+    Простой потокобезопасный LRU-кэш на OrderedDict с ограничением по числу ключей.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TTLCache(LRUCache):
+    """
+    LRU, у которого каждая запись ещё и устаревает через ttl секунд.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= time.monotonic():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            super().set(key, (time.monotonic() + ttl, value))
+
+
+# ----- Публичный каталог (категории, товары) -----
+CATALOGUE_VERSION_KEY = "catalogue-version"
+
+
+def _catalogue_backend():
+    # Версия лежит в том же бэкенде, что и ответы, которые она сбрасывает: с LocMem у каждого
+    # процесса свои ответы и своя версия, в соседних старое живёт не дольше PUBLIC_CACHE_TIMEOUT
+    return caches[getattr(settings, "PUBLIC_CACHE_ALIAS", "default")]
+
+
+def catalogue_version() -> int:
+    backend = _catalogue_backend()
+    version = backend.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        backend.add(CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = backend.get(CATALOGUE_VERSION_KEY, 1)
+    return version
+
+
+async def acatalogue_version() -> int:
+    backend = _catalogue_backend()
+    version = await acache(backend, "get", CATALOGUE_VERSION_KEY)
+    if version is None:
+        await acache(backend, "add", CATALOGUE_VERSION_KEY, 1, timeout=None)
+        version = await acache(backend, "get", CATALOGUE_VERSION_KEY, 1)
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Любое изменение товара или категории делает все закэшированные публичные ответы неактуальными:
+    ключи включают номер версии, так что старые записи просто перестают находиться.
+    Вызывать после коммита: иначе соседний запрос успеет закэшировать старые данные под новой версией.
+    """
+    backend = _catalogue_backend()
+    try:
+        backend.incr(CATALOGUE_VERSION_KEY)
+    except ValueError:
+        backend.add(CATALOGUE_VERSION_KEY, 2, timeout=None)
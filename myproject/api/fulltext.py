@@ -0,0 +1,96 @@
+import re
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Product
+
+
+TABLE = "product_fts"
+
+_TOKEN = re.compile(r"\w+\*?", re.UNICODE)
+
+
+def is_available() -> bool:
+    """
+    Индекс построен на SQLite FTS5; на других СУБД search() откатывается на icontains без ранжирования.
+    """
+    return connection.vendor == "sqlite"
+
+
+def index_product(product):
+    """
+    Добавляет (или переиндексирует) товар. rowid в FTS-таблице = Product.id.
+    """
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [product.pk])
+        cursor.execute(f"INSERT INTO {TABLE}(rowid, title, description) VALUES (%s, %s, %s)",
+                       [product.pk, product.title, product.description])
+
+
+def unindex_product(product_id: int):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [product_id])
+
+
+def build_match_query(q: str) -> str:
+    """
+    Превращает пользовательский ввод в безопасный FTS5-запрос: каждое слово в кавычках
+    (все слова обязательны), звёздочка на конце слова - поиск по префиксу.
+    """
+    terms = []
+    for token in _TOKEN.findall(q):
+        prefix = token.endswith("*")
+        word = token.rstrip("*")
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+
+def search(q: str, category: int = None, price_min=None, price_max=None, limit: int = 20, offset: int = 0) -> list:
+    """
+    id товаров по запросу q, самые релевантные первыми (совпадение в названии весит в 5 раз больше, чем
+    в описании). Фильтры по категории и цене применяются в том же запросе через JOIN с таблицей товаров.
+    """
+    if not is_available():
+        return _search_fallback(q, category, price_min, price_max, limit, offset)
+    match = build_match_query(q)
+    if not match:
+        return []
+    product_table = connection.ops.quote_name(Product._meta.db_table)
+    where, params = [f"{TABLE} MATCH %s"], [match]
+    if category is not None:
+        where.append("p.category_id = %s")
+        params.append(category)
+    if price_min is not None:
+        where.append("p.price >= %s")
+        params.append(float(price_min))
+    if price_max is not None:
+        where.append("p.price <= %s")
+        params.append(float(price_max))
+    # поиск - чтение каталога: идёт туда же, куда и Product.objects (реплика, если настроена)
+    with connections[router.db_for_read(Product)].cursor() as cursor:
+        cursor.execute(
+            f"SELECT p.id FROM {TABLE} JOIN {product_table} p ON p.id = {TABLE}.rowid "
+            f"WHERE {' AND '.join(where)} ORDER BY bm25({TABLE}, 5.0, 1.0), p.id LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _search_fallback(q, category, price_min, price_max, limit, offset) -> list:
+    qs = Product.objects.all()
+    for word in _TOKEN.findall(q):
+        word = word.rstrip("*")
+        qs = qs.filter(Q(title__icontains=word) | Q(description__icontains=word))
+    if category is not None:
+        qs = qs.filter(category_id=category)
+    if price_min is not None:
+        qs = qs.filter(price__gte=price_min)
+    if price_max is not None:
+        qs = qs.filter(price__lte=price_max)
+    return list(qs.order_by("pk").values_list("pk", flat=True)[offset:offset + limit])
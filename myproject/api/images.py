@@ -0,0 +1,166 @@
+"""
+Уменьшенные копии картинок (Product.image, Profile.avatar).
+
+Для оригинала images/tea.png рядом с ним в хранилище появляются
+derivatives/images/tea/<размер>.webp и .jpg - по одной паре на каждый размер из SIZES.
+Копии без EXIF/ICC (ориентация из EXIF применяется до удаления) и считаются в пуле потоков
+после коммита транзакции, так что сохранение модели не ждёт кодирования. Закончив, задача пишет
+имя оригинала в поле-отметку модели (Product.thumbnails_for, Profile.avatar_thumbnails_for) -
+по нему API и решает, отдавать ли копии, не спрашивая хранилище.
+"""
+import io
+import logging
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# имя -> длина большей стороны в пикселях
+SIZES = {"small": 160, "medium": 480, "large": 1024}
+FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "IMAGE_DERIVATIVE_WORKERS", 2), thread_name_prefix="image-derivatives")
+        return _executor
+
+
+def derivative_name(name: str, size: str, fmt: str) -> str:
+    stem = posixpath.splitext(name)[0]
+    return f"derivatives/{stem}/{size}{EXTENSIONS[fmt]}"
+
+
+def is_ready(file, built_for: str) -> bool:
+    # built_for - значение поля-отметки: для какого оригинала копии уже построены
+    return bool(file) and built_for == file.name
+
+
+def derivative_urls(file, built_for: str, build_url=lambda url: url):
+    """
+    {размер: {формат: URL}} или None, если картинки нет или копии ещё не готовы
+    (тогда клиенту остаётся оригинал).
+    """
+    if not is_ready(file, built_for):
+        return None
+    return {
+        size: {fmt: build_url(file.storage.url(derivative_name(file.name, size, fmt))) for fmt in FORMATS}
+        for size in SIZES
+    }
+
+
+def _encode(image: Image.Image, fmt: str) -> bytes:
+    pil_format, options = FORMATS[fmt]
+    if fmt == "jpeg" and image.mode != "RGB":
+        # у JPEG нет прозрачности - кладём на белый фон
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A") if "A" in image.getbands() else None)
+        image = background
+    buffer = io.BytesIO()
+    # info (EXIF, ICC, комментарии) не передаём - метаданные в копии не попадают
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_derivatives(storage, name: str) -> bool:
+    try:
+        with storage.open(name, "rb") as f:
+            original = Image.open(f)
+            original = ImageOps.exif_transpose(original)
+            original = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+    except (OSError, UnidentifiedImageError, ValueError):
+        logger.warning("cannot build derivatives for %s", name, exc_info=True)
+        return False
+    for size, side in sorted(SIZES.items(), key=lambda item: item[1]):
+        image = original.copy()
+        image.thumbnail((side, side), Image.Resampling.LANCZOS)
+        for fmt in FORMATS:
+            target = derivative_name(name, size, fmt)
+            if storage.exists(target):
+                storage.delete(target)
+            storage.save(target, ContentFile(_encode(image, fmt)))
+    return True
+
+
+def delete_derivatives(storage, name: str):
+    for size in SIZES:
+        for fmt in FORMATS:
+            storage.delete(derivative_name(name, size, fmt))
+
+
+def remember_previous(instance, field: str, using: str, update_fields=None):
+    """
+    pre_save: запоминает прежнее имя файла instance.<field>, чтобы drop_replaced() убрал его копии.
+    """
+    if instance.pk is None or (update_fields is not None and field not in update_fields):
+        return
+    previous = type(instance)._default_manager.using(using).filter(pk=instance.pk).values_list(field, flat=True).first()
+    setattr(instance, f"_previous_{field}", previous)
+
+
+def drop_replaced(instance, field: str):
+    """
+    post_save: если файл заменили, после коммита удаляет копии прежнего - когда на него больше никто не ссылается.
+    """
+    previous = instance.__dict__.pop(f"_previous_{field}", None)
+    current = getattr(instance, field)
+    if not previous or previous == current.name:
+        return
+    model, storage = type(instance), current.storage
+
+    def run():
+        if not model._default_manager.filter(**{field: previous}).exists():
+            delete_derivatives(storage, previous)
+
+    transaction.on_commit(run)
+
+
+def schedule(instance, field: str, marker: str, on_ready=None):
+    """
+    Ставит построение копий instance.<field> в очередь после коммита (если они ещё не построены).
+    Готовые копии отмечаются записью имени оригинала в instance.<marker>, после чего зовётся on_ready().
+    IMAGE_DERIVATIVES_ASYNC = False - строить сразу, в текущем потоке (тесты, management-команды).
+    """
+    file = getattr(instance, field)
+    if not file or is_ready(file, getattr(instance, marker)):
+        return
+    model, pk, storage, name = type(instance), instance.pk, file.storage, file.name
+
+    def build():
+        if not generate_derivatives(storage, name):
+            return
+        # пока считали, картинку могли заменить - тогда отметка останется за новой
+        if model._default_manager.filter(pk=pk, **{field: name}).update(**{marker: name}) and on_ready:
+            on_ready()
+
+    def build_in_worker():
+        try:
+            build()
+        except Exception:
+            logger.exception("cannot build derivatives for %s", name)
+        finally:
+            connections.close_all()
+
+    def run():
+        if getattr(settings, "IMAGE_DERIVATIVES_ASYNC", True):
+            _get_executor().submit(build_in_worker)
+        else:
+            build()
+
+    transaction.on_commit(run)
@@ -0,0 +1,66 @@
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогоняет сценарии горячих маршрутов (api/benchmark.py) и сравнивает с базовым прогоном. "
+        "Данные - из seed_bench; при регрессии завершается с ошибкой"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mode", choices=sorted(benchmark.RUNNERS), default="client",
+                            help="client - django.test.Client в этом процессе, http - uvicorn на 127.0.0.1")
+        parser.add_argument("--requests", type=int, default=200, help="замеряемых запросов на сценарий")
+        parser.add_argument("--warmup", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--only", nargs="+", metavar="SCENARIO")
+        parser.add_argument("--baseline", default=None, help="по умолчанию benchmarks/baseline.json")
+        parser.add_argument("--save-baseline", action="store_true", help="записать результат как новый базовый")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="допустимый рост p50/p99 (0.25 = 25%%)")
+
+    def handle(self, *args, mode, requests, warmup, seed, only, baseline, save_baseline, tolerance, **options):
+        scenarios = benchmark.build_scenarios()
+        if only:
+            unknown = set(only) - {s.name for s in scenarios}
+            if unknown:
+                raise CommandError(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+            scenarios = [s for s in scenarios if s.name in only]
+
+        self.stdout.write(f"{'сценарий':<18} {'p50 мс':>9} {'p99 мс':>9} {'SQL/запр':>9} {'RSS МБ':>8} {'ошибок':>7}")
+
+        def progress(name, result):
+            queries = result["queries_per_request"]
+            self.stdout.write(
+                f"{name:<18} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} "
+                f"{'-' if queries is None else f'{queries:.2f}':>9} {result['peak_rss_mb']:>8.1f} {result['errors']:>7}"
+            )
+
+        dataset = benchmark.dataset_summary()
+        results = benchmark.run(scenarios, mode, requests=requests, warmup=warmup, seed=seed, progress=progress)
+        path = baseline or benchmark.default_baseline_path()
+
+        if save_baseline:
+            benchmark.save_baseline(path, results, {
+                "mode": mode, "requests": requests, "seed": seed, "dataset": dataset,
+                "python": platform.python_version(), "machine": platform.machine(),
+            })
+            self.stdout.write(self.style.SUCCESS(f"Базовый прогон записан в {path}"))
+            return
+
+        stored = benchmark.load_baseline(path)
+        if stored is None:
+            self.stdout.write(self.style.WARNING(f"Базового прогона нет ({path}) - сравнивать не с чем"))
+            return
+        meta = stored.get("meta", {})
+        if meta.get("mode") != mode:
+            self.stdout.write(self.style.WARNING(f"Базовый прогон снят в режиме {meta.get('mode')!r}"))
+        if meta.get("dataset") != dataset:
+            self.stdout.write(self.style.WARNING(f"Базовый прогон снят на других данных: {meta.get('dataset')}"))
+        problems = benchmark.compare(results, stored, tolerance=tolerance)
+        if problems:
+            raise CommandError("Регрессии относительно базового прогона:\n  " + "\n  ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Регрессий относительно базового прогона нет"))
@@ -0,0 +1,160 @@
+import random
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api import fulltext
+from api.benchmark import BENCH_PASSWORD, BENCH_USERNAME, SEARCH_WORDS
+from api.cache import bump_catalogue_version
+from api.models import Category, Product, Wishlist, WishlistProduct, Order, OrderProduct, Profile, Role
+
+BATCH = 5000
+ADJECTIVES = ("зелёный", "чёрный", "белый", "красный", "жёлтый", "молочный", "дымный", "цветочный")
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД синтетическим каталогом для команды bench: товары, пользователи с избранным, заказы. "
+        "Запускать на отдельной БД: SQLITE_PATH=/tmp/bench.sqlite3 python manage.py migrate && ... seed_bench"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--categories", type=int, default=50)
+        parser.add_argument("--products", type=int, default=100_000)
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument("--wishlist-lines", type=int, default=1_000_000)
+        parser.add_argument("--orders", type=int, default=50_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--force", action="store_true", help="разрешить запись в основную db.sqlite3 проекта")
+
+    def handle(self, *args, categories, products, users, wishlist_lines, orders, seed, force, **options):
+        name = settings.DATABASES["default"]["NAME"]
+        if not force and Path(str(name)) == Path(settings.BASE_DIR) / "db.sqlite3":
+            raise CommandError("Это основная БД проекта - укажите отдельную через SQLITE_PATH или добавьте --force")
+        if Product.objects.filter(slug__startswith="bench-").exists():
+            raise CommandError("Данные бенчмарка уже загружены - начните с чистой БД")
+        if wishlist_lines > users * products:
+            raise CommandError("--wishlist-lines больше, чем пар пользователь-товар")
+        rng = random.Random(seed)
+
+        category_ids = self.seed_categories(categories)
+        product_ids = self.seed_products(rng, products, category_ids)
+        user_ids = self.seed_users(users)
+        self.seed_wishlists(rng, user_ids, product_ids, wishlist_lines)
+        self.seed_orders(rng, user_ids, product_ids, orders)
+        self.seed_bench_user()
+        if fulltext.is_available():
+            # bulk_create не шлёт сигналов - индекс поиска заполняем одним запросом
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {fulltext.TABLE}(rowid, title, description) "
+                    f"SELECT id, title, description FROM api_product WHERE slug LIKE %s",
+                    ["bench-%"],
+                )
+        bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Категорий: {categories}, товаров: {products}, пользователей: {users}, "
+            f"строк избранного: {wishlist_lines}, заказов: {orders}"
+        ))
+
+    @transaction.atomic
+    def seed_categories(self, count: int) -> list:
+        Category.objects.bulk_create(
+            [Category(title=f"Категория {i}", slug=f"bench-category-{i}") for i in range(count)], batch_size=BATCH)
+        return list(Category.objects.filter(slug__startswith="bench-category-").values_list("pk", flat=True))
+
+    def seed_products(self, rng, count: int, category_ids) -> list:
+        for start in range(0, count, BATCH):
+            with transaction.atomic():
+                Product.objects.bulk_create([
+                    Product(
+                        title=f"{rng.choice(SEARCH_WORDS).capitalize()} {rng.choice(ADJECTIVES)} №{i}",
+                        slug=f"bench-{i}",
+                        category_id=rng.choice(category_ids),
+                        price=Decimal(rng.randint(100, 500_000)) / 100,
+                        description=" ".join(rng.choice(SEARCH_WORDS + ADJECTIVES) for _ in range(12)),
+                        image="",
+                    )
+                    for i in range(start, min(start + BATCH, count))
+                ])
+            self.stdout.write(f"товары: {min(start + BATCH, count)}/{count}")
+        return list(Product.objects.filter(slug__startswith="bench-").order_by("pk").values_list("pk", flat=True))
+
+    def seed_users(self, count: int) -> list:
+        User = get_user_model()
+        # один хэш на всех: make_password на каждого занял бы минуты
+        password = make_password(None)
+        for start in range(0, count, BATCH):
+            with transaction.atomic():
+                created = User.objects.bulk_create([
+                    User(username=f"bench-user-{i}", email=f"bench-user-{i}@example.com", password=password)
+                    for i in range(start, min(start + BATCH, count))
+                ])
+                Profile.objects.bulk_create([Profile(user=user) for user in created])
+        return list(User.objects.filter(username__startswith="bench-user-").order_by("pk").values_list("pk", flat=True))
+
+    def seed_wishlists(self, rng, user_ids, product_ids, lines: int):
+        with transaction.atomic():
+            Wishlist.objects.bulk_create([Wishlist(user_id=user_id) for user_id in user_ids], batch_size=BATCH)
+        wishlist_ids = list(Wishlist.objects.filter(user__username__startswith="bench-user-")
+                            .order_by("pk").values_list("pk", flat=True))
+        per_list, extra = divmod(lines, len(wishlist_ids)) if wishlist_ids else (0, 0)
+        rows, done = [], 0
+        for index, wishlist_id in enumerate(wishlist_ids):
+            size = per_list + (index < extra)
+            rows += [
+                WishlistProduct(wishlist_id=wishlist_id, product_id=product_id, count=rng.randint(1, 3))
+                for product_id in rng.sample(product_ids, size)
+            ]
+            if len(rows) >= BATCH * 4:
+                done += self._flush(WishlistProduct, rows)
+                rows = []
+                self.stdout.write(f"избранное: {done}/{lines}")
+        done += self._flush(WishlistProduct, rows)
+
+    def seed_orders(self, rng, user_ids, product_ids, count: int):
+        prices = dict(Product.objects.filter(slug__startswith="bench-").values_list("pk", "price"))
+        statuses = list(Order.STATUS)
+        # открытый заказ у пользователя один (unique_open_order) - повторные "new" считаем оплаченными
+        open_orders = set(Order.objects.filter(status="new").values_list("user_id", flat=True))
+        for start in range(0, count, BATCH):
+            with transaction.atomic():
+                chunk = []
+                for _ in range(start, min(start + BATCH, count)):
+                    user_id, status = rng.choice(user_ids), rng.choice(statuses)
+                    if status == "new" and user_id in open_orders:
+                        status = "paid"
+                    elif status == "new":
+                        open_orders.add(user_id)
+                    chunk.append((Order(user_id=user_id, status=status), rng.sample(product_ids, rng.randint(1, 5))))
+                lines = []
+                for order, items in chunk:
+                    order.total = 0
+                    for product_id in items:
+                        line = OrderProduct(product_id=product_id, price=prices[product_id], count=rng.randint(1, 3))
+                        order.total += line.price * line.count
+                        lines.append((order, line))
+                Order.objects.bulk_create([order for order, _ in chunk])
+                for order, line in lines:
+                    line.order_id = order.pk
+                OrderProduct.objects.bulk_create([line for _, line in lines])
+            self.stdout.write(f"заказы: {min(start + BATCH, count)}/{count}")
+
+    def seed_bench_user(self):
+        User = get_user_model()
+        user = User.objects.filter(username=BENCH_USERNAME).first()
+        if user is None:
+            user = User.objects.create_user(username=BENCH_USERNAME, email="bench@example.com", password=BENCH_PASSWORD)
+        manager, _ = Role.objects.get_or_create(name="manager")
+        user.roles.add(manager)
+
+    @staticmethod
+    def _flush(model, rows) -> int:
+        with transaction.atomic():
+            model.objects.bulk_create(rows)
+        return len(rows)
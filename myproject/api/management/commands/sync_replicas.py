@@ -0,0 +1,49 @@
+"""
+Одинакова в myproject и starrylibrarry, см. myproject/api/tests/test_shared_modules.py.
+"""
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную SQLite-БД в файлы реплик (REPLICA_DATABASES) через backup API - "
+        "замена настоящей репликации для локальной проверки чтения с реплик"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0,
+                            help="повторять каждые N секунд (0 - один раз)")
+
+    def handle(self, interval=0, **options):
+        replicas = list(getattr(settings, "REPLICA_DATABASES", ()))
+        if not replicas:
+            raise CommandError("Реплики не настроены (переменная окружения DB_REPLICAS)")
+        if connections[DEFAULT_DB_ALIAS].vendor != "sqlite":
+            raise CommandError("Команда только для SQLite; для PostgreSQL используйте потоковую репликацию")
+        while True:
+            started = time.monotonic()
+            self.sync(replicas)
+            self.stdout.write(self.style.SUCCESS(
+                f"Реплик обновлено: {len(replicas)} за {(time.monotonic() - started) * 1000:.0f} мс"
+            ))
+            if not interval:
+                return
+            time.sleep(interval)
+
+    def sync(self, replicas):
+        source = sqlite3.connect(settings.DATABASES[DEFAULT_DB_ALIAS]["NAME"])
+        try:
+            for alias in replicas:
+                target = sqlite3.connect(settings.DATABASES[alias]["NAME"])
+                try:
+                    # backup копирует согласованный снимок постранично, не блокируя запись в основную БД надолго
+                    source.backup(target, pages=1024)
+                finally:
+                    target.close()
+        finally:
+            source.close()
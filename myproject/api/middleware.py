@@ -0,0 +1,163 @@
+import asyncio
+import hashlib
+import threading
+import time
+import weakref
+from urllib.parse import urlencode
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .cache import acache, acatalogue_version, catalogue_version
+
+
+# Замки на ключ внутри процесса: пока один поток считает ответ, остальные с тем же ключом ждут его,
+# а не идут в БД. Словарь слабый - замок исчезает, когда его больше никто не держит.
+_key_locks = weakref.WeakValueDictionary()
+_key_locks_guard = threading.Lock()
+
+
+def _key_lock(key: str, factory=threading.Lock):
+    with _key_locks_guard:
+        lock = _key_locks.get((factory, key))
+        if lock is None:
+            lock = _key_locks[(factory, key)] = factory()
+        return lock
+
+
+class PublicResponseCacheMiddleware:
+    """
+    Кэш готовых ответов публичного каталога (PUBLIC_CACHE_PATHS) для анонимных GET-запросов.
+
+    Ключ - хост + путь + отсортированная строка запроса + версия каталога; версию поднимают сигналы
+    Product/Category, так что после изменения старые ответы просто перестают находиться.
+    Промах считается один раз: внутри процесса - под замком на ключ, между процессами - под
+    cache.add()-замком; остальные ждут готовый ответ до PUBLIC_CACHE_LOCK_TIMEOUT секунд.
+    Под ASGI работает асинхронно (asyncio.Lock вместо threading.Lock), чтобы async-эндпоинты
+    каталога не переводились Django обратно в синхронный режим.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.paths = tuple(getattr(settings, "PUBLIC_CACHE_PATHS", ()))
+        self.timeout = getattr(settings, "PUBLIC_CACHE_TIMEOUT", 60)
+        self.lock_timeout = getattr(settings, "PUBLIC_CACHE_LOCK_TIMEOUT", 5)
+        self.cache = caches[getattr(settings, "PUBLIC_CACHE_ALIAS", "default")]
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._cacheable(request):
+            return self.get_response(request)
+
+        key = self._key(request, catalogue_version())
+        hit = self.cache.get(key)
+        if hit is not None:
+            return self._replay(hit, "HIT")
+
+        with _key_lock(key):
+            hit = self.cache.get(key)
+            if hit is not None:
+                return self._replay(hit, "HIT")
+            lock_key = f"{key}:lock"
+            acquired = self.cache.add(lock_key, 1, timeout=self.lock_timeout)
+            if not acquired:
+                # ответ уже считает другой процесс; не дождались - считаем сами, но его замок не трогаем
+                hit = self._wait(key)
+                if hit is not None:
+                    return self._replay(hit, "HIT")
+            try:
+                response = self.get_response(request)
+                if self._storable(response):
+                    self.cache.set(key, (response.status_code, response.content, response["Content-Type"]),
+                                   timeout=self.timeout)
+            finally:
+                if acquired:
+                    self.cache.delete(lock_key)
+        response["X-Cache"] = "MISS"
+        return response
+
+    async def __acall__(self, request):
+        if not self._cacheable(request):
+            return await self.get_response(request)
+
+        key = self._key(request, await acatalogue_version())
+        hit = await acache(self.cache, "get", key)
+        if hit is not None:
+            return self._replay(hit, "HIT")
+
+        async with _key_lock(key, asyncio.Lock):
+            hit = await acache(self.cache, "get", key)
+            if hit is not None:
+                return self._replay(hit, "HIT")
+            lock_key = f"{key}:lock"
+            acquired = await acache(self.cache, "add", lock_key, 1, timeout=self.lock_timeout)
+            if not acquired:
+                hit = await self._await(key)
+                if hit is not None:
+                    return self._replay(hit, "HIT")
+            try:
+                response = await self.get_response(request)
+                if self._storable(response):
+                    await acache(self.cache, "set", key,
+                                 (response.status_code, response.content, response["Content-Type"]),
+                                 timeout=self.timeout)
+            finally:
+                if acquired:
+                    await acache(self.cache, "delete", lock_key)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def _cacheable(self, request) -> bool:
+        if request.method != "GET" or not self.paths or not request.path.startswith(self.paths):
+            return False
+        # ответы авторизованным не кэшируем и не отдаём из кэша
+        return "HTTP_AUTHORIZATION" not in request.META and "access_token" not in request.COOKIES
+
+    @staticmethod
+    def _key(request, version: int) -> str:
+        query = urlencode(sorted(request.GET.lists()), doseq=True)
+        # хост - часть ключа: в ответах абсолютные URL картинок
+        raw = f"{request.get_host()}{request.path}?{query}".encode()
+        return f"public-response:{version}:{hashlib.md5(raw).hexdigest()}"
+
+    async def _await(self, key: str):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            hit = await acache(self.cache, "get", key)
+            if hit is not None:
+                return hit
+        return None
+
+    @staticmethod
+    def _storable(response) -> bool:
+        return (
+            response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and "private" not in response.get("Cache-Control", "")
+        )
+
+    def _wait(self, key: str):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            hit = self.cache.get(key)
+            if hit is not None:
+                return hit
+        return None
+
+    @staticmethod
+    def _replay(hit, state: str) -> HttpResponse:
+        status, content, content_type = hit
+        response = HttpResponse(content, status=status, content_type=content_type)
+        response["X-Cache"] = state
+        return response
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:27
+
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    # Старый add_to_wishlist мог создать несколько строк на один товар - сливаем их в самую раннюю
+    WishlistProduct = apps.get_model('api', 'WishlistProduct')
+    seen = {}
+    for row in WishlistProduct.objects.order_by('pk'):
+        key = (row.wishlist_id, row.product_id)
+        if key in seen:
+            keep = seen[key]
+            keep.count += row.count
+            keep.save(update_fields=['count'])
+            row.delete()
+        else:
+            seen[key] = row
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='wishlistproduct',
+            constraint=models.UniqueConstraint(fields=('wishlist', 'product'), name='unique_wishlist_product'),
+        ),
+    ]
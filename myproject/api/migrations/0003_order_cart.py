@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:28
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def merge_lines_and_recount(apps, schema_editor):
+    # Сливаем повторные строки одного товара в заказе и пересчитываем total по снимкам цен:
+    # дальше он будет только сдвигаться на дельты (services.add_to_cart)
+    Order = apps.get_model('api', 'Order')
+    OrderProduct = apps.get_model('api', 'OrderProduct')
+    seen = {}
+    for row in OrderProduct.objects.order_by('pk'):
+        key = (row.order_id, row.product_id)
+        if key in seen:
+            keep = seen[key]
+            keep.count += row.count
+            keep.save(update_fields=['count'])
+            row.delete()
+        else:
+            seen[key] = row
+    for order in Order.objects.all():
+        order.total = OrderProduct.objects.filter(order=order).aggregate(
+            total=Sum(F('price') * F('count')))['total'] or 0
+        order.save(update_fields=['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_wishlistproduct_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(merge_lines_and_recount, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderproduct',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_order_product'),
+        ),
+    ]
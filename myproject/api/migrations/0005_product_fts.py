@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts "
+        "USING fts5(title, description, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    # дальше индекс поддерживают сигналы Product (signals.py)
+    schema_editor.execute(
+        "INSERT INTO product_fts(rowid, title, description) SELECT id, title, description FROM api_product"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_order_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
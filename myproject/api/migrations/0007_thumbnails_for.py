@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:38
+
+import posixpath
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def mark_existing(apps, schema_editor):
+    # копии, построенные до появления отметки, ищем в хранилище один раз - здесь, а не на каждый запрос
+    def built(name):
+        return bool(name) and default_storage.exists(f"derivatives/{posixpath.splitext(name)[0]}/large.jpg")
+
+    for model, field, marker in (("Product", "image", "thumbnails_for"), ("Profile", "avatar", "avatar_thumbnails_for")):
+        Model = apps.get_model("api", model)
+        for pk, name in Model.objects.exclude(**{field: ""}).exclude(**{f"{field}__isnull": True}).values_list("pk", field):
+            if built(name):
+                Model.objects.filter(pk=pk).update(**{marker: name})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_product_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_thumbnails_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.RunPython(mark_existing, migrations.RunPython.noop),
+    ]
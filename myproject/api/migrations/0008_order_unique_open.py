@@ -0,0 +1,43 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:40
+
+from django.db import migrations, models
+from django.db.models import F, Sum
+
+
+def merge_open_orders(apps, schema_editor):
+    # Старый lock_open_order под гонкой мог завести пользователю две корзины - сливаем в самую раннюю
+    Order = apps.get_model('api', 'Order')
+    OrderProduct = apps.get_model('api', 'OrderProduct')
+    keep = {}
+    for order in Order.objects.filter(status='new').order_by('pk'):
+        target = keep.setdefault(order.user_id, order)
+        if target is order:
+            continue
+        lines = {line.product_id: line for line in OrderProduct.objects.filter(order=target)}
+        for line in OrderProduct.objects.filter(order=order):
+            if line.product_id in lines:
+                lines[line.product_id].count += line.count
+                lines[line.product_id].save(update_fields=['count'])
+                line.delete()
+            else:
+                line.order_id = target.pk
+                line.save(update_fields=['order'])
+        order.delete()
+        target.total = OrderProduct.objects.filter(order=target).aggregate(
+            total=Sum(F('price') * F('count')))['total'] or 0
+        target.save(update_fields=['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_thumbnails_for'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_open_orders, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'new')), fields=('user',), name='unique_open_order'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import F, Sum
 from django.urls import reverse
 
 from django.conf import settings
@@ -25,6 +26,8 @@ class CustomUser(AbstractUser):
 class Profile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="profile")
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    # для какого avatar построены уменьшенные копии (api/images.py)
+    avatar_thumbnails_for = models.CharField(max_length=100, blank=True, default="", editable=False)
     description = models.TextField(blank=True)
 
     def __str__(self):
@@ -58,10 +61,18 @@ class Product(models.Model):
     price = models.DecimalField(verbose_name='Цена', max_digits=8, decimal_places=2)
     description = models.TextField(verbose_name='Описание', max_length=300)
     image = models.ImageField(verbose_name='Изображение', upload_to='images/')
+    # для какого image построены уменьшенные копии (api/images.py); пока не совпадает - их не отдаём
+    thumbnails_for = models.CharField(max_length=100, blank=True, default='', editable=False)
 
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            # products/query: фильтр по категории с сортировкой по цене и keyset по (price, id) / (title, id)
+            models.Index(fields=['category', 'price'], name='product_category_price_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+            models.Index(fields=['title', 'id'], name='product_title_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -79,6 +90,12 @@ class WishlistProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     count = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            # одна строка на товар: повторное добавление увеличивает count (см. services.upsert_counts)
+            models.UniqueConstraint(fields=['wishlist', 'product'], name='unique_wishlist_product'),
+        ]
+
 
 class Order(models.Model):
     STATUS = {
@@ -86,13 +103,36 @@ class Order(models.Model):
         'paid': 'Оплачен',
         'delivered': 'Доставлен'
     }
+    # допустимые переходы статусов: из ключа - в любой из значений
+    TRANSITIONS = {
+        'new': {'paid'},
+        'paid': {'delivered'},
+        'delivered': set(),
+    }
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date = models.DateField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS)
-    total = models.PositiveIntegerField()
+    # поддерживается инкрементально (services.add_to_cart), get_total() - полный пересчёт
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # список заказов менеджера: фильтр по статусу + keyset по (date, id)
+            models.Index(fields=['status', 'date'], name='order_status_date_idx'),
+            models.Index(fields=['user', 'status'], name='order_user_status_idx'),
+        ]
+        constraints = [
+            # открытая корзина у пользователя одна (services.lock_open_order)
+            models.UniqueConstraint(fields=['user'], condition=models.Q(status='new'), name='unique_open_order'),
+        ]
+
+    @classmethod
+    def sources_for(cls, status: str) -> list:
+        """Статусы, из которых можно перейти в status."""
+        return sorted(source for source, targets in cls.TRANSITIONS.items() if status in targets)
 
     def get_total(self):
-        return sum(item.get_cost() for item in self.items.all())
+        return self.items.aggregate(total=Sum(F('price') * F('count')))['total'] or 0
 
 
 class OrderProduct(models.Model):
@@ -101,5 +141,11 @@ class OrderProduct(models.Model):
     price = models.DecimalField(max_digits=8, decimal_places=2, default=0)
     count = models.PositiveIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_order_product'),
+        ]
+
     def get_cost(self):
-        return self.product.price * self.count
+        # цена зафиксирована в строке заказа и не зависит от последующих изменений товара
+        return self.price * self.count
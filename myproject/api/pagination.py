@@ -0,0 +1,90 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from ninja.errors import HttpError
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(value) -> str:
+    """
+    Кодирует позицию курсора (ключ последней отданной строки) в непрозрачную строку.
+    """
+    raw = json.dumps(value, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Обратная операция к encode_cursor. На мусор отвечает 400, а не 500.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+
+
+def clamp_limit(limit: int) -> int:
+    if limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def keyset_filter(ordering, values) -> Q:
+    """
+    Условие "строго после values" для сортировки ordering, например для ("-date", "-pk"):
+    date < d OR (date = d AND pk < id). Последнее поле ordering должно быть уникальным (обычно pk).
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _keyset_query(qs, cursor: str, ordering):
+    if cursor:
+        values = decode_cursor(cursor)
+        if not isinstance(values, list) or len(values) != len(ordering):
+            raise HttpError(400, "Invalid cursor")
+        try:
+            qs = qs.filter(keyset_filter(ordering, values))
+        except (ValueError, TypeError, ValidationError):
+            raise HttpError(400, "Invalid cursor")
+    return qs.order_by(*ordering)
+
+
+def _keyset_result(rows: list, limit: int, ordering):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        # строки могут быть и объектами, и словарями из .values()
+        get = last.get if isinstance(last, dict) else lambda name: getattr(last, name)
+        return rows, encode_cursor([get(field.lstrip("-")) for field in ordering])
+    return rows, None
+
+
+def keyset_page(qs, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, ordering=("pk",)):
+    """
+    Keyset-пагинация по составному ключу ordering: WHERE (ключ) после курсора ORDER BY ordering LIMIT n+1.
+    В отличие от OFFSET стоимость не растёт с номером страницы, если под ordering есть индекс.
+    Возвращает (список строк, next_cursor или None).
+    """
+    limit = clamp_limit(limit)
+    return _keyset_result(list(_keyset_query(qs, cursor, ordering)[:limit + 1]), limit, ordering)
+
+
+async def akeyset_page(qs, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE, ordering=("pk",)):
+    """
+    То же, что keyset_page, для async-эндпоинтов (асинхронный ORM).
+    """
+    limit = clamp_limit(limit)
+    return _keyset_result([row async for row in _keyset_query(qs, cursor, ordering)[:limit + 1]], limit, ordering)
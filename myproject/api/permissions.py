@@ -1,6 +1,40 @@
+from django.conf import settings
+from django.core.cache import caches
 from ninja_extra.permissions import BasePermission
 
 
+ROLE_CACHE_PREFIX = "user-roles"
+
+
+def _role_cache():
+    return caches[getattr(settings, "ROLE_CACHE_ALIAS", "default")]
+
+
+def user_role_names(user) -> frozenset:
+    """
+    Имена ролей пользователя. Порядок поиска:
+    1) уже посчитаны для этого request.user (в пределах одного запроса);
+    2) кэш ROLE_CACHE_ALIAS. Его сбрасывают сигналы m2m_changed у CustomUser.roles и сохранение/удаление
+       Role (signals.py) - в том числе при изменениях через AdminController. С общим бэкендом отзыв роли
+       виден всем процессам сразу, с LocMem соседние процессы видят его через ROLE_CACHE_TIMEOUT;
+    3) один запрос в БД.
+    """
+    names = getattr(user, "_role_names", None)
+    if names is None:
+        key = f"{ROLE_CACHE_PREFIX}:{user.pk}"
+        cache = _role_cache()
+        names = cache.get(key)
+        if names is None:
+            names = frozenset(user.roles.values_list("name", flat=True))
+            cache.set(key, names, timeout=getattr(settings, "ROLE_CACHE_TIMEOUT", 3600))
+        user._role_names = names
+    return names
+
+
+def invalidate_user_roles(*user_ids):
+    _role_cache().delete_many([f"{ROLE_CACHE_PREFIX}:{user_id}" for user_id in user_ids])
+
+
 class IsManager(BasePermission):
     message = "Manager privileges required"
 
@@ -12,7 +46,7 @@ class IsManager(BasePermission):
         if not user or not user.is_authenticated:
             return False
         # если на CustomUser.roles
-        return user.roles.filter(name='manager').exists()
+        return 'manager' in user_role_names(user)
         # если Django-группы
         # return user.groups.filter(name='Менеджер').exists()
 
@@ -28,6 +62,6 @@ class IsSuperUser(BasePermission):
         if not user or not user.is_authenticated:
             return False
         # если на CustomUser.roles
-        return user.roles.filter(name='Полные права').exists()
+        return 'Полные права' in user_role_names(user)
         # если Django-группы
         # return user.groups.filter(name='Менеджер').exists()
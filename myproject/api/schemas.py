@@ -1,8 +1,11 @@
-from typing import Optional, List
+from datetime import date
+from typing import Any, Dict, Optional, List
 
 from ninja import Schema
 from pydantic import EmailStr
 
+from . import images
+
 
 # ----- Роли -----
 class RoleIn(Schema):
@@ -59,6 +62,7 @@ class UserOut(Schema):
 class ProfileOut(Schema):
     avatar: Optional[str]       # URL до аватара
     description: Optional[str]
+    avatar_thumbnails: Optional[Dict[str, Dict[str, str]]] = None   # как ProductOut.thumbnails
 
 
 class ProfileUpdate(Schema):
@@ -108,6 +112,28 @@ class ProductOut(Schema):
     category: CategoryForProducts
     description: str
     price: float
+    image: Optional[str] = None
+    # {"small"|"medium"|"large": {"webp": URL, "jpeg": URL}}; None - копии ещё не готовы
+    thumbnails: Optional[Dict[str, Dict[str, str]]] = None
+
+    @staticmethod
+    def resolve_image(obj, context):
+        return context["request"].build_absolute_uri(obj.image.url) if obj.image else None
+
+    @staticmethod
+    def resolve_thumbnails(obj, context):
+        return images.derivative_urls(obj.image, obj.thumbnails_for, context["request"].build_absolute_uri)
+
+
+class ProductSearchOut(Schema):
+    items: List[ProductOut]
+    next_offset: Optional[int] = None
+
+
+class ProductQueryOut(Schema):
+    # набор полей в items задаётся параметром fields
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
 
 
 class ProductSchema(Schema):
@@ -131,6 +157,11 @@ class WishlistIn(Schema):
     count: int = 1
 
 
+class WishlistCountOut(Schema):
+    product: int
+    count: int
+
+
 class OrderSchema(Schema):
     id: int
     status: str
@@ -141,3 +172,56 @@ class OrderSchemaOut(Schema):
     order: OrderSchema
     product: ProductSchema
     count: int
+
+
+class OrderLineOut(Schema):
+    product: ProductSchema
+    price: float
+    count: int
+
+
+class ManagerOrderOut(Schema):
+    id: int
+    user: int
+    username: str
+    date: date
+    status: str
+    total: float
+    items: List[OrderLineOut]
+
+    @staticmethod
+    def resolve_user(obj):
+        return obj.user_id
+
+    @staticmethod
+    def resolve_username(obj):
+        return obj.user.username
+
+
+class ManagerOrderPageOut(Schema):
+    items: List[ManagerOrderOut]
+    next_cursor: Optional[str] = None
+
+
+class OrderTransitionIn(Schema):
+    ids: List[int]
+    status: str
+
+
+class OrderTransitionOut(Schema):
+    id: int
+    ok: bool
+    status: Optional[str] = None
+    error: Optional[str] = None
+
+
+class CartLineOut(Schema):
+    product: int
+    count: int
+    price: float
+
+
+class CartOut(Schema):
+    id: int
+    total: float
+    items: List[CartLineOut]
@@ -0,0 +1,256 @@
+"""
+Операции с избранным и корзиной, которые должны быть атомарными и стоить фиксированное число запросов.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from ninja.errors import HttpError
+
+from .models import Product, Wishlist, WishlistProduct, Order, OrderProduct
+
+
+def merge_deltas(items) -> dict:
+    """
+    [(product_id, count), ...] -> {product_id: суммарный count}, по возрастанию id.
+    Повторы одного товара в запросе складываются: одна строка не может попасть в ON CONFLICT дважды.
+    Порядок фиксирован, чтобы параллельные пачки брали блокировки строк в одном порядке.
+    """
+    merged = {}
+    for product_id, count in items:
+        merged[product_id] = merged.get(product_id, 0) + count
+    return dict(sorted(merged.items()))
+
+
+def get_wishlist(user) -> Wishlist:
+    wishlist = Wishlist.objects.filter(user=user).order_by("pk").first()
+    if wishlist is None:
+        wishlist = Wishlist.objects.create(user=user)
+    return wishlist
+
+
+def upsert_counts(model, owner_field: str, owner_id: int, counts: dict, copy_fields=()) -> list:
+    """
+    Прибавляет counts {product_id: count} к строкам model(owner_field, product) одним
+    INSERT ... SELECT ... ON CONFLICT DO UPDATE SET count = count + excluded.count.
+    Строки берутся из таблицы товаров, поэтому несуществующие товары просто не вставляются -
+    их отсутствие в результате и означает 404. copy_fields - поля, которые при вставке копируются
+    из товара (снимок цены), а у существующих строк не меняются.
+    Возвращает [(product_id, новый count, *copy_fields), ...].
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    owner_column = qn(model._meta.get_field(owner_field).column)
+    product_table = qn(Product._meta.db_table)
+    copied = "".join(f", {qn(name)}" for name in copy_fields)
+    cases = " ".join(["WHEN %s THEN CAST(%s AS integer)"] * len(counts))
+    placeholders = ", ".join(["%s"] * len(counts))
+    sql = (
+        f"INSERT INTO {table} ({owner_column}, product_id, count{copied}) "
+        f"SELECT %s, id, CASE id {cases} END{copied} FROM {product_table} WHERE id IN ({placeholders}) ORDER BY id "
+        f"ON CONFLICT ({owner_column}, product_id) DO UPDATE SET count = {table}.count + excluded.count "
+        f"RETURNING product_id, count{copied}"
+    )
+    params = [owner_id]
+    for product_id, count in counts.items():
+        params += [product_id, count]
+    params += list(counts)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def decrement_counts(model, owner_field: str, owner_id: int, counts: dict, copy_fields=()) -> list:
+    """
+    Уменьшает count строк на counts {product_id: сколько убрать}: строки, у которых count дошёл бы
+    до нуля, удаляются одним DELETE, остальные уменьшаются одним UPDATE. Отсутствующие товары пропускаются.
+    Возвращает [(product_id, новый count (0 - строка удалена), сколько реально убрано, *copy_fields), ...].
+    """
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    owner_column = qn(model._meta.get_field(owner_field).column)
+    copied = "".join(f", {qn(name)}" for name in copy_fields)
+    case = "CASE product_id " + " ".join(["WHEN %s THEN CAST(%s AS integer)"] * len(counts)) + " END"
+    case_params = [value for item in counts.items() for value in item]
+    where = f"{owner_column} = %s AND product_id IN ({', '.join(['%s'] * len(counts))})"
+    where_params = [owner_id, *counts]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {table} WHERE {where} AND count <= {case} RETURNING product_id, count{copied}",
+            where_params + case_params,
+        )
+        rows = [(product_id, 0, count, *rest) for product_id, count, *rest in cursor.fetchall()]
+        cursor.execute(
+            f"UPDATE {table} SET count = count - {case} WHERE {where} RETURNING product_id, count{copied}",
+            case_params + where_params,
+        )
+        rows += [(product_id, count, counts[product_id], *rest) for product_id, count, *rest in cursor.fetchall()]
+    return rows
+
+
+def _check_found(counts: dict, found):
+    missing = counts.keys() - set(found)
+    if missing:
+        # откатывает и уже вставленные строки пачки
+        raise HttpError(404, f"Product not found: {', '.join(map(str, sorted(missing)))}")
+
+
+@transaction.atomic
+def add_to_wishlist(user, items) -> dict:
+    """
+    Добавляет товары в избранное пользователя (создавая его при необходимости).
+    items - [(product_id, count), ...]; вернёт {product_id: итоговый count}.
+    """
+    counts = merge_deltas(items)
+    if not counts:
+        return {}
+    if any(count < 1 for count in counts.values()):
+        raise HttpError(400, "count must be positive")
+    wishlist = get_wishlist(user)
+    result = dict(upsert_counts(WishlistProduct, "wishlist", wishlist.pk, counts))
+    _check_found(counts, result)
+    return result
+
+
+def _split(deltas: dict):
+    additions = {product: count for product, count in deltas.items() if count > 0}
+    removals = {product: -count for product, count in deltas.items() if count < 0}
+    return additions, removals
+
+
+@transaction.atomic
+def remove_from_wishlist(user, product_id: int, count: int):
+    """
+    Убирает count штук товара из избранного. Вернёт оставшееся количество (0 - запись удалена)
+    или None, если товара в избранном не было.
+    """
+    wishlist = Wishlist.objects.filter(user=user).order_by("pk").first()
+    if wishlist is None or count < 1:
+        return None
+    rows = decrement_counts(WishlistProduct, "wishlist", wishlist.pk, {product_id: count})
+    return rows[0][1] if rows else None
+
+
+@transaction.atomic
+def apply_wishlist_deltas(user, items) -> Wishlist:
+    """
+    Пачка изменений избранного [(product_id, +/-count), ...] одной транзакцией:
+    положительные - upsert, отрицательные - уменьшение/удаление строк.
+    """
+    additions, removals = _split(merge_deltas(items))
+    wishlist = get_wishlist(user)
+    if additions:
+        rows = upsert_counts(WishlistProduct, "wishlist", wishlist.pk, additions)
+        _check_found(additions, [row[0] for row in rows])
+    if removals:
+        decrement_counts(WishlistProduct, "wishlist", wishlist.pk, removals)
+    return wishlist
+
+
+def _price(value) -> Decimal:
+    # сырой курсор SQLite отдаёт DECIMAL-колонки как float
+    return OrderProduct._meta.get_field("price").to_python(value).quantize(Decimal("0.01"))
+
+
+def lock_open_order(user) -> Order:
+    """
+    Открытый ('new') заказ пользователя, заблокированный до конца транзакции (SELECT ... FOR UPDATE),
+    чтобы параллельные добавления в корзину не перетирали друг другу total. Создаётся при отсутствии;
+    второй открытый заказ не даст создать unique_open_order.
+    """
+    order = Order.objects.select_for_update().filter(user=user, status='new').first()
+    if order is None:
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(user=user, status='new', total=0)
+        except IntegrityError:
+            # параллельный запрос создал корзину первым - берём её
+            order = Order.objects.select_for_update().get(user=user, status='new')
+    return order
+
+
+@transaction.atomic
+def add_to_cart(user, items) -> list:
+    """
+    Добавляет товары в открытый заказ. Цена строки - снимок цены товара на момент первого добавления;
+    Order.total сдвигается на price * count добавленного через F(), без пересчёта всего заказа.
+    Число запросов не зависит ни от размера заказа, ни от размера пачки.
+    Вернёт [(product_id, итоговый count, price), ...].
+    """
+    counts = merge_deltas(items)
+    if not counts:
+        return []
+    if any(count < 1 for count in counts.values()):
+        raise HttpError(400, "count must be positive")
+    order = lock_open_order(user)
+    rows = [
+        (product_id, count, _price(price))
+        for product_id, count, price in upsert_counts(OrderProduct, "order", order.pk, counts, copy_fields=("price",))
+    ]
+    _check_found(counts, [row[0] for row in rows])
+    delta = sum(price * counts[product_id] for product_id, _, price in rows)
+    Order.objects.filter(pk=order.pk).update(total=F('total') + delta)
+    return rows
+
+
+@transaction.atomic
+def apply_cart_deltas(user, items) -> Order:
+    """
+    Пачка изменений корзины [(product_id, +/-count), ...] одной транзакцией под блокировкой заказа.
+    total сдвигается ровно на стоимость того, что реально добавлено/убрано (по ценам строк).
+    """
+    additions, removals = _split(merge_deltas(items))
+    order = lock_open_order(user)
+    delta = Decimal(0)
+    if additions:
+        rows = upsert_counts(OrderProduct, "order", order.pk, additions, copy_fields=("price",))
+        _check_found(additions, [row[0] for row in rows])
+        delta += sum(_price(price) * additions[product_id] for product_id, _, price in rows)
+    if removals:
+        rows = decrement_counts(OrderProduct, "order", order.pk, removals, copy_fields=("price",))
+        delta -= sum(_price(price) * removed for _, _, removed, price in rows)
+    if delta:
+        Order.objects.filter(pk=order.pk).update(total=F('total') + delta)
+    return order
+
+
+TRANSITION_CHUNK = 900  # держимся ниже старого лимита SQLite в 999 параметров на запрос
+
+
+@transaction.atomic
+def transition_orders(ids, status: str) -> dict:
+    """
+    Переводит заказы ids в status по Order.TRANSITIONS. На каждую пачку id - один
+    UPDATE ... WHERE id IN (...) AND status IN (<допустимые исходные>) RETURNING id,
+    и одна выборка, чтобы объяснить, почему остальные не перешли.
+    Вернёт {id: (ok, текущий статус или None, ошибка или None)}.
+    """
+    if status not in Order.STATUS:
+        raise HttpError(400, "Invalid status")
+    sources = Order.sources_for(status)
+    ids = list(dict.fromkeys(ids))
+    results = {}
+    qn = connection.ops.quote_name
+    table = qn(Order._meta.db_table)
+    for start in range(0, len(ids), TRANSITION_CHUNK):
+        chunk = ids[start:start + TRANSITION_CHUNK]
+        updated = set()
+        if sources:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET status = %s "
+                    f"WHERE id IN ({', '.join(['%s'] * len(chunk))}) AND status IN ({', '.join(['%s'] * len(sources))}) "
+                    f"RETURNING id",
+                    [status, *chunk, *sources],
+                )
+                updated = {row[0] for row in cursor.fetchall()}
+        rest = [order_id for order_id in chunk if order_id not in updated]
+        current = dict(Order.objects.filter(pk__in=rest).values_list('pk', 'status')) if rest else {}
+        for order_id in chunk:
+            if order_id in updated:
+                results[order_id] = (True, status, None)
+            elif order_id not in current:
+                results[order_id] = (False, None, "Order not found")
+            else:
+                results[order_id] = (False, current[order_id], f"Invalid transition: {current[order_id]} -> {status}")
+    return results
@@ -1,7 +1,14 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
-from .models import Profile
+from .auth import invalidate_user
+from .permissions import invalidate_user_roles
+from . import fulltext, images
+from .cache import bump_catalogue_version
+from .metrics import install_query_recorder
+from .models import Profile, Role, CustomUser, Product, Category
 
 
 # Автоматически создавать Profile при регистрации
@@ -20,3 +27,110 @@ def save_user_profile(sender, instance, **kwargs):
     При каждом сохранении User сохраняем и профиль (если меняли его данные через форму).
     """
     instance.profile.save()
+
+
+# ----- Кэш пользователей для JWT-аутентификации (auth.py) -----
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def invalidate_cached_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # после clear() у роли уже не узнать, у кого она была
+        instance._cleared_user_ids = list(instance.users.values_list("pk", flat=True))
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        user_ids = [instance.pk]
+    elif action == "post_clear":
+        user_ids = getattr(instance, "_cleared_user_ids", [])
+    else:
+        user_ids = pk_set or []
+    invalidate_user_roles(*user_ids)
+
+
+@receiver(pre_delete, sender=Role)
+def remember_role_users(sender, instance, **kwargs):
+    # связи удаляются каскадом без m2m_changed - запоминаем владельцев заранее
+    instance._user_ids = list(instance.users.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_cached_users_on_role_change(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    user_ids = getattr(instance, "_user_ids", None)
+    if user_ids is None:
+        user_ids = list(instance.users.values_list("pk", flat=True))
+    invalidate_user_roles(*user_ids)
+
+
+# ----- Полнотекстовый индекс товаров (fulltext.py) -----
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        fulltext.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    fulltext.unindex_product(instance.pk)
+
+
+# ----- Кэш публичных ответов (middleware.py) -----
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_public_responses(sender, **kwargs):
+    transaction.on_commit(bump_catalogue_version)
+
+
+# ----- Уменьшенные копии картинок (images.py) -----
+@receiver(pre_save, sender=Product)
+def remember_product_image(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    if not raw:
+        images.remember_previous(instance, "image", using, update_fields)
+
+
+@receiver(pre_save, sender=Profile)
+def remember_avatar(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    if not raw:
+        images.remember_previous(instance, "avatar", using, update_fields)
+
+
+@receiver(post_save, sender=Product)
+def schedule_product_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.drop_replaced(instance, "image")
+        # готовые копии меняют ответы каталога - сбрасываем и их
+        images.schedule(instance, "image", "thumbnails_for", on_ready=bump_catalogue_version)
+
+
+@receiver(post_save, sender=Profile)
+def schedule_avatar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.drop_replaced(instance, "avatar")
+        images.schedule(instance, "avatar", "avatar_thumbnails_for")
+
+
+@receiver(post_delete, sender=Product)
+def delete_product_image_derivatives(sender, instance, **kwargs):
+    if instance.image:
+        images.delete_derivatives(instance.image.storage, instance.image.name)
+
+
+@receiver(post_delete, sender=Profile)
+def delete_avatar_derivatives(sender, instance, **kwargs):
+    if instance.avatar:
+        images.delete_derivatives(instance.avatar.storage, instance.avatar.name)
+
+
+# ----- Метрики SQL по маршрутам (metrics.py) -----
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
@@ -0,0 +1,17 @@
+import pytest
+from django.core.cache import caches
+
+from api.auth import clear_user_cache
+
+
+@pytest.fixture(autouse=True)
+def clean_caches():
+    # Кэши живут дольше транзакции теста: без сброса ответы и роли протекают между тестами
+    caches["default"].clear()
+    clear_user_cache()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    # превышение QUERY_BUDGETS в тестах - падение, а не строчка в логе
+    settings.QUERY_BUDGET_MODE = "raise"
@@ -0,0 +1,37 @@
+import pytest
+from ninja_jwt.tokens import AccessToken
+
+from api.auth import _user_cache
+from api.models import CustomUser, Role
+
+
+@pytest.fixture
+def user():
+    return CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass12345")
+
+
+@pytest.fixture
+def auth(user):
+    return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+
+@pytest.mark.django_db
+def test_repeated_requests_reuse_verified_token_and_user(client, auth, django_assert_num_queries):
+    assert client.get("/api/users/me", **auth).status_code == 200
+    # только запрос ролей самого users/me - ни SELECT пользователя, ни проверки подписи
+    with django_assert_num_queries(1):
+        assert client.get("/api/users/me", **auth).status_code == 200
+
+
+@pytest.mark.django_db
+def test_snapshot_has_no_roles_and_follows_user_changes(client, user, auth):
+    client.get("/api/users/me", **auth)
+    assert client.get("/api/manager/order", **auth).status_code == 403
+    # роли не в снимке: выдача роли видна сразу, хотя снимок пользователя остался прежним
+    user.roles.add(Role.objects.create(name="manager"))
+    assert _user_cache.get(user.pk) is not None
+    assert client.get("/api/manager/order", **auth).status_code == 200
+
+    user.is_active = False
+    user.save()
+    assert client.get("/api/users/me", **auth).status_code == 401
@@ -0,0 +1,38 @@
+from decimal import Decimal
+
+import pytest
+
+from api import benchmark
+from api.models import CustomUser, Category, Product
+
+
+def test_percentile_and_compare():
+    values = list(range(1, 101))
+    assert benchmark.percentile(values, 50) == 50
+    assert benchmark.percentile(values, 99) == 99
+    assert benchmark.percentile([], 99) == 0.0
+
+    base = {"scenarios": {"detail": {"p50_ms": 2.0, "p99_ms": 10.0, "queries_per_request": 1.0, "errors": 0}}}
+    same = {"detail": {"p50_ms": 2.4, "p99_ms": 10.9, "queries_per_request": 1.0, "errors": 0}}
+    assert benchmark.compare(same, base) == []
+    worse = {"detail": {"p50_ms": 2.2, "p99_ms": 20.0, "queries_per_request": 2.0, "errors": 0}}
+    assert benchmark.compare(worse, base) == [
+        "detail: p99_ms 10.0 -> 20.0", "detail: queries/request 1.0 -> 2.0",
+    ]
+
+
+@pytest.mark.django_db
+def test_run_in_process():
+    category = Category.objects.create(title="Чай", slug="tea")
+    for i in range(5):
+        Product.objects.create(title=f"Чай {i}", slug=f"tea-{i}", category=category, price=Decimal("1.00"),
+                               description="", image="")
+    CustomUser.objects.create_user(username=benchmark.BENCH_USERNAME, email="bench@example.com", password="x")
+
+    scenarios = [s for s in benchmark.build_scenarios() if s.name in ("product_detail", "wishlist_add")]
+    results = benchmark.run(scenarios, "client", requests=10, warmup=2)
+    assert set(results) == {"product_detail", "wishlist_add"}
+    assert results["product_detail"]["errors"] == 0
+    assert results["product_detail"]["queries_per_request"] <= 1
+    assert results["wishlist_add"]["queries_per_request"] > 0
+    assert results["wishlist_add"]["peak_rss_mb"] > 0
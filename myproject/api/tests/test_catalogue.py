@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+import pytest
+
+from api.models import Category, Product
+
+
+@pytest.fixture
+def catalogue():
+    tea = Category.objects.create(title="Чай", slug="tea")
+    coffee = Category.objects.create(title="Кофе", slug="coffee")
+    rows = [
+        ("Зелёный чай", tea, "10.00", "Листовой китайский"),
+        ("Чёрный чай", tea, "25.00", "Крепкий, к завтраку"),
+        ("Травяной сбор", tea, "15.00", "Не чай, но пьётся как чай"),
+        ("Арабика", coffee, "40.00", "Зерно, средняя обжарка"),
+        ("Робуста", coffee, "30.00", "Зерно для эспрессо"),
+    ]
+    return [
+        Product.objects.create(title=title, slug=f"p{i}", category=category, price=Decimal(price),
+                               description=description, image="images/p.jpg")
+        for i, (title, category, price, description) in enumerate(rows)
+    ]
+
+
+@pytest.mark.django_db
+def test_search_ranks_title_matches_first_and_pages(client, catalogue):
+    data = client.get("/api/products/search", {"q": "чай", "limit": 2}).json()
+    assert [p["title"] for p in data["items"]] == ["Зелёный чай", "Чёрный чай"]
+    assert data["next_offset"] == 2
+    data = client.get("/api/products/search", {"q": "чай", "limit": 2, "offset": 2}).json()
+    assert [p["title"] for p in data["items"]] == ["Травяной сбор"]
+    assert data["next_offset"] is None
+
+
+@pytest.mark.django_db
+def test_search_filters_and_follows_product_changes(client, catalogue):
+    data = client.get("/api/products/search", {"q": "зерн*", "price_max": 35}).json()
+    assert [p["title"] for p in data["items"]] == ["Робуста"]
+
+    catalogue[4].title = "Робуста молотая"
+    catalogue[4].description = "Для турки"
+    catalogue[4].save()
+    catalogue[3].delete()
+    assert client.get("/api/products/search", {"q": "зерн*"}).json()["items"] == []
+    assert [p["id"] for p in client.get("/api/products/search", {"q": "молотая"}).json()["items"]] == [catalogue[4].id]
+
+
+@pytest.mark.django_db
+def test_query_walks_multi_field_sort_with_cursor(client, catalogue, django_assert_num_queries):
+    seen, cursor = [], None
+    while True:
+        params = {"sort": "-price,title", "fields": "id,price,category", "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        with django_assert_num_queries(1):
+            page = client.get("/api/products/query", params).json()
+        seen += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert [item["price"] for item in seen] == [40.0, 30.0, 25.0, 15.0, 10.0]
+    assert seen[0] == {"id": catalogue[3].id, "price": 40.0, "category": {"title": "Кофе"}}
+
+
+@pytest.mark.django_db
+def test_query_filters_and_validation(client, catalogue):
+    tea = catalogue[0].category_id
+    page = client.get("/api/products/query", {"category": tea, "price_min": 12, "sort": "price"}).json()
+    assert [item["title"] for item in page["items"]] == ["Травяной сбор", "Чёрный чай"]
+    assert set(page["items"][0]) == {"id", "title", "slug", "category", "description", "price"}
+    assert client.get("/api/products/query", {"sort": "description"}).status_code == 400
+    assert client.get("/api/products/query", {"fields": "secret"}).status_code == 400
@@ -0,0 +1,45 @@
+import sqlite3
+from pathlib import Path
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from myproject.database import database_config
+
+
+def test_sqlite_profile_enables_wal(tmp_path, monkeypatch):
+    monkeypatch.delenv("DB_ENGINE", raising=False)
+    config = database_config(tmp_path)
+    assert config["NAME"] == tmp_path / "db.sqlite3"
+    assert config["OPTIONS"]["transaction_mode"] == "IMMEDIATE"
+    assert config["CONN_MAX_AGE"] > 0
+
+    conn = sqlite3.connect(config["NAME"], timeout=config["OPTIONS"]["timeout"])
+    for command in config["OPTIONS"]["init_command"].split(";"):
+        conn.execute(command)
+    assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    assert conn.execute("PRAGMA synchronous").fetchone() == (1,)  # NORMAL
+    conn.close()
+
+
+def test_postgres_profile_pool_and_persistent(monkeypatch):
+    monkeypatch.setenv("DB_ENGINE", "postgres")
+    monkeypatch.setenv("DB_POOL", "1")
+    monkeypatch.setenv("DB_POOL_MAX_SIZE", "20")
+    monkeypatch.delenv("DB_NAME", raising=False)
+    config = database_config(Path("/srv/myproject"))
+    assert config["ENGINE"] == "django.db.backends.postgresql"
+    assert config["NAME"] == "myproject"
+    assert config["OPTIONS"]["pool"]["max_size"] == 20
+    assert config["CONN_MAX_AGE"] == 0
+
+    monkeypatch.setenv("DB_POOL", "0")
+    config = database_config(Path("/srv/myproject"))
+    assert "pool" not in config["OPTIONS"]
+    assert config["CONN_HEALTH_CHECKS"] is True
+
+
+def test_unknown_engine(monkeypatch):
+    monkeypatch.setenv("DB_ENGINE", "oracle")
+    with pytest.raises(ImproperlyConfigured):
+        database_config(None)
@@ -0,0 +1,107 @@
+import io
+from decimal import Decimal
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+
+from api import images
+from api.cache import bump_catalogue_version
+from api.models import Category, Product
+
+
+@pytest.fixture
+def media(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    settings.MEDIA_URL = "/media/"
+    settings.IMAGE_DERIVATIVES_ASYNC = False
+    return tmp_path
+
+
+def photo(size=(2000, 1500)) -> SimpleUploadedFile:
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    Image.new("RGB", size, "teal").save(buffer, "JPEG", exif=exif, quality=95)
+    return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+
+@pytest.mark.django_db
+def test_product_image_gets_small_stripped_derivatives(client, media, django_capture_on_commit_callbacks):
+    category = Category.objects.create(title="Чай", slug="tea")
+    with django_capture_on_commit_callbacks(execute=True):
+        product = Product.objects.create(title="Чай", slug="tea", category=category, price=Decimal("1.00"),
+                                         description="", image=photo())
+
+    original_size = product.image.size
+    for size, side in images.SIZES.items():
+        for fmt in images.FORMATS:
+            name = images.derivative_name(product.image.name, size, fmt)
+            with product.image.storage.open(name, "rb") as f:
+                derived = Image.open(f)
+                assert max(derived.size) == side
+                assert not derived.getexif()
+    small = images.derivative_name(product.image.name, "small", "webp")
+    assert product.image.storage.size(small) * 10 < original_size
+
+    product.refresh_from_db()
+    assert product.thumbnails_for == product.image.name
+    data = client.get(f"/api/products/{product.id}").json()
+    assert data["image"].startswith("http://testserver/media/images/")
+    assert data["thumbnails"]["small"]["webp"].endswith("/small.webp")
+
+    product.delete()
+    assert not product.image.storage.exists(small)
+
+
+@pytest.mark.django_db
+def test_thumbnails_are_absent_until_ready(media):
+    category = Category.objects.create(title="Чай", slug="tea")
+    product = Product.objects.create(title="Чай", slug="tea", category=category, price=Decimal("1.00"),
+                                     description="", image=photo((50, 50)))
+    # транзакция теста не коммитится - фоновая задача не запускалась
+    assert images.derivative_urls(product.image, product.thumbnails_for) is None
+
+
+@pytest.mark.django_db
+def test_finished_thumbnails_reach_cached_catalogue(client, media, django_capture_on_commit_callbacks,
+                                                    django_assert_num_queries):
+    category = Category.objects.create(title="Чай", slug="tea")
+    with django_capture_on_commit_callbacks() as callbacks:
+        product = Product.objects.create(title="Чай", slug="tea", category=category, price=Decimal("1.00"),
+                                         description="", image=photo((50, 50)))
+    # сброс версии после коммита выполняем, построение копий (images.schedule) придерживаем
+    schedule = [callback for callback in callbacks if callback is not bump_catalogue_version]
+    bump_catalogue_version()
+    # копий ещё нет: в публичный кэш попадает ответ без них
+    assert client.get(f"/api/products/{product.id}").json()["thumbnails"] is None
+    assert client.get(f"/api/products/{product.id}")["X-Cache"] == "HIT"
+
+    with django_capture_on_commit_callbacks(execute=True):
+        schedule[0]()
+    with django_assert_num_queries(1):
+        fresh = client.get(f"/api/products/{product.id}")
+    assert fresh["X-Cache"] == "MISS"
+    assert fresh.json()["thumbnails"]["large"]["jpeg"].endswith("/large.jpg")
+
+
+@pytest.mark.django_db
+def test_replaced_image_loses_old_derivatives(media, django_capture_on_commit_callbacks):
+    category = Category.objects.create(title="Чай", slug="tea")
+    with django_capture_on_commit_callbacks(execute=True):
+        product = Product.objects.create(title="Чай", slug="tea", category=category, price=Decimal("1.00"),
+                                         description="", image=photo((300, 200)))
+    storage, old = product.image.storage, images.derivative_name(product.image.name, "small", "webp")
+    assert storage.exists(old)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.image = photo((200, 300))
+        product.save()
+    assert not storage.exists(old)
+    assert storage.exists(images.derivative_name(product.image.name, "small", "webp"))
+
+    # сохранение без замены картинки копии не трогает
+    with django_capture_on_commit_callbacks(execute=True):
+        product.title = "Зелёный чай"
+        product.save()
+    assert storage.exists(images.derivative_name(product.image.name, "small", "webp"))
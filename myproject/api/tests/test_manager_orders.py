@@ -0,0 +1,77 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+from ninja_jwt.tokens import AccessToken
+
+from api.models import CustomUser, Role, Category, Product, Order, OrderProduct
+
+
+@pytest.fixture
+def auth():
+    manager = CustomUser.objects.create_user(username="boss", email="boss@example.com", password="pass12345")
+    manager.roles.add(Role.objects.create(name="manager"))
+    return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(manager)}"}
+
+
+@pytest.fixture
+def orders():
+    category = Category.objects.create(title="Чай", slug="tea")
+    product = Product.objects.create(title="Чай", slug="tea", category=category, price=Decimal("10.00"),
+                                     description="", image="images/tea.jpg")
+    result = []
+    for i in range(5):
+        # открытый заказ у пользователя один - у каждого заказа свой покупатель
+        buyer = CustomUser.objects.create_user(username=f"buyer{i}", email=f"buyer{i}@example.com", password="pass12345")
+        order = Order.objects.create(user=buyer, status="paid" if i % 2 else "new", total=20)
+        OrderProduct.objects.create(order=order, product=product, price=Decimal("10.00"), count=2)
+        # два заказа в один день - курсор должен различать их по id
+        Order.objects.filter(pk=order.pk).update(date=datetime.date(2025, 1, 1 + i // 2))
+        result.append(order)
+    return result
+
+
+@pytest.mark.django_db
+def test_orders_are_paged_newest_first_with_two_queries(client, auth, orders, django_assert_num_queries):
+    client.get("/api/manager/order", **auth)  # прогреваем кэш ролей
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        # страница заказов с пользователями + строки с товарами
+        with django_assert_num_queries(2):
+            page = client.get("/api/manager/order", params, **auth).json()
+        seen += [order["id"] for order in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == [o.pk for o in reversed(orders)]
+    assert page["items"][0]["items"] == [{"product": {"title": "Чай", "price": 10.0}, "price": 10.0, "count": 2}]
+
+
+@pytest.mark.django_db
+def test_orders_filters_and_bad_cursor(client, auth, orders):
+    page = client.get("/api/manager/order", {"status": "paid"}, **auth).json()
+    assert [o["id"] for o in page["items"]] == [orders[3].pk, orders[1].pk]
+    page = client.get("/api/manager/order", {"status": "paid", "date_from": "2025-01-02"}, **auth).json()
+    assert [o["id"] for o in page["items"]] == [orders[3].pk]
+    assert client.get("/api/manager/order", {"cursor": "garbage"}, **auth).status_code == 400
+
+
+@pytest.mark.django_db
+def test_bulk_transitions_follow_state_machine(client, auth, orders, django_assert_max_num_queries):
+    ids = [o.pk for o in orders] + [999]
+    client.get("/api/manager/order", **auth)  # прогреваем кэш ролей
+    with django_assert_max_num_queries(4):
+        response = client.post("/api/manager/order/status", {"ids": ids, "status": "delivered"},
+                               content_type="application/json", **auth)
+    results = {r["id"]: r for r in response.json()}
+    assert [results[o.pk]["ok"] for o in orders] == [False, True, False, True, False]
+    assert results[orders[0].pk]["error"] == "Invalid transition: new -> delivered"
+    assert results[999] == {"id": 999, "ok": False, "status": None, "error": "Order not found"}
+    assert set(Order.objects.filter(status="delivered").values_list("pk", flat=True)) == {orders[1].pk, orders[3].pk}
+
+    url = f"/api/manager/order/{orders[1].pk}/status?status=paid"
+    assert client.put(url, **auth).status_code == 409
+    assert client.put("/api/manager/order/999/status?status=paid", **auth).status_code == 404
+    assert client.put(f"/api/manager/order/{orders[0].pk}/status?status=paid", **auth).status_code == 200
@@ -0,0 +1,54 @@
+import pytest
+from django.http import Http404
+from django.test import RequestFactory
+
+from api.metrics import QueryBudgetExceeded, metrics_urlpatterns, metrics_view, registry
+from api.models import Category
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    registry.clear()
+
+
+@pytest.mark.django_db
+def test_metrics_exposes_route_counters(client, settings):
+    Category.objects.create(title="Чай", slug="tea")
+    assert client.get("/api/categories").status_code == 200
+
+    stats = registry.snapshot()[("GET api/categories", 200)]
+    # async-маршрут: запрос к БД выполнен в потоке sync_to_async, но учтён
+    assert (stats.count, stats.queries) == (1, 1)
+    assert stats.response_bytes > 0 and stats.serialize_seconds > 0
+
+    settings.METRICS_TOKEN = "s3cret"
+    body = metrics_view(RequestFactory().get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")).content.decode()
+    assert 'api_db_queries_total{route="GET api/categories",status="200"} 1' in body
+    assert 'api_request_duration_seconds_count{route="GET api/categories",status="200"} 1' in body
+    # сам /metrics в метрики не попадает
+    assert "metrics" not in "".join(route for route, _ in registry.snapshot())
+
+
+def test_metrics_need_token(client, settings):
+    # без METRICS_TOKEN маршрута нет вовсе
+    assert metrics_urlpatterns() == []
+    assert client.get("/metrics").status_code == 404
+
+    settings.METRICS_TOKEN = "s3cret"
+    assert len(metrics_urlpatterns()) == 1
+    # адрес не в счёт: за локальным nginx он всегда 127.0.0.1
+    for headers in ({}, {"HTTP_AUTHORIZATION": "Bearer wrong"}):
+        with pytest.raises(Http404):
+            metrics_view(RequestFactory().get("/metrics", REMOTE_ADDR="127.0.0.1", **headers))
+
+
+@pytest.mark.django_db
+def test_query_budget(client, settings, caplog):
+    settings.QUERY_BUDGETS = {"GET api/categories": 0}
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/api/categories")
+
+    settings.QUERY_BUDGET_MODE = "log"
+    assert client.get("/api/categories?page=2").status_code == 200
+    assert "GET api/categories: 1 SQL queries, budget 0" in caplog.text
+    assert registry.snapshot()[("GET api/categories", 200)].over_budget == 2
@@ -0,0 +1,55 @@
+import pytest
+from ninja_jwt.tokens import AccessToken
+
+from api.models import CustomUser, Role
+
+
+@pytest.fixture
+def manager():
+    user = CustomUser.objects.create_user(username="boss", email="boss@example.com", password="pass12345")
+    user.roles.add(Role.objects.create(name="manager"))
+    return user
+
+
+@pytest.mark.django_db
+def test_manager_check_needs_no_role_query(client, manager, django_assert_num_queries):
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(manager)}"}
+    assert client.get("/api/manager/order", **auth).status_code == 200
+    # остаётся только выборка заказов
+    with django_assert_num_queries(1):
+        assert client.get("/api/manager/order", **auth).status_code == 200
+
+
+@pytest.mark.django_db
+def test_role_removal_and_rename_revoke_access(client, manager):
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(manager)}"}
+    assert client.get("/api/manager/order", **auth).status_code == 200
+
+    role = Role.objects.get(name="manager")
+    role.name = "ex-manager"
+    role.save()
+    assert client.get("/api/manager/order", **auth).status_code == 403
+
+    role.name = "manager"
+    role.save()
+    assert client.get("/api/manager/order", **auth).status_code == 200
+    role.users.clear()
+    assert client.get("/api/manager/order", **auth).status_code == 403
+
+
+@pytest.mark.django_db
+def test_role_revoked_through_admin_controller(client, manager):
+    admin = CustomUser.objects.create_user(username="admin", email="admin@example.com", password="pass12345",
+                                           is_staff=True)
+    admin_auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(admin)}"}
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(manager)}"}
+    role = Role.objects.get(name="manager")
+    assert client.get("/api/manager/order", **auth).status_code == 200
+
+    assert client.delete(f"/api/admin/users/{manager.pk}/roles/{role.pk}", **admin_auth).status_code == 204
+    assert client.get("/api/manager/order", **auth).status_code == 403
+
+    response = client.post(f"/api/admin/users/{manager.pk}/roles", {"roles": [role.pk]},
+                           content_type="application/json", **admin_auth)
+    assert response.status_code == 200
+    assert client.get("/api/manager/order", **auth).status_code == 200
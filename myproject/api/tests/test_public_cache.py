@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import HttpResponse
+from django.test import RequestFactory
+from ninja_jwt.tokens import AccessToken
+
+from api.cache import catalogue_version
+from api.middleware import PublicResponseCacheMiddleware
+from api.models import Category, Product, CustomUser
+
+
+@pytest.fixture
+def category():
+    return Category.objects.create(title="Чай", slug="tea")
+
+
+@pytest.mark.django_db
+def test_anonymous_responses_are_cached_until_catalogue_changes(client, category, django_assert_num_queries,
+                                                                django_capture_on_commit_callbacks):
+    first = client.get("/api/categories", {"b": 1, "a": 2})
+    assert first["X-Cache"] == "MISS"
+    with django_assert_num_queries(0):
+        second = client.get("/api/categories?a=2&b=1")
+    assert second["X-Cache"] == "HIT" and second.content == first.content
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        Product.objects.create(title="Чай", slug="tea-1", category=category, price=Decimal("1.00"),
+                               description="", image="images/p.jpg")
+        category.title = "Чаи"
+        category.save()
+    # до коммита версия прежняя - старый ответ ещё отдаётся
+    assert client.get("/api/categories", {"a": 2, "b": 1})["X-Cache"] == "HIT"
+    for callback in callbacks:
+        callback()
+    third = client.get("/api/categories", {"a": 2, "b": 1})
+    assert third["X-Cache"] == "MISS" and third.json()[0]["title"] == "Чаи"
+
+
+@pytest.mark.django_db
+def test_authorized_and_failed_requests_bypass_cache(client, category):
+    user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass12345")
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+    assert "X-Cache" not in client.get("/api/categories", **auth)
+    assert client.get("/api/products/9999")["X-Cache"] == "MISS"
+    assert client.get("/api/products/9999")["X-Cache"] == "MISS"
+
+
+def test_concurrent_misses_compute_once(settings):
+    settings.PUBLIC_CACHE_PATHS = ("/api/products",)
+    calls = []
+
+    def view(request):
+        calls.append(1)
+        time.sleep(0.2)
+        return HttpResponse(b"[]", content_type="application/json")
+
+    middleware = PublicResponseCacheMiddleware(view)
+    request = RequestFactory().get("/api/products")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(middleware(request)["X-Cache"])) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == ["HIT"] * 7 + ["MISS"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_stack_serves_cached_catalogue(async_client, category):
+    async def fetch():
+        return [await async_client.get("/api/products/query", {"fields": "id"}) for _ in range(2)]
+
+    first, second = async_to_sync(fetch)()
+    assert first.status_code == 200
+    assert (first["X-Cache"], second["X-Cache"]) == ("MISS", "HIT")
+
+
+def test_concurrent_async_misses_compute_once(settings):
+    settings.PUBLIC_CACHE_PATHS = ("/api/products",)
+    calls = []
+
+    async def view(request):
+        calls.append(1)
+        await asyncio.sleep(0.2)
+        return HttpResponse(b"[]", content_type="application/json")
+
+    middleware = PublicResponseCacheMiddleware(view)
+    request = RequestFactory().get("/api/products")
+
+    async def burst():
+        return await asyncio.gather(*(middleware(request) for _ in range(8)))
+
+    results = async_to_sync(burst)()
+    assert len(calls) == 1
+    assert sorted(r["X-Cache"] for r in results) == ["HIT"] * 7 + ["MISS"]
+
+
+@pytest.mark.parametrize("is_async", [False, True])
+def test_timed_out_waiter_keeps_foreign_lock(settings, is_async):
+    settings.PUBLIC_CACHE_PATHS = ("/api/products",)
+    settings.PUBLIC_CACHE_LOCK_TIMEOUT = 0.2
+
+    def view(request):
+        return HttpResponse(b"[]", content_type="application/json")
+
+    async def aview(request):
+        return view(request)
+
+    middleware = PublicResponseCacheMiddleware(aview if is_async else view)
+    request = RequestFactory().get("/api/products")
+    lock_key = f"{middleware._key(request, catalogue_version())}:lock"
+    # замок держит другой процесс, который считает слишком долго
+    middleware.cache.add(lock_key, 1, timeout=30)
+
+    response = async_to_sync(middleware)(request) if is_async else middleware(request)
+    assert response["X-Cache"] == "MISS"
+    assert middleware.cache.get(lock_key) == 1
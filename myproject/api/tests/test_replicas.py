@@ -0,0 +1,73 @@
+import time
+
+import pytest
+from django.http import HttpResponse
+from ninja_jwt.tokens import AccessToken
+
+from api import replicas
+from api.models import CustomUser, Category, Order, Product
+
+
+@pytest.fixture
+def fresh_state():
+    replicas._state.set(None)
+    yield
+    replicas._state.set(None)
+
+
+def test_router_sends_catalogue_reads_to_replica(settings, fresh_state):
+    settings.REPLICA_DATABASES = ["replica1"]
+    router = replicas.ReplicaRouter()
+    assert router.db_for_read(Product) == "replica1"
+    assert router.db_for_read(Category) == "replica1"
+    # заказы не в REPLICA_READ_MODELS - всегда основная БД
+    assert router.db_for_read(Order) is None
+
+    with replicas.use_primary():
+        assert router.db_for_read(Product) is None
+    assert router.db_for_read(Product) == "replica1"
+
+    # после записи чтения прилипают к основной БД
+    assert router.db_for_write(Product) == "default"
+    assert router.db_for_read(Product) is None
+
+
+def test_router_without_replicas(settings, fresh_state):
+    settings.REPLICA_DATABASES = []
+    assert replicas.ReplicaRouter().db_for_read(Product) is None
+
+
+@pytest.mark.django_db
+def test_write_sets_pin_cookie(client, settings):
+    # "реплика" указывает на ту же тестовую БД - проверяем только куку
+    settings.REPLICA_DATABASES = ["default"]
+    user = CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass12345")
+    auth = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+    category = Category.objects.create(title="Чай", slug="tea")
+    product = Product.objects.create(title="Чай", slug="tea-1", category=category, price=1, description="")
+
+    assert "db_pin" not in client.get("/api/categories").cookies
+    response = client.post("/api/users/me/wishlist", {"product": product.id}, content_type="application/json", **auth)
+    assert response.status_code == 200
+    assert float(response.cookies["db_pin"].value) > time.time()
+    response = client.post("/api/users/me/wishlist", {"product": 999}, content_type="application/json", **auth)
+    assert "db_pin" not in response.cookies
+
+
+def test_pin_cookie_pins_request(rf, settings):
+    settings.REPLICA_DATABASES = ["replica1"]
+    seen = []
+
+    def view(request):
+        seen.append(replicas.ReplicaRouter().db_for_read(Product))
+        return HttpResponse()
+
+    middleware = replicas.ReplicaPinMiddleware(view)
+    middleware(rf.get("/api/products"))
+    request = rf.get("/api/products")
+    request.COOKIES["db_pin"] = str(time.time() + 5)
+    middleware(request)
+    request = rf.get("/api/products")
+    request.COOKIES["db_pin"] = str(time.time() - 1)
+    middleware(request)
+    assert seen == ["replica1", None, "replica1"]
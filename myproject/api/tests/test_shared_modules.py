@@ -0,0 +1,26 @@
+"""
+myproject и starrylibrarry - отдельные Django-проекты без общего пакета: каждый разворачивается
+и запускается из своего каталога (manage.py, asgi/wsgi). Инфраструктурные модули, которым
+незачем отличаться, поэтому скопированы в оба проекта намеренно - а этот тест следит,
+чтобы копии не разошлись. Правка одной копии без другой его уронит.
+"""
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[3]
+
+# путь в myproject -> путь в starrylibrarry
+SHARED_MODULES = {
+    "myproject/api/replicas.py": "starrylibrarry/api/replicas.py",
+    "myproject/api/metrics.py": "starrylibrarry/api/metrics.py",
+    "myproject/api/management/commands/sync_replicas.py": "starrylibrarry/api/management/commands/sync_replicas.py",
+    "myproject/myproject/database.py": "starrylibrarry/starrylibrarry/database.py",
+}
+
+
+@pytest.mark.parametrize("ours, theirs", SHARED_MODULES.items())
+def test_shared_module_copies_match(ours, theirs):
+    if not (ROOT / theirs).exists():
+        pytest.skip("starrylibrarry рядом нет")
+    assert (ROOT / ours).read_bytes() == (ROOT / theirs).read_bytes(), f"{ours} и {theirs} разошлись"
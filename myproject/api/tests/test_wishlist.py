@@ -0,0 +1,107 @@
+from decimal import Decimal
+
+import pytest
+from django.db import IntegrityError, transaction
+from ninja_jwt.tokens import AccessToken
+
+from api.models import CustomUser, Category, Product, WishlistProduct, Order
+from api.services import lock_open_order
+
+
+@pytest.fixture
+def user():
+    return CustomUser.objects.create_user(username="buyer", email="buyer@example.com", password="pass12345")
+
+
+@pytest.fixture
+def auth(user):
+    return {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+
+
+@pytest.fixture
+def products():
+    category = Category.objects.create(title="Чай", slug="tea")
+    return [
+        Product.objects.create(title=f"Чай {i}", slug=f"tea-{i}", category=category, price=Decimal("10.50"),
+                               description="", image="images/tea.jpg")
+        for i in range(3)
+    ]
+
+
+@pytest.mark.django_db
+def test_add_to_wishlist_increments_single_row(client, user, auth, products):
+    url = "/api/users/me/wishlist"
+    body = {"product": products[0].id, "count": 2}
+    assert client.post(url, body, content_type="application/json", **auth).json() == "Запись была создана"
+    assert client.post(url, body, content_type="application/json", **auth).json() == "Запись была обновлена"
+    assert list(WishlistProduct.objects.values_list("product_id", "count")) == [(products[0].id, 4)]
+
+    assert client.post(url, {"product": 999}, content_type="application/json", **auth).status_code == 404
+
+
+@pytest.mark.django_db
+def test_wishlist_batch_is_all_or_nothing(client, user, auth, products, django_assert_max_num_queries):
+    url = "/api/users/me/wishlist/batch"
+    client.post("/api/users/me/wishlist", {"product": products[0].id}, content_type="application/json", **auth)
+
+    body = [{"product": p.id, "count": 1} for p in products] + [{"product": products[1].id, "count": 2}]
+    # вишлист + upsert + чтение итогового состояния + savepoint'ы - независимо от размера пачки
+    with django_assert_max_num_queries(5):
+        response = client.post(url, body, content_type="application/json", **auth)
+    assert response.status_code == 200
+    assert {r["product"]: r["count"] for r in response.json()} == {
+        products[0].id: 2, products[1].id: 3, products[2].id: 1}
+
+    response = client.post(url, [{"product": products[2].id}, {"product": 999}], content_type="application/json", **auth)
+    assert response.status_code == 404
+    assert WishlistProduct.objects.get(product=products[2]).count == 1
+
+
+@pytest.mark.django_db
+def test_cart_add_keeps_total_with_constant_queries(client, user, auth, products, django_assert_max_num_queries):
+    url = "/api/order/add"
+    for product in products:
+        client.post(url, {"product": product.id}, content_type="application/json", **auth)
+    Product.objects.filter(pk=products[0].pk).update(price=Decimal("99.00"))
+
+    # заказ FOR UPDATE + upsert + сдвиг total (+ savepoint'ы) - без обхода строк заказа
+    with django_assert_max_num_queries(5):
+        response = client.post(url, {"product": products[0].id, "count": 2}, content_type="application/json", **auth)
+    assert response.json() == "Запись была обновлена"
+
+    order = Order.objects.get(user=user, status="new")
+    # цена строки осталась снимком на момент первого добавления
+    assert order.total == order.get_total() == Decimal("52.50")
+
+
+@pytest.mark.django_db
+def test_batch_deltas_remove_and_return_state(client, user, auth, products):
+    client.post("/api/users/me/wishlist/batch", [{"product": p.id, "count": 2} for p in products],
+                content_type="application/json", **auth)
+    response = client.post("/api/users/me/wishlist/batch",
+                           [{"product": products[0].id, "count": -5}, {"product": products[1].id, "count": -1}],
+                           content_type="application/json", **auth)
+    assert response.json() == [{"product": products[1].id, "count": 1}, {"product": products[2].id, "count": 2}]
+
+    response = client.post("/api/order/batch", [{"product": p.id, "count": 3} for p in products],
+                           content_type="application/json", **auth)
+    assert response.json()["total"] == 94.5
+    response = client.post("/api/order/batch",
+                           [{"product": products[0].id, "count": -10}, {"product": products[1].id, "count": -1},
+                            {"product": products[2].id, "count": 1}],
+                           content_type="application/json", **auth)
+    data = response.json()
+    assert [(line["product"], line["count"]) for line in data["items"]] == [(products[1].id, 2), (products[2].id, 4)]
+    assert data["total"] == 63.0
+    assert Order.objects.get(pk=data["id"]).get_total() == Decimal("63.00")
+
+
+@pytest.mark.django_db
+def test_user_has_single_open_order(user):
+    first = lock_open_order(user)
+    assert lock_open_order(user).pk == first.pk
+    with pytest.raises(IntegrityError), transaction.atomic():
+        Order.objects.create(user=user, status="new", total=0)
+    # закрытых заказов может быть сколько угодно
+    Order.objects.filter(pk=first.pk).update(status="paid")
+    assert lock_open_order(user).pk != first.pk
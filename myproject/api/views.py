@@ -1,34 +1,40 @@
+from datetime import date
 from typing import List
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.hashers import make_password
-from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
+from django.shortcuts import aget_object_or_404, get_object_or_404
 
-from .auth import CookieJWTAuth
+from .auth import CookieJWTAuth, CachedJWTAuth
 from .schemas import UserOut, LoginIn, TokenPairOut, ItemIn, ItemOut, RoleIn, UserCreate, RoleOut, ProfileOut, \
     ProfileUpdate, CategoryOut, ProductOut, ProductSchema, ProductSchema2, WishlistOut, WishlistIn, OrderSchema, \
-    OrderSchemaOut, RoleAssignIn
+    OrderSchemaOut, RoleAssignIn, WishlistCountOut, CartOut, ManagerOrderPageOut, OrderTransitionIn, \
+    OrderTransitionOut, ProductSearchOut, ProductQueryOut
 
 from .models import Item, Category, Product, WishlistProduct, Wishlist, Order, OrderProduct, Role
 
 from ninja.errors import HttpError
 from ninja import Form, File, UploadedFile
 
-from ninja_extra import NinjaExtraAPI, api_controller, route, permissions
+from ninja_extra import api_controller, route, permissions
 from ninja_jwt.controller import NinjaJWTDefaultController, TokenVerificationController
-from ninja_jwt.authentication import JWTAuth
 from ninja_jwt.tokens import RefreshToken
 
 
 from ninja.responses import Response
 
+from . import fulltext, images, services
+from .metrics import InstrumentedNinjaAPI
+from .pagination import DEFAULT_PAGE_SIZE, akeyset_page, clamp_limit, keyset_page
 from .permissions import IsManager, IsSuperUser
 
 User = get_user_model()
 
-api = NinjaExtraAPI(auth=[CookieJWTAuth()])
+api = InstrumentedNinjaAPI(auth=[CookieJWTAuth()])
 api.register_controllers(NinjaJWTDefaultController)
-api.auth = [JWTAuth]
+api.auth = [CachedJWTAuth]
 
 
 # =====================
@@ -82,7 +88,7 @@ class AuthController:
 # =====================
 # AUTH END-POINTS heh ;0 --- --- --- АВТОРИЗОВАННЫЕ ЭНД-ПОИНТЫ
 # =====================
-@api_controller("/", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated])
+@api_controller("/", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated])
 class UserController:
 
     # === Профиль ===
@@ -105,7 +111,8 @@ class UserController:
         prof = request.user.profile
         return ProfileOut(
             avatar=request.build_absolute_uri(prof.avatar.url) if prof.avatar else None,
-            description=prof.description
+            description=prof.description,
+            avatar_thumbnails=images.derivative_urls(prof.avatar, prof.avatar_thumbnails_for, request.build_absolute_uri),
         )
 
     @route.put("users/me/profile", response=ProfileOut)
@@ -116,10 +123,12 @@ class UserController:
         if avatar:
             prof.avatar = avatar
 
+        # уменьшенные копии нового аватара считаются в фоне (signals.py -> images.schedule)
         prof.save()
         return ProfileOut(
             avatar=request.build_absolute_uri(prof.avatar.url) if prof.avatar else None,
-            description=prof.description
+            description=prof.description,
+            avatar_thumbnails=images.derivative_urls(prof.avatar, prof.avatar_thumbnails_for, request.build_absolute_uri),
         )
 
     # === Избранные товарЫ ===
@@ -133,114 +142,57 @@ class UserController:
     def add_to_wishlist(self, request, payload: WishlistIn):
         """
         Если избранное существует, то функция добавляет в данный вишлист новую запись или обновляет ее, изменяя количество продукта.
-        Если пользователь еще не имеет своего вишлиста, он будет автоматически создан перед добавлением/обновлением записи
+        Если пользователь еще не имеет своего вишлиста, он будет автоматически создан перед добавлением/обновлением записи.
+        Запись добавляется/увеличивается одним upsert-запросом, так что параллельные добавления не теряются.
         """
-        if not Wishlist.objects.filter(user=request.user):
-            Wishlist.objects.create(user=request.user)
-
-        products = list()
-
-        if WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user)):
-            for wishlist_products in WishlistProduct.objects.filter(
-                    wishlist=get_object_or_404(Wishlist, user=request.user)):
-                products.append(wishlist_products.product.id)
-            if payload.product in products:
-                product = WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                                         product=get_object_or_404(Product, id=payload.product))
-                total_count = payload.count + product.values_list('count')[0][0]
-                WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                               product=get_object_or_404(Product, id=payload.product)).update(
-                    count=total_count)
-
-                return "Запись была обновлена"
-            else:
-                WishlistProduct.objects.create(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                               product=get_object_or_404(Product, id=payload.product),
-                                               count=payload.count)
-                return "Запись была создана"
-        else:
-            WishlistProduct.objects.create(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                           product=get_object_or_404(Product, id=payload.product),
-                                           count=payload.count)
-            return "Запись была создана"
+        count = services.add_to_wishlist(request.user, [(payload.product, payload.count)])[payload.product]
+        return "Запись была обновлена" if count > payload.count else "Запись была создана"
+
+    @route.post('users/me/wishlist/batch', summary='Пачка изменений своего избранного',
+                response=List[WishlistCountOut])
+    def change_wishlist_batch(self, request, payload: List[WishlistIn]):
+        """
+        Список {product, count}, где count > 0 добавляет, а count < 0 убирает штуки товара
+        (строка удаляется, когда количество доходит до нуля). Всё применяется одной транзакцией;
+        если хоть одного добавляемого товара нет - не меняется ничего. Возвращает всё избранное после изменений.
+        """
+        wishlist = services.apply_wishlist_deltas(request.user, [(item.product, item.count) for item in payload])
+        return [
+            {"product": product, "count": count}
+            for product, count in WishlistProduct.objects.filter(wishlist=wishlist).order_by('product_id')
+            .values_list('product_id', 'count')
+        ]
 
     @route.post('/wishlist/delete', summary='Удалить товар из своего избранного')
     def remove_from_wishlist(self, request, payload: WishlistIn):
         """
-        Если...
-        :param request:
-        :param payload:
-        :return:
+        Уменьшает количество товара в избранном на payload.count; если не остаётся ничего - удаляет запись.
         """
-        products = list()
-
-        if WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user)):
-            for wishlist_products in WishlistProduct.objects.filter(
-                    wishlist=get_object_or_404(Wishlist, user=request.user)):
-                products.append(wishlist_products.product.id)
-            if payload.product in products:
-                product = WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                                         product=get_object_or_404(Product, id=payload.product))
-                if product.values_list('count')[0][0] > payload.count:
-                    total_count = product.values_list('count')[0][0] - payload.count
-                    WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                                   product=get_object_or_404(Product, id=payload.product)).update(
-                        count=total_count)
-                    return "Запись была обновлена"
-                else:
-                    WishlistProduct.objects.filter(wishlist=get_object_or_404(Wishlist, user=request.user),
-                                                   product=get_object_or_404(Product, id=payload.product)).delete()
-                    return "Запись была удалена"
+        left = services.remove_from_wishlist(request.user, payload.product, payload.count)
+        if left is None:
+            return None
+        return "Запись была обновлена" if left else "Запись была удалена"
 
     # === Заказы ===
-    @route.post('/order/add', summary='')
+    @route.post('/order/add', summary='Добавить товар в корзину (открытый заказ)')
     def add_to_order(self, request, payload: WishlistIn):
         """
+        Добавляет товар в заказ со статусом 'new' (создаёт его, если нет) и сдвигает total.
+        Стоимость - фиксированное число запросов, сколько бы строк ни было в заказе.
+        """
+        (_, count, _), = services.add_to_cart(request.user, [(payload.product, payload.count)])
+        return "Запись была обновлена" if count > payload.count else "Запись была создана"
 
-        :param request:
-        :param payload:
-        :return:
+    @route.post('/order/batch', summary='Пачка изменений корзины', response=CartOut)
+    def change_order_batch(self, request, payload: List[WishlistIn]):
+        """
+        Как users/me/wishlist/batch, но для открытого заказа: одна транзакция под блокировкой заказа,
+        total сдвигается на стоимость изменений. Возвращает заказ со всеми строками.
         """
-        if not Order.objects.filter(user=request.user):
-            Order.objects.create(user=request.user, status='new', total=0)
-            order = get_object_or_404(Order, user=request.user)
-        else:
-            if Order.objects.filter(user=request.user, status='new'):
-                order = Order.objects.filter(user=request.user, status='new').first()
-            else:
-                Order.objects.create(user=request.user, status='new', total=0)
-                order = Order.objects.filter(user=request.user, status='new').first()
-
-        products = list()
-
-        if OrderProduct.objects.filter(order=order):
-            for order_products in OrderProduct.objects.filter(order=order):
-                products.append(order_products.product.id)
-            if payload.product in products:
-                product = OrderProduct.objects.filter(order=order,
-                                                      product=get_object_or_404(Product, id=payload.product))
-                total_count = payload.count + product.values_list('count')[0][0]
-                OrderProduct.objects.filter(order=order,
-                                            product=get_object_or_404(Product, id=payload.product)).update(
-                    count=total_count)
-                Order.objects.filter(user=request.user, status='new').update(total=order.get_total())
-                return "Запись была обновлена"
-            else:
-                product_price = Product.objects.filter(id=payload.product).values_list('price')[0][0]
-                OrderProduct.objects.create(order=order,
-                                            product=get_object_or_404(Product, id=payload.product),
-                                            price=product_price,
-                                            count=payload.count)
-                Order.objects.filter(user=request.user, status='new').update(total=order.get_total())
-                return "Запись была создана"
-        else:
-            product_price = Product.objects.filter(id=payload.product).values_list('price')[0][0]
-            OrderProduct.objects.create(order=order,
-                                        product=get_object_or_404(Product, id=payload.product),
-                                        price=product_price,
-                                        count=payload.count)
-            Order.objects.filter(user=request.user, status='new').update(total=order.get_total())
-            return "Запись была создана"
+        order = services.apply_cart_deltas(request.user, [(item.product, item.count) for item in payload])
+        order.refresh_from_db(fields=['total'])
+        items = OrderProduct.objects.filter(order=order).order_by('product_id').values('product', 'count', 'price')
+        return {"id": order.id, "total": order.total, "items": list(items)}
 
     @route.get('/order/{order_id}', summary='', response=List[OrderSchemaOut])
     def get_order_id(self, request, order_id: int):
@@ -254,52 +206,125 @@ class UserController:
         return OrderProduct.objects.filter(order=order.id)
 
 
+# Поля products/query: имя в ответе -> колонка для .values()
+PRODUCT_FIELDS = {
+    "id": "id", "title": "title", "slug": "slug", "category": "category__title",
+    "description": "description", "price": "price",
+}
+PRODUCT_SORT_FIELDS = ("price", "title", "id")
+
+
+def _product_fields(row: dict, selected) -> dict:
+    """Строка .values() -> выбранные поля в том же виде, что и в ProductOut."""
+    item = {}
+    for name in selected:
+        value = row[PRODUCT_FIELDS[name]]
+        if name == "category":
+            value = {"title": value}
+        elif name == "price":
+            value = float(value)
+        item[name] = value
+    return item
+
+
 @api_controller("/", auth=None, permissions=[permissions.AllowAny])
 class PublicController:
+    # Горячие чтения каталога - async: под uvicorn они не держат поток из пула, пока ждут БД или клиента
 
     # === Категории ===
     @route.get('/categories', summary='Все категории...', response=List[CategoryOut])
-    def list_of_categories(self, request):
+    async def list_of_categories(self, request):
         """Просмотр списка всех категорий товаров, хранящихся в базе данных"""
-        return Category.objects.all()
+        return [category async for category in Category.objects.all()]
 
     @route.get('/categories/{category_id}', summary='Получить категорию по id', response=CategoryOut)
-    def get_category_to_id(self, request, category_id: int):
+    async def get_category_to_id(self, request, category_id: int):
         """Получение информации о конкретной категории по ее slug-полю"""
-        return get_object_or_404(Category, id=category_id)
+        return await aget_object_or_404(Category, id=category_id)
 
     @route.get('/categories/{category_slug}', summary='Получить категорию по slug', response=CategoryOut)
-    def get_category_to_slug(self, request, category_slug: str):
+    async def get_category_to_slug(self, request, category_slug: str):
         """Получение информации о конкретной категории по ее slug-полю"""
-        return get_object_or_404(Category, slug=category_slug)
+        return await aget_object_or_404(Category, slug=category_slug)
 
     # === Продукты ===
     @route.get('/categories/filter/{category_id}', summary='Выбрать все товары из определённой категории по её id', response=List[ProductOut])
-    def products_sorted_by_category(self, request, category_id: int):
+    async def products_sorted_by_category(self, request, category_id: int):
         """Получение списка товаров, принадлежащих конкретной категории"""
-        category = get_object_or_404(Category, id=category_id)
-        products = Product.objects.filter(category=category)
-        return products
+        category = await aget_object_or_404(Category, id=category_id)
+        products = Product.objects.filter(category=category).select_related('category')
+        return [product async for product in products]
 
     @route.get('/products', summary='Все товары', response=List[ProductOut])
-    def list_of_products(self, request):
+    async def list_of_products(self, request):
         """Просмотр списка всех товаров, хранящихся в базе данных"""
-        return Product.objects.all()
+        return [product async for product in Product.objects.select_related('category')]
+
+    @route.get('/products/query', summary='Товары: фильтры, сортировка, постранично', response=ProductQueryOut)
+    async def query_products(self, request, sort: str = "id", category: int = None, price_min: float = None,
+                             price_max: float = None, fields: str = None, cursor: str = None,
+                             limit: int = DEFAULT_PAGE_SIZE):
+        """
+        sort - поля через запятую из price, title, id ('-' - по убыванию), например "-price,title";
+        id добавляется в конец сам, чтобы порядок был однозначным.
+        fields - какие поля вернуть (по умолчанию все поля ProductOut).
+        Следующая страница - cursor=next_cursor с теми же sort и фильтрами.
+        """
+        ordering = []
+        for key in filter(None, (part.strip() for part in sort.split(","))):
+            if key.lstrip("-") not in PRODUCT_SORT_FIELDS:
+                raise HttpError(400, f"Unknown sort field: {key.lstrip('-')}")
+            ordering.append(key)
+        if not any(key.lstrip("-") == "id" for key in ordering):
+            ordering.append("-id" if ordering and ordering[0].startswith("-") else "id")
+
+        selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(PRODUCT_FIELDS)
+        unknown = set(selected) - PRODUCT_FIELDS.keys()
+        if unknown:
+            raise HttpError(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+        columns = {PRODUCT_FIELDS[f] for f in selected} | {key.lstrip("-") for key in ordering}
+
+        qs = Product.objects.all()
+        if category is not None:
+            qs = qs.filter(category_id=category)
+        if price_min is not None:
+            qs = qs.filter(price__gte=price_min)
+        if price_max is not None:
+            qs = qs.filter(price__lte=price_max)
+        rows, next_cursor = await akeyset_page(qs.values(*columns), cursor, limit, ordering=tuple(ordering))
+        return {"items": [_product_fields(row, selected) for row in rows], "next_cursor": next_cursor}
+
+    @route.get('/products/search', summary='Поиск товаров по названию и описанию', response=ProductSearchOut)
+    async def search_products(self, request, q: str, category: int = None, price_min: float = None,
+                              price_max: float = None, limit: int = 20, offset: int = 0):
+        """
+        Полнотекстовый поиск (FTS5) с ранжированием: совпадения в названии выше, чем в описании.
+        Слово со звёздочкой на конце ищется по префиксу. Следующая страница - offset=next_offset.
+        """
+        limit = clamp_limit(limit)
+        offset = max(offset, 0)
+        ids = await sync_to_async(fulltext.search)(q, category, price_min, price_max, limit=limit + 1, offset=offset)
+        products = await Product.objects.select_related('category').ain_bulk(ids[:limit])
+        return {
+            "items": [products[pk] for pk in ids[:limit] if pk in products],
+            "next_offset": offset + limit if len(ids) > limit else None,
+        }
 
     @route.get('/products/{product_id}', summary='Получить продукт по id', response=ProductOut)
-    def get_product(self, request, product_id: int):
+    async def get_product(self, request, product_id: int):
         """Получение информации о конкретном товаре по его id"""
-        return get_object_or_404(Product, id=product_id)
+        return await aget_object_or_404(Product.objects.select_related('category'), id=product_id)
 
     # === Сортировка ===
     @route.get('products/sorted/price_min', summary='Сортировать товары по убыванию цены', response=List[ProductSchema])
-    def sorted_by_price_min(self, request):
-        return Product.objects.order_by('-price')
+    async def sorted_by_price_min(self, request):
+        return [product async for product in Product.objects.order_by('-price')]
 
     @route.get('products/sorted/price_max', summary='Сортировать товары по возрастанию цены', response=List[ProductSchema])
-    def sorted_by_price_max(self, request):
-        return Product.objects.order_by('price')
+    async def sorted_by_price_max(self, request):
+        return [product async for product in Product.objects.order_by('price')]
 
+    # Подстрочный поиск (LIKE '%x%', без индекса) оставлен для старых клиентов, новым - products/search
     @route.get('products/search/name', summary='Найти товар по названию', response=List[ProductSchema2])
     def search_by_name(self, request, name: str):
         return Product.objects.filter(title__icontains=name)
@@ -312,23 +337,51 @@ class PublicController:
 # ============   ============   ============   ============   ============   ============   ============
 #                                           Менеджер Контроль
 # ============   ============   ============   ============   ============   ============   ============
-@api_controller("/manager", auth=[JWTAuth()], permissions=[IsManager], tags=["Manager"])
+@api_controller("/manager", auth=[CachedJWTAuth()], permissions=[IsManager], tags=["Manager"])
 class ManagerController:
 
-    @route.get('/order', summary="Все заказы для менеджера", response=List[OrderSchemaOut])
-    def list_all_orders(self, request):
-        return Order.objects.all()
+    @route.get('/order', summary="Все заказы для менеджера", response=ManagerOrderPageOut)
+    def list_all_orders(self, request, status: str = None, date_from: date = None, date_to: date = None,
+                        user_id: int = None, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+        """
+        Заказы от новых к старым, страницами по limit (keyset по (date, id) - см. next_cursor).
+        Строки заказов страницы с товарами догружаются одним запросом.
+        """
+        qs = Order.objects.select_related('user').prefetch_related(
+            Prefetch('items', queryset=OrderProduct.objects.select_related('product').order_by('pk')))
+        if status is not None:
+            qs = qs.filter(status=status)
+        if date_from is not None:
+            qs = qs.filter(date__gte=date_from)
+        if date_to is not None:
+            qs = qs.filter(date__lte=date_to)
+        if user_id is not None:
+            qs = qs.filter(user_id=user_id)
+        items, next_cursor = keyset_page(qs, cursor, limit, ordering=("-date", "-pk"))
+        return {"items": items, "next_cursor": next_cursor}
+
+    @route.post('/order/status', summary='Менеджер меняет статус пачки заказов',
+                response=List[OrderTransitionOut])
+    def update_orders_status(self, request, payload: OrderTransitionIn):
+        """
+        Переводит все заказы payload.ids в payload.status, если переход допустим (Order.TRANSITIONS).
+        Результат - по строке на каждый id: перешёл ли, текущий статус и причина отказа.
+        """
+        results = services.transition_orders(payload.ids, payload.status)
+        return [
+            {"id": order_id, "ok": ok, "status": status, "error": error}
+            for order_id, (ok, status, error) in results.items()
+        ]
 
     @route.put('/order/{order_id}/status', summary='Менеджер меняет статус заказа')
     def update_order_status(self, request, order_id: int, status: str):
-        if status in Order.STATUS:
-            Order.objects.filter(id=order_id).update(status=status)
+        ok, current, error = services.transition_orders([order_id], status)[order_id]
+        if ok:
             return 'Статус заказа был изменен'
-        else:
-            raise HttpError(400, "Invalid status")
+        raise HttpError(404 if current is None else 409, error)
 
 
-@api_controller("/items", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated], tags=["Простые тестовые айтемы"])
+@api_controller("/items", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated], tags=["Простые тестовые айтемы"])
 class ItemController:
 
     @route.get("", response=List[ItemOut])
@@ -359,7 +412,7 @@ class ItemController:
         return 204, None
 
 
-@api_controller("/admin", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated], tags=["Админские будни..."], )
+@api_controller("/admin", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated], tags=["Админские будни..."], )
 class AdminController:
         @route.get("users", response=List[UserOut])
         def list_users(self, request):
@@ -399,7 +452,7 @@ class AdminController:
             role.save()
             return role
 
-        @route.delete("roles/{role_id}", response=None, summary="Удалить роль")
+        @route.delete("roles/{role_id}", response={204: None}, summary="Удалить роль")
         def delete_role(self, request, role_id: int):
             if not request.user.is_staff:
                 raise HttpError(403, "Нет прав")
@@ -428,7 +481,7 @@ class AdminController:
             return user.roles.all()
 
         @route.delete(
-            "users/{user_id}/roles/{role_id}", response=None, summary="Убрать роль у пользователя")
+            "users/{user_id}/roles/{role_id}", response={204: None}, summary="Убрать роль у пользователя")
         def remove_user_role(self, request, user_id: int, role_id: int):
             if not request.user.is_staff:
                 raise HttpError(403, "Нет прав")
@@ -0,0 +1,119 @@
+"""
+Профили подключения к БД. Выбирается переменной окружения DB_ENGINE:
+
+sqlite (по умолчанию) - файл SQLITE_PATH (или db.sqlite3 в корне проекта) в режиме WAL:
+    читатели не блокируют писателя, synchronous=NORMAL (в WAL это безопасно при падении процесса),
+    mmap для чтения страниц без лишних копий, ожидание блокировки вместо мгновенного
+    "database is locked" и BEGIN IMMEDIATE, чтобы пишущая транзакция брала блокировку сразу,
+    а не упиралась в неё посреди работы. Соединения живут DB_CONN_MAX_AGE секунд - у каждого
+    потока своё, PRAGMA выполняются один раз на соединение.
+
+postgres - DB_NAME/DB_USER/DB_PASSWORD/DB_HOST/DB_PORT. При DB_POOL=1 соединения берутся из пула
+    psycopg 3 (нужен psycopg[pool]), иначе - постоянные соединения Django (CONN_MAX_AGE)
+    с проверкой перед повторным использованием (CONN_HEALTH_CHECKS).
+
+DB_REPLICAS - реплики только для чтения через запятую (для sqlite - пути к копиям файла,
+    для postgres - host или host:port), алиасы replica1, replica2, ... Маршрутизация - api/replicas.py.
+
+Одинаков в myproject и starrylibrarry, см. myproject/api/tests/test_shared_modules.py.
+"""
+import copy
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "")
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f"{name} must be an integer, got {value!r}")
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name, "")
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def sqlite_config(base_dir) -> dict:
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        f"PRAGMA cache_size=-{_env_int('SQLITE_CACHE_KB', 64 * 1024)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH') or base_dir / 'db.sqlite3',
+        'CONN_MAX_AGE': _env_int('DB_CONN_MAX_AGE', 600),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # timeout - сколько секунд ждать чужую блокировку записи (busy timeout)
+            'timeout': _env_int('SQLITE_BUSY_TIMEOUT', 20),
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': '; '.join(pragmas),
+        },
+    }
+
+
+def postgres_config(default_name: str) -> dict:
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', default_name),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'OPTIONS': {},
+    }
+    if _env_bool('DB_POOL'):
+        # с пулом постоянные соединения Django не используются: соединение возвращается в пул после запроса
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': _env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': _env_int('DB_POOL_MAX_SIZE', 10),
+            'timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        }
+    else:
+        config['CONN_MAX_AGE'] = _env_int('DB_CONN_MAX_AGE', 600)
+        config['CONN_HEALTH_CHECKS'] = True
+    return config
+
+
+def replica_configs(primary: dict) -> dict:
+    """
+    Алиасы реплик из DB_REPLICAS с параметрами основной БД (кроме адреса).
+    """
+    replicas = {}
+    addresses = [value.strip() for value in os.environ.get('DB_REPLICAS', '').split(',') if value.strip()]
+    for number, address in enumerate(addresses, 1):
+        config = copy.deepcopy(primary)
+        if config['ENGINE'] == 'django.db.backends.sqlite3':
+            config['NAME'] = address
+        else:
+            host, _, port = address.partition(':')
+            config['HOST'] = host
+            config['PORT'] = port or primary['PORT']
+        # в тестах реплики смотрят в тестовую основную БД, а не создают свою
+        config['TEST'] = {'MIRROR': 'default'}
+        replicas[f'replica{number}'] = config
+    return replicas
+
+
+def database_config(base_dir) -> dict:
+    """
+    Настройки DATABASES['default'] для профиля из DB_ENGINE.
+    """
+    engine = os.environ.get('DB_ENGINE', 'sqlite').lower()
+    if engine == 'sqlite':
+        return sqlite_config(base_dir)
+    if engine in ('postgres', 'postgresql'):
+        # имя БД по умолчанию - имя каталога проекта
+        return postgres_config(base_dir.name)
+    raise ImproperlyConfigured(f"Unknown DB_ENGINE {engine!r}, expected 'sqlite' or 'postgres'")
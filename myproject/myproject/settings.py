@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from .database import database_config, replica_configs
+
 NINJA_JWT = {
   "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
   "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -21,6 +24,18 @@ NINJA_JWT = {
   "AUTH_COOKIE_SAMESITE": "Lax",
 }
 
+# Кэш проверенных JWT и снимков пользователей (api/auth.py), в каждом процессе свой.
+# Сигналы сбрасывают снимок при изменении пользователя/ролей в этом процессе,
+# JWT_USER_CACHE_TTL ограничивает, насколько устаревшим он может быть в соседних.
+JWT_TOKEN_CACHE_TTL = 300
+JWT_USER_CACHE_TTL = 60
+
+# Роли пользователей для IsManager/IsSuperUser (api/permissions.py). В снимки выше не входят и
+# живут в кэше Django: с общим бэкендом (Redis/Memcached) сброс из сигналов виден всем процессам сразу.
+# С LocMem ("default") отзыв роли в соседних процессах запаздывает не больше чем на ROLE_CACHE_TIMEOUT.
+ROLE_CACHE_ALIAS = "default"
+ROLE_CACHE_TIMEOUT = 60
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +69,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,9 +77,24 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'ninja.compatibility.files.fix_request_files_middleware'
+    'ninja.compatibility.files.fix_request_files_middleware',
+    'api.replicas.ReplicaPinMiddleware',
+    'api.middleware.PublicResponseCacheMiddleware',
 ]
 
+# Кэш ответов публичного каталога для анонимов (api/middleware.py).
+# Сбрасывается после коммита сигналами Product/Category через счётчик версии в кэше PUBLIC_CACHE_ALIAS.
+# С LocMem сброс виден только своему процессу, соседние отдают старое до PUBLIC_CACHE_TIMEOUT;
+# чтобы сброс сразу видели все воркеры, это должен быть общий бэкенд (Redis/Memcached).
+PUBLIC_CACHE_ALIAS = "default"
+PUBLIC_CACHE_PATHS = ("/api/categories", "/api/products")
+PUBLIC_CACHE_TIMEOUT = 60
+PUBLIC_CACHE_LOCK_TIMEOUT = 5
+
+# Уменьшенные копии Product.image и Profile.avatar (api/images.py) считаются в пуле потоков
+IMAGE_DERIVATIVES_ASYNC = True
+IMAGE_DERIVATIVE_WORKERS = 2
+
 ROOT_URLCONF = 'myproject.urls'
 
 TEMPLATES = [
@@ -87,11 +118,41 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Профиль (SQLite в WAL или PostgreSQL с пулом) выбирается переменной DB_ENGINE, см. database.py
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
+}
+DATABASES.update(replica_configs(DATABASES['default']))
+
+# Чтение моделей REPLICA_READ_MODELS - с реплик (api/replicas.py); после записи пользователь ещё
+# REPLICA_PIN_SECONDS секунд читает с основной БД, чтобы видеть свои изменения.
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_READ_MODELS = [
+    'api.category', 'api.product',
+]
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'db_pin'
+
+# Метрики маршрутов (api/metrics.py): /metrics в формате Prometheus. Без METRICS_TOKEN не подключается,
+# с ним - только для "Authorization: Bearer <METRICS_TOKEN>" (скрейпер Prometheus: authorization.credentials).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Сколько SQL-запросов можно маршруту ("МЕТОД шаблон-URL"); превышение - в лог или исключение (в тестах).
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log')
+QUERY_BUDGETS = {
+    'GET api/categories': 2,
+    'GET api/products': 2,
+    'GET api/products/<product_id>': 2,
+    'GET api/products/query': 2,
+    'GET api/products/search': 3,
+    'GET api/manager/order': 5,
+    'POST api/users/me/wishlist': 8,
+    'POST api/users/me/wishlist/batch': 10,
+    'POST api/order/add': 10,
+    'POST api/order/batch': 12,
+    'POST api/manager/order/status': 8,
+    'PUT api/manager/order/<order_id>/status': 5,
 }
 
 
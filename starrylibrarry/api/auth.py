@@ -1,11 +1,101 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
 from django.http import HttpRequest
+from django.utils.translation import gettext_lazy as _
 from ninja_extra.security import HttpBearer
 from ninja_jwt.authentication import JWTBaseAuthentication
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.settings import api_settings
+
+from .cache import TTLCache
+
+
+# Проверенные токены: raw-токен → объект токена. Живут не дольше exp самого токена.
+_token_cache = TTLCache(
+    maxsize=getattr(settings, "JWT_TOKEN_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "JWT_TOKEN_CACHE_TTL", 300),
+)
+# Снимки пользователей: id → (значения полей CustomUser, имена ролей).
+# Сбрасываются сигналами (signals.py) при изменении пользователя и его ролей.
+_user_cache = TTLCache(
+    maxsize=getattr(settings, "JWT_USER_CACHE_SIZE", 10000),
+    ttl=getattr(settings, "JWT_USER_CACHE_TTL", 60),
+)
+
+
+def invalidate_user(user_id):
+    _user_cache.delete(user_id)
+
+
+def clear_user_cache():
+    _user_cache.clear()
+
+
+def _snapshot(user) -> tuple:
+    fields = [f.attname for f in user._meta.concrete_fields]
+    return fields, [getattr(user, f) for f in fields], frozenset(user.roles.values_list("name", flat=True))
+
+
+def _hydrate(snapshot):
+    """
+    Новый экземпляр пользователя из снимка - без запроса в БД. Экземпляр свой на каждый запрос,
+    так что изменения request.user в одном запросе не протекают в другие.
+    """
+    fields, values, role_names = snapshot
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, fields, values)
+    user._role_names = role_names
+    return user
+
+
+class CachedJWTAuthentication(JWTBaseAuthentication):
+    """
+    JWTBaseAuthentication с кэшем: подпись токена проверяется один раз за время жизни токена
+    (или JWT_TOKEN_CACHE_TTL), а пользователь берётся из снимка вместо SELECT на каждый запрос.
+    """
+
+    @classmethod
+    def get_validated_token(cls, raw_token):
+        token = _token_cache.get(raw_token)
+        if token is not None:
+            return token
+        token = super().get_validated_token(raw_token)
+        exp = token.payload.get("exp")
+        ttl = None if exp is None else min(_token_cache.ttl, exp - time.time())
+        _token_cache.set(raw_token, token, ttl)
+        return token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        snapshot = _user_cache.get(user_id)
+        if snapshot is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found")) from e
+            snapshot = _snapshot(user)
+            _user_cache.set(user_id, snapshot)
+
+        user = _hydrate(snapshot)
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"))
+        return user
+
+
+class CachedJWTAuth(CachedJWTAuthentication, HttpBearer):
+    def authenticate(self, request: HttpRequest, token: str):
+        return self.jwt_authenticate(request, token)
 
 
-class CookieJWTAuth(JWTBaseAuthentication, HttpBearer):
+class CookieJWTAuth(CachedJWTAuthentication, HttpBearer):
     def authenticate(self, request: HttpRequest, token: str = None):
         raw = request.COOKIES.get("access_token")
         if not raw:
             return None
-        return self.jwt_authenticate(request, raw)
\ No newline at end of file
+        return self.jwt_authenticate(request, raw)
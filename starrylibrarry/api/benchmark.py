@@ -0,0 +1,360 @@
+"""
+Замеры горячих маршрутов API на большом наборе данных (команды seed_bench и bench).
+
+Каждый сценарий - один маршрут с параметрами, которые выбираются случайно, но воспроизводимо (--seed).
+Запросы идут либо через django.test.Client в этом же процессе (весь стек middleware, без сети),
+либо по HTTP с keep-alive в отдельно запущенный uvicorn на 127.0.0.1. По каждому сценарию:
+p50/p99 задержки, SQL-запросов на запрос (из метрик api/metrics.py - для uvicorn с его /metrics)
+и пиковый RSS процесса, обрабатывающего запросы (пик за всё время жизни процесса, поэтому
+сценарии выполняются в фиксированном порядке).
+
+Результат сравнивается с сохранённым базовым прогоном (benchmarks/baseline.json): задержка хуже
+больше чем на tolerance и рост числа запросов считаются регрессией.
+"""
+import http.client
+import json
+import math
+import os
+import random
+import re
+import resource
+import secrets
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Max, Min
+from django.test import Client
+from django.urls import resolve
+from ninja_jwt.tokens import AccessToken
+
+from .metrics import registry
+from .pagination import encode_cursor
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    # (rng) -> путь с query string
+    path: Callable[[random.Random], str]
+    body: Optional[Callable[[random.Random], object]] = None
+    auth: bool = False
+
+    def route(self, path: str) -> str:
+        # так же, как маршрут подписан в метриках (metrics.route_label)
+        return f"{self.method} {resolve(path.split('?', 1)[0]).route}"
+
+
+def percentile(values, p: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def bench_token() -> str:
+    user = get_user_model().objects.filter(username=BENCH_USERNAME).first()
+    if user is None:
+        return ""
+    return str(AccessToken.for_user(user))
+
+
+async def _drain(chunks):
+    async for _ in chunks:
+        pass
+
+
+# ----- исполнители: отправить запрос, вернуть статус; метрики и RSS процесса-обработчика -----
+class InProcessRunner:
+    name = "client"
+
+    def __init__(self):
+        # localhost разрешён при DEBUG и пустом ALLOWED_HOSTS
+        self.client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else "localhost")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def request(self, method: str, path: str, body=None, token: str = "") -> int:
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {token}"} if token else {}
+        if body is None:
+            response = self.client.generic(method, path, **headers)
+        else:
+            response = self.client.generic(method, path, json.dumps(body), content_type="application/json", **headers)
+        if getattr(response, "streaming", False):
+            if response.is_async:
+                async_to_sync(_drain)(response.streaming_content)
+            else:
+                for _ in response.streaming_content:
+                    pass
+        return response.status_code
+
+    def route_counters(self) -> dict:
+        counters = {}
+        for (route, _status), stats in registry.snapshot().items():
+            count, queries = counters.get(route, (0, 0))
+            counters[route] = (count + stats.count, queries + stats.queries)
+        return counters
+
+    def peak_rss_mb(self) -> float:
+        # ru_maxrss в Linux - КиБ, в macOS - байты
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+_METRIC_LINE = re.compile(r'^(api_db_queries_total|api_request_duration_seconds_count)\{route="([^"]*)",[^}]*\} (\S+)$')
+
+
+class UvicornRunner:
+    """
+    Поднимает uvicorn <проект>.asgi:application на свободном порту 127.0.0.1 с текущим окружением
+    (SQLITE_PATH, DB_ENGINE и т.д.) и шлёт запросы по одному keep-alive соединению.
+    """
+    name = "http"
+
+    def __init__(self, startup_timeout: float = 30):
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.connection = None
+
+    def __enter__(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        project = settings.ROOT_URLCONF.split(".")[0]
+        # счётчики берём с /metrics сервера - он подключается только с токеном
+        self.metrics_token = secrets.token_urlsafe(16)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"{project}.asgi:application", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning", "--no-access-log"],
+            cwd=settings.BASE_DIR, env={**os.environ, "METRICS_TOKEN": self.metrics_token},
+        )
+        deadline = time.monotonic() + self.startup_timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=1).close()
+                break
+            except OSError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__()
+                    raise RuntimeError("uvicorn did not start")
+                time.sleep(0.1)
+        self.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        return self
+
+    def __exit__(self, *exc):
+        if self.connection is not None:
+            self.connection.close()
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        return False
+
+    def _send(self, method: str, path: str, body=None, token: str = ""):
+        headers = {"Host": "127.0.0.1"}
+        payload = None
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        self.connection.request(method, path, body=payload, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        return response.status, data
+
+    def request(self, method: str, path: str, body=None, token: str = "") -> int:
+        return self._send(method, path, body, token)[0]
+
+    def route_counters(self) -> dict:
+        _, data = self._send("GET", "/metrics", token=self.metrics_token)
+        values = {}
+        for line in data.decode().splitlines():
+            match = _METRIC_LINE.match(line)
+            if match:
+                name, route, value = match.groups()
+                key = (route, name)
+                values[key] = values.get(key, 0) + float(value)
+        routes = {route for route, _ in values}
+        return {
+            route: (values.get((route, "api_request_duration_seconds_count"), 0),
+                    values.get((route, "api_db_queries_total"), 0))
+            for route in routes
+        }
+
+    def peak_rss_mb(self) -> float:
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return 0.0
+
+
+RUNNERS = {"client": InProcessRunner, "http": UvicornRunner}
+
+
+def run_scenario(runner, scenario: Scenario, requests: int, warmup: int, rng: random.Random, token: str) -> dict:
+    for _ in range(warmup):
+        runner.request(scenario.method, scenario.path(rng), scenario.body(rng) if scenario.body else None,
+                       token if scenario.auth else "")
+    before = runner.route_counters()
+    latencies, errors, routes = [], 0, set()
+    for _ in range(requests):
+        path = scenario.path(rng)
+        body = scenario.body(rng) if scenario.body else None
+        routes.add(scenario.route(path))
+        started = time.perf_counter()
+        status = runner.request(scenario.method, path, body, token if scenario.auth else "")
+        latencies.append((time.perf_counter() - started) * 1000)
+        errors += status >= 400
+    after = runner.route_counters()
+    count = sum(after.get(route, (0, 0))[0] - before.get(route, (0, 0))[0] for route in routes)
+    queries = sum(after.get(route, (0, 0))[1] - before.get(route, (0, 0))[1] for route in routes)
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "queries_per_request": round(queries / count, 2) if count else None,
+        "peak_rss_mb": round(runner.peak_rss_mb(), 1),
+    }
+
+
+def run(scenarios, runner_name: str = "client", requests: int = 200, warmup: int = 20, seed: int = 0,
+        progress=None) -> dict:
+    token = bench_token()
+    rng = random.Random(seed)
+    results = {}
+    with RUNNERS[runner_name]() as runner:
+        for scenario in scenarios:
+            if scenario.auth and not token:
+                continue
+            results[scenario.name] = run_scenario(runner, scenario, requests, warmup, rng, token)
+            if progress:
+                progress(scenario.name, results[scenario.name])
+    return results
+
+
+# ----- базовый прогон -----
+def default_baseline_path() -> Path:
+    return Path(settings.BASE_DIR) / "benchmarks" / "baseline.json"
+
+
+def load_baseline(path) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results: dict, meta: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "scenarios": results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results: dict, baseline: dict, tolerance: float = 0.25, slack_ms: float = 1.0) -> list:
+    """
+    Регрессии относительно baseline: p50/p99 выросли больше чем на tolerance (и больше чем на slack_ms -
+    шум на быстрых маршрутах), запросов на запрос стало больше хотя бы на 0.5 или появились ошибки.
+    """
+    problems = []
+    for name, current in results.items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p99_ms"):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > slack_ms:
+                problems.append(f"{name}: {key} {base[key]} -> {current[key]}")
+        if current["queries_per_request"] is not None and base.get("queries_per_request") is not None \
+                and current["queries_per_request"] >= base["queries_per_request"] + 0.5:
+            problems.append(f"{name}: queries/request {base['queries_per_request']} -> {current['queries_per_request']}")
+        if current["errors"] > base.get("errors", 0):
+            problems.append(f"{name}: errors {base.get('errors', 0)} -> {current['errors']}")
+    return problems
+
+
+# ----- сценарии библиотеки -----
+SEARCH_WORDS = ("дракон", "замок", "пещера", "меч", "лес", "море", "звезда", "ведьмак", "тайна", "дорога")
+
+
+def dataset_summary() -> dict:
+    from .models import Chapter, Tag, Fandom, Work
+
+    return {
+        "works": Work.objects.count(),
+        "chapters": Chapter.objects.count(),
+        "tags": Tag.objects.count(),
+        "fandoms": Fandom.objects.count(),
+    }
+
+
+def build_scenarios() -> list:
+    from .models import Chapter, Direction, Fandom, Rating, Tag, Work
+
+    bounds = Work.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    low, high = bounds["low"] or 1, bounds["high"] or 1
+    tags = list(Tag.objects.values_list("pk", flat=True)) or [0]
+    fandoms = list(Fandom.objects.values_list("pk", flat=True)) or [0]
+    directions = list(Direction.objects.values_list("pk", flat=True)) or [0]
+    ratings = list(Rating.objects.values_list("pk", flat=True)) or [0]
+    # главы для чтения - фиксированная случайная выборка, чтобы не искать существующие на каждом запросе
+    sample_ids = random.Random(0).sample(range(low, high + 1), min(500, high - low + 1))
+    chapters = list(Chapter.objects.filter(work_id__in=sample_ids).values_list("work_id", "pk")) or [(0, 0)]
+
+    def work_id(rng):
+        return rng.randint(low, high)
+
+    def cursor_page(rng):
+        # страница из середины ленты: курсор - id, с которого продолжать
+        return "/api/works/list?" + urlencode({"limit": 50, "cursor": encode_cursor(work_id(rng))})
+
+    def chapter_content(rng):
+        work, chapter = rng.choice(chapters)
+        return f"/api/works/{work}/chapters/{chapter}/content"
+
+    return [
+        Scenario("taxonomy_tags", "GET", lambda rng: "/api/tag-categories"),
+        Scenario("works_list", "GET", cursor_page),
+        Scenario("work_detail", "GET", lambda rng: f"/api/works/{work_id(rng)}"),
+        Scenario("work_chapters", "GET", lambda rng: f"/api/works/{rng.choice(chapters)[0]}/chapters"),
+        Scenario("chapter_content", "GET", chapter_content),
+        Scenario("works_search", "GET", lambda rng: "/api/works/search?" + urlencode(
+            {"tags": rng.choice(tags), "fandoms": rng.choice(fandoms), "direction": rng.choice(directions)})),
+        Scenario("chapters_search", "GET",
+                 lambda rng: "/api/chapters/search?" + urlencode({"q": rng.choice(SEARCH_WORDS), "limit": 20})),
+        Scenario("work_create", "POST", lambda rng: "/api/content/work/create", auth=True, body=lambda rng: {
+            "name": f"Бенчмарк {rng.randint(0, 10 ** 9)}",
+            "direction_id": rng.choice(directions),
+            "rating_id": rng.choice(ratings),
+            "tag_ids": rng.sample(tags, min(3, len(tags))),
+            "fandom_ids": [rng.choice(fandoms)],
+        }),
+    ]
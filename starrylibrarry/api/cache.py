@@ -0,0 +1,189 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import get_conditional_response
+
+
+async def acache(backend, method: str, *args, **kwargs):
+    """
+    backend.<method>(...) из async-кода. Асинхронные методы кэшей Django - это sync_to_async над
+    синхронными, т.е. переход в поток на каждый вызов; LocMemCache живёт в памяти процесса и не
+    блокирует, поэтому его зовём напрямую.
+    """
+    if isinstance(backend, LocMemCache):
+        return getattr(backend, method)(*args, **kwargs)
+    return await getattr(backend, "a" + method)(*args, **kwargs)
+
+
+class LRUCache:
+    """
+    Простой потокобезопасный LRU-кэш на OrderedDict с ограничением по числу ключей.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+                return self._data[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TTLCache(LRUCache):
+    """
+    LRU, у которого каждая запись ещё и устаревает через ttl секунд.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        super().__init__(maxsize)
+        self.ttl = ttl
+
+    def get(self, key, default=None):
+        entry = super().get(key)
+        if entry is None:
+            return default
+        expires, value = entry
+        if expires <= time.monotonic():
+            self.delete(key)
+            return default
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl > 0:
+            super().set(key, (time.monotonic() + ttl, value))
+
+
+# ----- Справочники (фэндомы, теги, направленности, рейтинги) -----
+TAXONOMY_VERSION_KEY = "taxonomy-version"
+
+_taxonomy_local = TTLCache(getattr(settings, "TAXONOMY_CACHE_SIZE", 256))
+
+
+def _version_backend():
+    # Без TAXONOMY_SHARED_CACHE это "default" (LocMem), т.е. у каждого процесса своя версия:
+    # сброс виден только там, где прошло изменение, остальные ограничены TAXONOMY_LOCAL_TTL
+    return caches[getattr(settings, "TAXONOMY_SHARED_CACHE", None) or "default"]
+
+
+def _shared_backend():
+    alias = getattr(settings, "TAXONOMY_SHARED_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _local_ttl() -> float:
+    if getattr(settings, "TAXONOMY_SHARED_CACHE", None):
+        return getattr(settings, "TAXONOMY_CACHE_TIMEOUT", 24 * 3600)
+    return getattr(settings, "TAXONOMY_LOCAL_TTL", 30)
+
+
+@register(Tags.caches)
+def check_taxonomy_cache(app_configs, **kwargs):
+    """
+    TAXONOMY_SHARED_CACHE в памяти процесса ничем не лучше его отсутствия, но выглядит как общий.
+    """
+    alias = getattr(settings, "TAXONOMY_SHARED_CACHE", None)
+    if not alias:
+        return []
+    if alias not in settings.CACHES:
+        return [Error(f"TAXONOMY_SHARED_CACHE={alias!r} нет в CACHES.", id="api.E001")]
+    if isinstance(caches[alias], (LocMemCache, DummyCache)):
+        return [Error(
+            f"TAXONOMY_SHARED_CACHE={alias!r} не общий для процессов кэш.",
+            hint="Укажите Redis/Memcached/БД или уберите настройку (тогда действует TAXONOMY_LOCAL_TTL).",
+            id="api.E002",
+        )]
+    return []
+
+
+def bump_taxonomy_version():
+    """
+    Любое изменение справочника делает все закэшированные ответы неактуальными:
+    ключи включают номер версии, так что старые записи просто перестают находиться.
+    Вызывать после коммита: иначе соседний запрос успеет закэшировать старые данные под новой версией.
+    """
+    backend = _version_backend()
+    try:
+        backend.incr(TAXONOMY_VERSION_KEY)
+    except ValueError:
+        backend.add(TAXONOMY_VERSION_KEY, 2, timeout=None)
+
+
+def _taxonomy_entry(body: bytes) -> tuple:
+    return body, '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+async def ataxonomy_version() -> int:
+    backend = _version_backend()
+    version = await acache(backend, "get", TAXONOMY_VERSION_KEY)
+    if version is None:
+        await acache(backend, "add", TAXONOMY_VERSION_KEY, 1, timeout=None)
+        version = await acache(backend, "get", TAXONOMY_VERSION_KEY, 1)
+    return version
+
+
+async def acached_taxonomy(key: str, build):
+    """
+    (тело JSON, ETag) для ключа key. build() вызывается только при промахе
+    и в локальном LRU, и в общем кэше (если задан TAXONOMY_SHARED_CACHE); синхронный ORM - в потоке.
+    """
+    version = await ataxonomy_version()
+    local_key = (version, key)
+    hit = _taxonomy_local.get(local_key)
+    if hit is not None:
+        return hit
+
+    shared = _shared_backend()
+    shared_key = f"taxonomy:{version}:{key}"
+    hit = await acache(shared, "get", shared_key) if shared is not None else None
+    if hit is None:
+        hit = _taxonomy_entry((await sync_to_async(build)()).encode())
+        if shared is not None:
+            await acache(shared, "set", shared_key, hit, timeout=getattr(settings, "TAXONOMY_CACHE_TIMEOUT", 24 * 3600))
+    _taxonomy_local.set(local_key, hit, _local_ttl())
+    return hit
+
+
+def _taxonomy_http_response(request, body: bytes, etag: str) -> HttpResponse:
+    conditional = get_conditional_response(request, etag=etag)
+    if isinstance(conditional, HttpResponseNotModified):
+        response = conditional
+    else:
+        response = HttpResponse(body, content_type="application/json; charset=utf-8")
+    response["ETag"] = etag
+    # Клиент может хранить ответ, но обязан перепроверять его по ETag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+async def ataxonomy_response(request, key: str, build) -> HttpResponse:
+    return _taxonomy_http_response(request, *(await acached_taxonomy(key, build)))
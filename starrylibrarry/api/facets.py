@@ -0,0 +1,545 @@
+"""
+Фасетный индекс произведений: для каждого тега/фэндома/персонажа/направленности/рейтинга - множество
+id произведений. "Тег A И тег B И НЕ тег C" - это пара пересечений/разностей множеств в памяти, без JOIN'ов.
+
+Множества хранятся по схеме roaring: id делятся на блоки по 65536 (старшие биты - ключ блока),
+блок - либо отсортированный массив uint16 (пока в нём меньше ARRAY_MAX элементов), либо битовая
+карта на 65536 бит (int, 8 КБ). Редкий тег стоит 2 байта на произведение, а не max_id/8.
+
+Индекс живёт в памяти каждого процесса. Изменения (сигналы в signals.py) пишутся в журнал
+FacetIndexChange в БД в той же транзакции, что и сами данные: откат убирает и запись журнала.
+Перед запросом процесс доигрывает журнал с своей версии - одним SELECT'ом, обычно пустым.
+Если журнал ушёл вперёд дальше, чем хранится, или пришла команда "перестроить" - индекс строится
+заново из БД (основной, не реплики). Старые записи журнала удаляет prune_log() (команда
+prune_facet_log и автоматически раз в FACET_LOG_PRUNE_EVERY записей процесса).
+"""
+import heapq
+import json
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+from itertools import compress
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .models import Work, WorkTag, WorkFandom, WorkCharacter, FacetIndexHead, FacetIndexChange
+from .replicas import use_primary
+
+logger = logging.getLogger(__name__)
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_BYTES = (1 << CHUNK_BITS) // 8
+# с этого размера блок выгоднее держать битовой картой: 4096 * 2 байта = 8 КБ
+ARRAY_MAX = 4096
+
+
+# ----- блоки: array('H') или int -----
+_FULL = (1 << (1 << CHUNK_BITS)) - 1
+_BITS = bytes.maketrans(b"01", b"\x00\x01")
+_BITS_NOT = bytes.maketrans(b"01", b"\x01\x00")
+
+
+def _dense(lows) -> int:
+    buf = bytearray(CHUNK_BYTES)
+    for low in lows:
+        buf[low >> 3] |= 1 << (low & 7)
+    return int.from_bytes(buf, "little")
+
+
+def _table(block, invert: bool = False) -> bytes:
+    """
+    Блок как 65536 байт 0/1 (байт i - есть ли i): проверка и подсчёт элементов массива по такой
+    таблице идут целиком в C (map/compress), без цикла на Python.
+    """
+    dense = block if isinstance(block, int) else _dense(block)
+    return format(dense, "065536b")[::-1].encode().translate(_BITS_NOT if invert else _BITS)
+
+
+def _lows(block) -> array:
+    if isinstance(block, array):
+        return block
+    return array("H", compress(range(1 << CHUNK_BITS), _table(block)))
+
+
+def _block(lows) -> object:
+    """
+    Блок из отсортированных младших частей id; пустой - None.
+    """
+    if not lows:
+        return None
+    return array("H", lows) if len(lows) < ARRAY_MAX else _dense(lows)
+
+
+def _size(block) -> int:
+    return len(block) if isinstance(block, array) else block.bit_count()
+
+
+def _filter(lows: array, table: bytes) -> array:
+    return array("H", compress(lows, map(table.__getitem__, lows)))
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return a & b or None
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return _filter(a, _table(b)) or None
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    common = set(small).intersection(large)
+    return array("H", sorted(common)) if common else None
+
+
+def _and_size(a, b) -> int:
+    if isinstance(a, int) and isinstance(b, int):
+        return (a & b).bit_count()
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        return sum(map(_table(b).__getitem__, a))
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    return len(set(small).intersection(large))
+
+
+def _or(a, b):
+    if isinstance(a, array) and isinstance(b, array) and len(a) + len(b) < ARRAY_MAX:
+        return array("H", sorted(set(a).union(b)))
+    return (a if isinstance(a, int) else _dense(a)) | (b if isinstance(b, int) else _dense(b))
+
+
+def _and_not(a, b):
+    if isinstance(a, int):
+        return a & ~(b if isinstance(b, int) else _dense(b)) or None
+    if isinstance(b, int):
+        return _filter(a, _table(b, invert=True)) or None
+    drop = set(b)
+    return array("H", (low for low in a if low not in drop)) or None
+
+
+class _Probe:
+    """
+    Результат поиска, подготовленный для подсчёта пересечений со всеми ключами в counts().
+    Для каждой пары блоков - самый дешёвый способ: AND битовых карт; для массива ключа - бинарный
+    поиск своих элементов (если их намного меньше), set.intersection (цикл в C) или таблица 0/1.
+    Блок результата, заполненный больше чем наполовину, считается через дополнение: |P| - |P без R|.
+    """
+    def __init__(self, bitmap: "Bitmap"):
+        self.chunks = bitmap.chunks
+        self._prepared = {}
+
+    def _prepare(self, high: int) -> tuple:
+        mine = self.chunks[high]
+        dense = mine if isinstance(mine, int) else _dense(mine)
+        invert = isinstance(mine, int) and mine.bit_count() > CHUNK_BYTES * 4
+        if invert:
+            mine = _lows(~mine & _FULL)
+        if isinstance(mine, array):
+            prepared = (dense, invert, mine, set(mine), None)
+        else:
+            prepared = (dense, invert, None, None, _table(mine))
+        self._prepared[high] = prepared
+        return prepared
+
+    def intersection_size(self, other: "Bitmap") -> int:
+        count = 0
+        for high, block in other.chunks.items():
+            if high not in self.chunks:
+                continue
+            dense, invert, lows, lows_set, table = self._prepared.get(high) or self._prepare(high)
+            if isinstance(block, int):
+                count += (dense & block).bit_count()
+                continue
+            if table is not None:
+                found = sum(map(table.__getitem__, block))
+            elif len(lows) * 8 < len(block):
+                found = 0
+                for low in lows:
+                    i = bisect_left(block, low)
+                    found += i < len(block) and block[i] == low
+            else:
+                found = len(lows_set.intersection(block))
+            count += len(block) - found if invert else found
+        return count
+
+
+class Bitmap:
+    """
+    Множество id произведений по блокам {старшие биты id: блок}.
+    Операции &, |, - возвращают новое множество; add/discard меняют его на месте.
+    """
+    __slots__ = ("chunks", "_size")
+
+    def __init__(self, chunks: dict = None):
+        self.chunks = chunks or {}
+        self._size = None
+
+    @classmethod
+    def from_ids(cls, ids) -> "Bitmap":
+        grouped = {}
+        for work_id in sorted(set(ids)):
+            grouped.setdefault(work_id >> CHUNK_BITS, []).append(work_id & CHUNK_MASK)
+        return cls({high: _block(lows) for high, lows in grouped.items()})
+
+    def __len__(self) -> int:
+        if self._size is None:
+            self._size = sum(_size(block) for block in self.chunks.values())
+        return self._size
+
+    def __contains__(self, work_id: int) -> bool:
+        block = self.chunks.get(work_id >> CHUNK_BITS)
+        if block is None:
+            return False
+        low = work_id & CHUNK_MASK
+        if isinstance(block, int):
+            return bool(block >> low & 1)
+        i = bisect_left(block, low)
+        return i < len(block) and block[i] == low
+
+    def __and__(self, other: "Bitmap") -> "Bitmap":
+        chunks = {}
+        for high in self.chunks.keys() & other.chunks.keys():
+            block = _and(self.chunks[high], other.chunks[high])
+            if block is not None:
+                chunks[high] = block
+        return Bitmap(chunks)
+
+    def __or__(self, other: "Bitmap") -> "Bitmap":
+        chunks = dict(self.chunks)
+        for high, block in other.chunks.items():
+            chunks[high] = block if high not in chunks else _or(chunks[high], block)
+        return Bitmap(chunks)
+
+    def copy(self) -> "Bitmap":
+        # блоки не меняются на месте (операции возвращают новые), так что достаточно копии словаря
+        return Bitmap(dict(self.chunks))
+
+    def __sub__(self, other: "Bitmap") -> "Bitmap":
+        chunks = dict(self.chunks)
+        for high in self.chunks.keys() & other.chunks.keys():
+            block = _and_not(self.chunks[high], other.chunks[high])
+            if block is None:
+                del chunks[high]
+            else:
+                chunks[high] = block
+        return Bitmap(chunks)
+
+    def intersection_size(self, other: "Bitmap") -> int:
+        """
+        len(self & other) без построения пересечения.
+        """
+        return sum(_and_size(self.chunks[high], other.chunks[high]) for high in self.chunks.keys() & other.chunks.keys())
+
+    def iter_ids(self, after: int = None):
+        """
+        id по возрастанию (опционально - строго после after).
+        """
+        for high in sorted(self.chunks):
+            base = high << CHUNK_BITS
+            if after is not None and base + CHUNK_MASK <= after:
+                continue
+            start = 0 if after is None or after < base else (after & CHUNK_MASK) + 1
+            block = self.chunks[high]
+            if isinstance(block, array):
+                for low in block[bisect_left(block, start):]:
+                    yield base | low
+            else:
+                block = block >> start << start
+                while block:
+                    lowest = block & -block
+                    yield base | (lowest.bit_length() - 1)
+                    block ^= lowest
+
+    def add(self, ids):
+        for high, lows in Bitmap.from_ids(ids).chunks.items():
+            block = self.chunks.get(high)
+            self.chunks[high] = lows if block is None else _or(block, lows)
+        self._size = None
+
+    def discard(self, ids):
+        for high, lows in Bitmap.from_ids(ids).chunks.items():
+            block = self.chunks.get(high)
+            if block is None:
+                continue
+            block = _and_not(block, lows)
+            if block is None:
+                del self.chunks[high]
+            else:
+                # поредевшую битовую карту - обратно в массив (с запасом, чтобы не переключаться туда-сюда)
+                self.chunks[high] = _lows(block) if isinstance(block, int) and _size(block) < ARRAY_MAX // 2 else block
+        self._size = None
+
+
+class FacetIndex:
+    FACETS = ("tags", "fandoms", "characters", "directions", "ratings")
+
+    def __init__(self):
+        # _lock - чтение и доигрывание журнала, _build_lock - полная перестройка (одна на процесс);
+        # перестройка читает БД без _lock и подменяет индекс целиком
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._postings = None
+        self._stale = False
+        self._generation = 0
+        self._all = Bitmap()
+        self._version = 0
+        # ключи фасета по убыванию размера множества, для отсечения в counts(); None - пересчитать
+        self._order = {}
+        # .block - транзакция этого потока, записавшая в журнал и ещё не завершённая
+        self._local = threading.local()
+        self._written = 0
+
+    # --- построение ---
+    def _build(self):
+        generation = self._generation
+        with self._build_lock:
+            if generation != self._generation and not self._stale:
+                # пока ждали блокировку, индекс построил другой поток
+                return
+            self._stale = False
+            with use_primary():
+                # версию - до чтения данных: изменения, закоммиченные во время чтения, потом доиграются
+                # ещё раз, а операции журнала идемпотентны
+                version = FacetIndexHead.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+                grouped = {facet: {} for facet in self.FACETS}
+                all_ids = []
+                for work_id, direction_id, rating_id in (
+                        Work.objects.values_list("id", "direction_id", "rating_id").iterator()):
+                    all_ids.append(work_id)
+                    if direction_id is not None:
+                        grouped["directions"].setdefault(direction_id, []).append(work_id)
+                    if rating_id is not None:
+                        grouped["ratings"].setdefault(rating_id, []).append(work_id)
+                for facet, model, field in (
+                    ("tags", WorkTag, "tag_id"),
+                    ("fandoms", WorkFandom, "fandom_id"),
+                    ("characters", WorkCharacter, "character_id"),
+                ):
+                    for key, work_id in model.objects.values_list(field, "work_id").iterator():
+                        grouped[facet].setdefault(key, []).append(work_id)
+            postings = {
+                facet: {key: Bitmap.from_ids(ids) for key, ids in keys.items()}
+                for facet, keys in grouped.items()
+            }
+            with self._lock:
+                self._postings = postings
+                self._all = Bitmap.from_ids(all_ids)
+                self._version = version
+                self._order = {}
+                self._generation += 1
+
+    def warm(self):
+        """
+        Строит индекс заранее, чтобы первый поиск его не ждал.
+        """
+        try:
+            if self._postings is None:
+                self._build()
+        except Exception:
+            logger.exception("Facet index warm-up failed")
+
+    def warm_in_background(self):
+        """
+        Для asgi.py/wsgi.py: воркер принимает запросы, пока индекс строится.
+        """
+        def target():
+            self.warm()
+            # соединения у потоков свои - это больше никому не понадобится
+            connections.close_all()
+
+        threading.Thread(target=target, name="facet-index-warm", daemon=True).start()
+
+    def _ensure_fresh(self):
+        pending = getattr(self._local, "block", None)
+        if pending is not None and pending in connection.atomic_blocks:
+            # своя транзакция видит свои незакоммиченные записи журнала, но может откатиться:
+            # до её завершения индекс не трогаем (а построенный сейчас - перестроим потом)
+            if self._postings is None:
+                self._build()
+                self._stale = True
+            return
+        self._local.block = None
+        if self._postings is None or self._stale:
+            self._build()
+        limit = getattr(settings, "FACET_LOG_REPLAY_LIMIT", 1000)
+        changes = list(
+            FacetIndexChange.objects.filter(version__gt=self._version)
+            .order_by("version").values_list("version", "op", "payload")[:limit]
+        )
+        if not changes:
+            return
+        if (len(changes) == limit or changes[0][0] != self._version + 1
+                or any(op == "rebuild" for _, op, _ in changes)):
+            # отстали дальше, чем хранится журнал, или индекс сбросили целиком
+            self._build()
+            return
+        with self._lock:
+            for version, op, payload in changes:
+                if version > self._version:
+                    getattr(self, "_apply_" + op)(**payload)
+                    self._version = version
+
+    # --- журнал изменений ---
+    def _record(self, op: str, **payload):
+        """
+        Пишет изменение в журнал в текущей транзакции: откат уберёт его вместе с данными.
+        """
+        self._write_change(op, payload)
+        # внешний блок транзакции (блоки TestCase не в счёт - как в проверке durable у Django)
+        self._local.block = next((block for block in connection.atomic_blocks if not block._from_testcase), None)
+        every = getattr(settings, "FACET_LOG_PRUNE_EVERY", 1000)
+        self._written += 1
+        if every and self._written >= every:
+            self._written = 0
+            transaction.on_commit(self.prune_log)
+
+    def _write_change(self, op: str, payload: dict):
+        qn = connection.ops.quote_name
+        head, log = qn(FacetIndexHead._meta.db_table), qn(FacetIndexChange._meta.db_table)
+        with transaction.atomic(savepoint=False), connection.cursor() as cursor:
+            # UPDATE берёт блокировку строки до конца транзакции: версии выдаются и коммитятся строго по порядку
+            cursor.execute(f"UPDATE {head} SET version = version + 1 WHERE id = 1")
+            if not cursor.rowcount:
+                FacetIndexHead.objects.get_or_create(pk=1)
+                cursor.execute(f"UPDATE {head} SET version = version + 1 WHERE id = 1")
+            cursor.execute(
+                f"INSERT INTO {log} (version, op, payload) SELECT version, %s, %s FROM {head} WHERE id = 1",
+                [op, json.dumps(payload)],
+            )
+
+    def prune_log(self) -> int:
+        """
+        Удаляет из журнала всё, кроме последних FACET_LOG_KEEP записей. Возвращает число удалённых.
+        """
+        with use_primary():
+            version = FacetIndexHead.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+        keep = getattr(settings, "FACET_LOG_KEEP", 10_000)
+        return FacetIndexChange.objects.filter(version__lte=version - keep).delete()[0]
+
+    def invalidate(self):
+        """
+        Сбрасывает индекс во всех процессах (например, после bulk_create в обход сигналов).
+        """
+        # до перестройки запросы обслуживает старый индекс
+        self._stale = True
+        self._record("rebuild")
+
+    def add(self, facet: str, keys, work_ids):
+        """
+        Все work_ids получили каждый из ключей keys.
+        """
+        keys = [key for key in keys if key is not None]
+        if keys:
+            self._record("add", facet=facet, keys=keys, ids=list(work_ids))
+
+    def remove(self, facet: str, keys, work_ids):
+        keys = [key for key in keys if key is not None]
+        if keys:
+            self._record("remove", facet=facet, keys=keys, ids=list(work_ids))
+
+    def set_work(self, work: Work):
+        """
+        Новое или изменённое произведение: общий список, направленность и рейтинг.
+        """
+        self._record("set_work", work_id=work.id, direction=work.direction_id, rating=work.rating_id)
+
+    def discard_work(self, work_id: int):
+        self._record("discard_work", work_id=work_id)
+
+    # --- применение записей журнала (под _lock) ---
+    def _apply_add(self, facet, keys, ids):
+        postings = self._postings[facet]
+        for key in keys:
+            postings.setdefault(key, Bitmap()).add(ids)
+        self._order.pop(facet, None)
+
+    def _apply_remove(self, facet, keys, ids):
+        postings = self._postings[facet]
+        for key in keys:
+            if key in postings:
+                postings[key].discard(ids)
+                if not len(postings[key]):
+                    del postings[key]
+        self._order.pop(facet, None)
+
+    def _apply_set_work(self, work_id, direction, rating):
+        self._all.add([work_id])
+        for facet, key in (("directions", direction), ("ratings", rating)):
+            others = [k for k, bitmap in self._postings[facet].items() if k != key and work_id in bitmap]
+            self._apply_remove(facet, others, [work_id])
+            if key is not None:
+                self._apply_add(facet, [key], [work_id])
+
+    def _apply_discard_work(self, work_id):
+        # строки связей удаляются каскадом и приходят своими remove; здесь - проверка без переписывания
+        self._all.discard([work_id])
+        for facet, postings in self._postings.items():
+            self._apply_remove(facet, [k for k, bitmap in postings.items() if work_id in bitmap], [work_id])
+
+    # --- запросы ---
+    def search(self, include: dict = None, exclude: dict = None, any_of: dict = None) -> Bitmap:
+        """
+        include  - {фасет: [ключи]}: произведение должно иметь ВСЕ ключи;
+        exclude  - {фасет: [ключи]}: ни одного из ключей;
+        any_of   - {фасет: [ключи]}: хотя бы один ключ (для направленности и рейтинга).
+        Возвращает множество подходящих произведений.
+        """
+        self._ensure_fresh()
+        with self._lock:
+            required = [self._postings[facet].get(key, Bitmap()) for facet, keys in (include or {}).items()
+                        for key in keys]
+            # начинаем с самого маленького множества - дальше пересечения только дешевеют
+            required.sort(key=len)
+            result = self._all.copy()
+            for bitmap in required:
+                result = result & bitmap
+            for facet, keys in (any_of or {}).items():
+                if keys:
+                    union = Bitmap()
+                    for key in keys:
+                        union = union | self._postings[facet].get(key, Bitmap())
+                    result = result & union
+            for facet, keys in (exclude or {}).items():
+                for key in keys:
+                    result = result - self._postings[facet].get(key, Bitmap())
+            return result
+
+    def counts(self, result: Bitmap, limit: int = 50, facets=None) -> dict:
+        """
+        Для фасетов facets (по умолчанию всех) - сколько произведений из result имеют каждый ключ,
+        limit самых частых. Ключи перебираются по убыванию размера: как только он меньше
+        limit-го найденного счётчика, остальные уже ничего не изменят. Вызывается после search().
+        """
+        with self._lock:
+            if self._postings is None:
+                return {facet: [] for facet in facets or self.FACETS}
+            everything = len(result) == len(self._all)
+            probe = _Probe(result)
+            out = {}
+            for facet in facets or self.FACETS:
+                top = []  # куча (счётчик, -ключ): сверху худший из лучших
+                for key, bitmap in self._ordered(facet):
+                    total = len(bitmap)
+                    if len(top) >= limit and total < top[0][0]:
+                        break
+                    count = total if everything else probe.intersection_size(bitmap)
+                    if count:
+                        entry = (count, -key)
+                        if len(top) < limit:
+                            heapq.heappush(top, entry)
+                        elif entry > top[0]:
+                            heapq.heapreplace(top, entry)
+                out[facet] = [(-key, count) for count, key in sorted(top, key=lambda e: (-e[0], -e[1]))]
+            return out
+
+    def _ordered(self, facet: str) -> list:
+        order = self._order.get(facet)
+        if order is None:
+            order = sorted(self._postings[facet].items(), key=lambda item: (-len(item[1]), item[0]))
+            self._order[facet] = order
+        return order
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,77 @@
+import re
+
+from django.db import connection, connections, router
+
+from .models import Chapter
+
+
+TABLE = "chapter_fts"
+
+_TOKEN = re.compile(r"\w+\*?", re.UNICODE)
+
+
+def is_available() -> bool:
+    """
+    Индекс построен на SQLite FTS5; на других СУБД поиск по тексту глав выключен.
+    """
+    return connection.vendor == "sqlite"
+
+
+def read_chapter_text(chapter) -> str:
+    with chapter.file.open("rb") as f:
+        return f.read().decode("utf-8", errors="replace")
+
+
+def index_chapter(chapter, text: str = None):
+    """
+    Добавляет (или переиндексирует) главу. rowid в FTS-таблице = Chapter.id.
+    """
+    if not is_available() or not chapter.file:
+        return
+    if text is None:
+        try:
+            text = read_chapter_text(chapter)
+        except (OSError, ValueError):
+            return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [chapter.pk])
+        cursor.execute(f"INSERT INTO {TABLE}(rowid, title, body) VALUES (%s, %s, %s)", [chapter.pk, chapter.title, text])
+
+
+def unindex_chapter(chapter_id: int):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [chapter_id])
+
+
+def build_match_query(q: str) -> str:
+    """
+    Превращает пользовательский ввод в безопасный FTS5-запрос: каждое слово в кавычках
+    (все слова обязательны), звёздочка на конце слова - поиск по префиксу.
+    """
+    terms = []
+    for token in _TOKEN.findall(q):
+        prefix = token.endswith("*")
+        word = token.rstrip("*")
+        if word:
+            terms.append(f'"{word}"*' if prefix else f'"{word}"')
+    return " ".join(terms)
+
+
+def search(q: str, limit: int = 20, offset: int = 0):
+    """
+    Возвращает [(chapter_id, rank, snippet)], лучшие совпадения первыми.
+    Совпадение в названии главы весит в 5 раз больше, чем в тексте (bm25).
+    """
+    match = build_match_query(q)
+    if not match:
+        return []
+    with connections[router.db_for_read(Chapter)].cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, bm25({TABLE}, 5.0, 1.0) AS rank, "
+            f"snippet({TABLE}, 1, '<b>', '</b>', '…', 16) "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank LIMIT %s OFFSET %s",
+            [match, limit, offset],
+        )
+        return cursor.fetchall()
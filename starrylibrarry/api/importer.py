@@ -0,0 +1,261 @@
+"""
+Массовый импорт архива произведений.
+
+Архив - это JSONL (по записи на строку) или zip, внутри которого лежит *.jsonl и файлы глав.
+Записи ссылаются друг на друга по именам, а не по id:
+
+    {"kind": "fandom_category", "name": "Книги"}
+    {"kind": "fandom", "category": "Книги", "name": "Ведьмак"}
+    {"kind": "character", "fandom": "Ведьмак", "name": "Геральт", "description": ""}
+    {"kind": "tag_category", "name": "Жанры"}
+    {"kind": "tag", "category": "Жанры", "name": "Флафф", "description": ""}
+    {"kind": "direction", "name": "Джен", "description": ""}
+    {"kind": "rating", "name": "G", "description": ""}
+    {"kind": "work", "name": "...", "author": "username", "direction": "Джен", "rating": "G",
+     "tags": ["Флафф"], "fandoms": ["Ведьмак"], "characters": ["Геральт"],
+     "chapters": [{"title": "Глава 1", "file": "chapters/1.txt"}, {"title": "Глава 2", "text": "..."}]}
+
+Строки обрабатываются пачками: каждая пачка - одна транзакция с bulk_create для произведений,
+связей и глав, и в ней же сдвигается ImportCheckpoint, так что повторный запуск продолжит с места обрыва.
+Справочники создаются обычным create() (их мало), поэтому кэш справочников сбрасывается сигналами.
+Файлы глав пишутся в хранилище внутри транзакции пачки; если она откатилась, они удаляются.
+"""
+import io
+import json
+import posixpath
+import zipfile
+from dataclasses import dataclass, field
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+
+from . import fulltext, readmodel
+from .facets import facet_index
+from .models import (
+    FandomCategory, Fandom, Character, TagCategory, Tag, Direction, Rating,
+    Work, WorkTag, WorkFandom, WorkCharacter, Chapter, ImportCheckpoint,
+)
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+@dataclass
+class ImportStats:
+    resumed_from: int = 0
+    lines: int = 0
+    works: int = 0
+    chapters: int = 0
+    taxonomy: int = 0
+    errors: list = field(default_factory=list)
+
+
+class ArchiveImporter:
+    def __init__(self, source: str, default_author=None, batch_size: int = DEFAULT_BATCH_SIZE, max_errors: int = 100):
+        self.source = source
+        self.default_author = default_author
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.stats = ImportStats()
+        self._zip = None
+        self._load_lookups()
+
+    # ----- справочники по именам -----
+    def _load_lookups(self):
+        def by_name(qs):
+            # имена в справочниках не уникальны - берём самую старую запись
+            return dict(qs.order_by("-pk").values_list("name", "pk"))
+
+        self.fandom_categories = by_name(FandomCategory.objects)
+        self.fandoms = by_name(Fandom.objects)
+        self.characters = by_name(Character.objects)
+        self.tag_categories = by_name(TagCategory.objects)
+        self.tags = by_name(Tag.objects)
+        self.directions = by_name(Direction.objects)
+        self.ratings = by_name(Rating.objects)
+        self.users = dict(get_user_model().objects.values_list("username", "pk"))
+
+    def _ref(self, lookup: dict, name, what: str):
+        if name is None:
+            return None
+        try:
+            return lookup[name]
+        except KeyError:
+            raise ArchiveError(f"unknown {what}: {name!r}")
+
+    def _parent(self, lookup: dict, record: dict, key: str, what: str):
+        # у фэндома, персонажа и тега родитель обязателен: без него create() упадёт на NOT NULL
+        if record.get(key) is None:
+            raise ArchiveError(f"{record['kind']} {record['name']!r} needs {key!r}")
+        return self._ref(lookup, record[key], what)
+
+    def _taxonomy(self, record: dict):
+        kind = record["kind"]
+        name = record["name"]
+        if not isinstance(name, str) or not name:
+            raise ArchiveError(f"{kind} needs a non-empty 'name'")
+        description = record.get("description", "")
+        if kind == "fandom_category":
+            lookup, make = self.fandom_categories, lambda: FandomCategory.objects.create(name=name)
+        elif kind == "fandom":
+            category = self._parent(self.fandom_categories, record, "category", "fandom category")
+            lookup, make = self.fandoms, lambda: Fandom.objects.create(category_id=category, name=name)
+        elif kind == "character":
+            fandom = self._parent(self.fandoms, record, "fandom", "fandom")
+            lookup, make = self.characters, lambda: Character.objects.create(
+                fandom_id=fandom, name=name, description=description)
+        elif kind == "tag_category":
+            lookup, make = self.tag_categories, lambda: TagCategory.objects.create(name=name)
+        elif kind == "tag":
+            category = self._parent(self.tag_categories, record, "category", "tag category")
+            lookup, make = self.tags, lambda: Tag.objects.create(category_id=category, name=name, description=description)
+        elif kind == "direction":
+            lookup, make = self.directions, lambda: Direction.objects.create(name=name, description=description)
+        elif kind == "rating":
+            lookup, make = self.ratings, lambda: Rating.objects.create(name=name, description=description)
+        else:
+            raise ArchiveError(f"unknown kind: {kind!r}")
+        if name not in lookup:
+            try:
+                # точка сохранения: неудачная запись не должна откатывать всю пачку
+                with transaction.atomic():
+                    lookup[name] = make().pk
+            except IntegrityError as e:
+                raise ArchiveError(f"cannot create {kind} {name!r}: {e}")
+            self.stats.taxonomy += 1
+
+    # ----- главы -----
+    def _chapter_content(self, chapter: dict) -> bytes:
+        if "text" in chapter:
+            return chapter["text"].encode("utf-8")
+        path = chapter.get("file")
+        if not path or self._zip is None:
+            raise ArchiveError("chapter needs 'text' or a 'file' inside a zip archive")
+        try:
+            return self._zip.read(path)
+        except KeyError:
+            raise ArchiveError(f"chapter file not found in archive: {path!r}")
+
+    # ----- пачка -----
+    def _process_batch(self, batch, last_line: int):
+        saved = []
+        try:
+            with transaction.atomic():
+                self._write_batch(batch, last_line, saved)
+        except BaseException:
+            # пачка откатилась - файлы, созданные ради её глав, ни на что не ссылаются
+            storage = Chapter._meta.get_field("file").storage
+            for name in saved:
+                storage.delete_with_variants(name)
+            raise
+
+    def _write_batch(self, batch, last_line: int, saved: list):
+        works, relations, chapters = [], [], []
+        for line_no, record in batch:
+            try:
+                if record.get("kind") != "work":
+                    self._taxonomy(record)
+                    continue
+                author = self.users.get(record.get("author")) or self.default_author
+                if author is None:
+                    raise ArchiveError(f"unknown author: {record.get('author')!r}")
+                work = Work(
+                    author_id=author,
+                    name=record["name"],
+                    direction_id=self._ref(self.directions, record.get("direction"), "direction"),
+                    rating_id=self._ref(self.ratings, record.get("rating"), "rating"),
+                    rating_count=record.get("rating_count", 0),
+                )
+                rel = (
+                    [self._ref(self.tags, n, "tag") for n in record.get("tags", [])],
+                    [self._ref(self.fandoms, n, "fandom") for n in record.get("fandoms", [])],
+                    [self._ref(self.characters, n, "character") for n in record.get("characters", [])],
+                )
+                chs = [
+                    (ch.get("title", ""), ch.get("file") or "chapter.txt", self._chapter_content(ch))
+                    for ch in record.get("chapters", [])
+                ]
+            except (ArchiveError, KeyError, TypeError, AttributeError) as e:
+                self._error(line_no, e)
+                continue
+            works.append(work)
+            relations.append(rel)
+            chapters.append(chs)
+
+        Work.objects.bulk_create(works, batch_size=self.batch_size)
+        tag_rows, fandom_rows, character_rows, chapter_rows, texts = [], [], [], [], []
+        file_field = Chapter._meta.get_field("file")
+        storage = file_field.storage
+        for work, (tag_ids, fandom_ids, character_ids), chs in zip(works, relations, chapters):
+            tag_rows += [WorkTag(work_id=work.pk, tag_id=t) for t in dict.fromkeys(tag_ids)]
+            fandom_rows += [WorkFandom(work_id=work.pk, fandom_id=f) for f in dict.fromkeys(fandom_ids)]
+            character_rows += [WorkCharacter(work_id=work.pk, character_id=c) for c in dict.fromkeys(character_ids)]
+            for title, path, content in chs:
+                upload = file_field.generate_filename(None, posixpath.basename(path))
+                # хранилище дедуплицирует: такой же файл мог уже лежать там ради закоммиченной главы
+                existed = storage.exists(storage.content_name(upload, ContentFile(content)))
+                name = storage.save(upload, ContentFile(content))
+                if not existed:
+                    saved.append(name)
+                chapter_rows.append(Chapter(work_id=work.pk, title=title, file=name))
+                texts.append(content.decode("utf-8", errors="replace"))
+        WorkTag.objects.bulk_create(tag_rows, batch_size=self.batch_size)
+        WorkFandom.objects.bulk_create(fandom_rows, batch_size=self.batch_size)
+        WorkCharacter.objects.bulk_create(character_rows, batch_size=self.batch_size)
+        Chapter.objects.bulk_create(chapter_rows, batch_size=self.batch_size)
+
+        # bulk_create не шлёт сигналов - производные индексы обновляем сами
+        readmodel.refresh_works([w.pk for w in works])
+        for chapter, text in zip(chapter_rows, texts):
+            fulltext.index_chapter(chapter, text)
+
+        ImportCheckpoint.objects.update_or_create(source=self.source, defaults={"line": last_line})
+
+        self.stats.works += len(works)
+        self.stats.chapters += len(chapter_rows)
+
+    def _error(self, line_no: int, error):
+        self.stats.errors.append({"line": line_no, "error": str(error)})
+        if len(self.stats.errors) > self.max_errors:
+            raise ArchiveError(f"too many errors (>{self.max_errors}), last at line {line_no}: {error}")
+
+    # ----- вход -----
+    def _lines(self, fileobj, name: str):
+        if name.endswith(".zip"):
+            self._zip = zipfile.ZipFile(fileobj)
+            members = sorted(n for n in self._zip.namelist() if n.endswith(".jsonl"))
+            if not members:
+                raise ArchiveError("zip archive contains no .jsonl file")
+            return io.TextIOWrapper(self._zip.open(members[0]), encoding="utf-8")
+        return io.TextIOWrapper(fileobj, encoding="utf-8")
+
+    def run(self, fileobj, name: str) -> ImportStats:
+        """
+        fileobj - бинарный файл архива (zip с seek или JSONL), name - его имя (по расширению решаем, что это).
+        """
+        checkpoint = ImportCheckpoint.objects.filter(source=self.source).values_list("line", flat=True).first() or 0
+        self.stats.resumed_from = checkpoint
+        batch = []
+        line_no = 0
+        try:
+            for line_no, raw in enumerate(self._lines(fileobj, name), start=1):
+                if line_no <= checkpoint or not raw.strip():
+                    continue
+                try:
+                    batch.append((line_no, json.loads(raw)))
+                except ValueError as e:
+                    self._error(line_no, e)
+                if len(batch) >= self.batch_size:
+                    self._process_batch(batch, line_no)
+                    batch = []
+            if batch or line_no > checkpoint:
+                self._process_batch(batch, line_no)
+        finally:
+            self.stats.lines = max(0, line_no - checkpoint)
+            if self.stats.works:
+                facet_index.invalidate()
+        return self.stats
@@ -0,0 +1,41 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importer import ArchiveImporter, ArchiveError, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Массовый импорт произведений, глав и справочников из JSONL или zip-архива (см. api/importer.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("archive", help="путь к .jsonl или .zip")
+        parser.add_argument("--author", help="username автора для записей без известного author")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--source", help="ключ контрольной точки (по умолчанию - абсолютный путь к архиву)")
+
+    def handle(self, archive, author=None, batch_size=DEFAULT_BATCH_SIZE, source=None, **options):
+        default_author = None
+        if author:
+            default_author = get_user_model().objects.filter(username=author).values_list("pk", flat=True).first()
+            if default_author is None:
+                raise CommandError(f"Пользователь {author!r} не найден")
+
+        importer = ArchiveImporter(
+            source=source or os.path.abspath(archive),
+            default_author=default_author,
+            batch_size=batch_size,
+        )
+        try:
+            with open(archive, "rb") as f:
+                stats = importer.run(f, archive)
+        except ArchiveError as e:
+            raise CommandError(str(e))
+
+        for error in stats.errors:
+            self.stderr.write(f"строка {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Продолжено со строки {stats.resumed_from}; строк: {stats.lines}, произведений: {stats.works}, "
+            f"глав: {stats.chapters}, справочников: {stats.taxonomy}, ошибок: {len(stats.errors)}"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import fulltext
+from api.models import Chapter
+
+
+class Command(BaseCommand):
+    help = "Переиндексировать текст всех глав в полнотекстовом индексе (chapter_fts)"
+
+    def handle(self, *args, **options):
+        if not fulltext.is_available():
+            raise CommandError("Полнотекстовый индекс поддерживается только на SQLite (FTS5)")
+        done = 0
+        for chapter in Chapter.objects.only("id", "title", "file").iterator(chunk_size=500):
+            fulltext.index_chapter(chapter)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано глав: {done}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.facets import facet_index
+
+
+class Command(BaseCommand):
+    help = "Удалить старые записи журнала фасетного индекса (оставить последние FACET_LOG_KEEP)"
+
+    def handle(self, *args, **options):
+        deleted = facet_index.prune_log()
+        self.stdout.write(self.style.SUCCESS(f"Удалено записей журнала: {deleted}"))
@@ -0,0 +1,117 @@
+import json
+import random
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import BENCH_PASSWORD, BENCH_USERNAME, SEARCH_WORDS
+from api.importer import ArchiveImporter
+from api.models import Profile, Work
+
+BATCH = 5000
+# главы берутся из небольшого набора текстов: хранилище глав адресует файлы по содержимому,
+# так что на диске оказывается TEXT_VARIANTS файлов, а не по файлу на главу
+TEXT_VARIANTS = 200
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет БД синтетической библиотекой для команды bench через обычный импорт архива "
+        "(справочники, произведения со связями, главы, полнотекстовый индекс, read model). "
+        "Запускать на отдельной БД: SQLITE_PATH=/tmp/bench.sqlite3 MEDIA_ROOT=/tmp/bench-media ..."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--works", type=int, default=200_000)
+        parser.add_argument("--max-chapters", type=int, default=3, help="глав на произведение: от 1 до N")
+        parser.add_argument("--authors", type=int, default=1000)
+        parser.add_argument("--tags", type=int, default=300)
+        parser.add_argument("--fandoms", type=int, default=500)
+        parser.add_argument("--characters", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--force", action="store_true", help="разрешить запись в основную db.sqlite3 проекта")
+
+    def handle(self, *args, works, max_chapters, authors, tags, fandoms, characters, seed, force, **options):
+        name = settings.DATABASES["default"]["NAME"]
+        if not force and Path(str(name)) == Path(settings.BASE_DIR) / "db.sqlite3":
+            raise CommandError("Это основная БД проекта - укажите отдельную через SQLITE_PATH или добавьте --force")
+        rng = random.Random(seed)
+        authors_names = self.seed_authors(authors)
+        source = f"bench-seed:{seed}:{works}"
+
+        with tempfile.TemporaryFile("w+b", suffix=".jsonl") as archive:
+            for record in self.records(rng, works, max_chapters, authors_names, tags, fandoms, characters):
+                archive.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+            archive.seek(0)
+            importer = ArchiveImporter(source=source, batch_size=BATCH)
+            stats = importer.run(archive, "bench.jsonl")
+        if stats.errors:
+            raise CommandError(f"Ошибки импорта: {stats.errors[:5]}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Произведений: {Work.objects.count()}, глав: {stats.chapters}, справочников: {stats.taxonomy}"
+        ))
+
+    def seed_authors(self, count: int) -> list:
+        User = get_user_model()
+        names = [f"bench-author-{i}" for i in range(count)]
+        if not User.objects.filter(username=BENCH_USERNAME).exists():
+            User.objects.create_user(username=BENCH_USERNAME, email="bench@example.com", password=BENCH_PASSWORD)
+        if not User.objects.filter(username__startswith="bench-author-").exists():
+            password = make_password(None)
+            for start in range(0, count, BATCH):
+                created = User.objects.bulk_create([
+                    User(username=name, email=f"{name}@example.com", password=password)
+                    for name in names[start:start + BATCH]
+                ])
+                Profile.objects.bulk_create([Profile(user=user) for user in created])
+        return names
+
+    def records(self, rng, works, max_chapters, authors, tags, fandoms, characters):
+        """
+        JSONL-записи в формате api/importer.py: сначала справочники, потом произведения.
+        """
+        yield from ({"kind": "direction", "name": name, "description": ""}
+                    for name in ("Джен", "Гет", "Слэш", "Фемслэш", "Смешанная"))
+        yield from ({"kind": "rating", "name": name, "description": ""} for name in ("G", "PG-13", "R", "NC-17"))
+        tag_categories = [f"Категория меток {i}" for i in range(10)]
+        yield from ({"kind": "tag_category", "name": name} for name in tag_categories)
+        tag_names = [f"Метка {i}" for i in range(tags)]
+        yield from ({"kind": "tag", "category": rng.choice(tag_categories), "name": name, "description": ""}
+                    for name in tag_names)
+        fandom_categories = [f"Категория фэндомов {i}" for i in range(10)]
+        yield from ({"kind": "fandom_category", "name": name} for name in fandom_categories)
+        fandom_names = [f"Фэндом {i}" for i in range(fandoms)]
+        yield from ({"kind": "fandom", "category": rng.choice(fandom_categories), "name": name}
+                    for name in fandom_names)
+        character_fandoms = {}
+        for i in range(characters):
+            fandom = rng.choice(fandom_names)
+            character_fandoms.setdefault(fandom, []).append(f"Персонаж {i}")
+            yield {"kind": "character", "fandom": fandom, "name": f"Персонаж {i}", "description": ""}
+
+        texts = [
+            "\n\n".join(" ".join(rng.choice(SEARCH_WORDS) for _ in range(30)) for _ in range(rng.randint(1, 3)))
+            for _ in range(TEXT_VARIANTS)
+        ]
+        for i in range(works):
+            work_fandoms = rng.sample(fandom_names, rng.randint(1, 2))
+            pool = [name for fandom in work_fandoms for name in character_fandoms.get(fandom, ())]
+            yield {
+                "kind": "work",
+                "name": f"Работа {i}",
+                "author": rng.choice(authors),
+                "direction": rng.choice(("Джен", "Гет", "Слэш", "Фемслэш", "Смешанная")),
+                "rating": rng.choice(("G", "PG-13", "R", "NC-17")),
+                "rating_count": rng.randint(0, 500),
+                "tags": rng.sample(tag_names, rng.randint(1, 5)),
+                "fandoms": work_fandoms,
+                "characters": rng.sample(pool, min(len(pool), rng.randint(0, 3))),
+                "chapters": [
+                    {"title": f"Глава {n}", "text": rng.choice(texts)}
+                    for n in range(1, rng.randint(1, max_chapters) + 1)
+                ],
+            }
@@ -0,0 +1,273 @@
+"""
+Метрики маршрутов API: число SQL-запросов, время SQL, время сериализации ответа, размер ответа
+и общая длительность - по каждому "МЕТОД шаблон-URL". Отдаются в формате Prometheus с /metrics,
+который подключается только при заданном METRICS_TOKEN и требует его в заголовке Authorization.
+
+Запросы считает execute_wrapper, который вешается на каждое соединение с БД (сигнал connection_created
+в signals.py) и пишет в измерение текущего HTTP-запроса - поэтому учитываются и ORM-вызовы,
+выполненные в потоках sync_to_async. Счётчики живут в памяти процесса, у каждого воркера свои.
+У потоковых ответов учитывается только работа до начала отдачи тела.
+
+QUERY_BUDGETS = {"МЕТОД шаблон-URL": N, ...} - сколько запросов маршруту можно сделать.
+Превышение по QUERY_BUDGET_MODE: "log" - предупреждение в лог, "raise" - QueryBudgetExceeded
+(в тестах превращается в упавший тест).
+
+Одинаков в myproject и starrylibrarry, см. myproject/api/tests/test_shared_modules.py.
+"""
+import contextvars
+import hmac
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.urls import path
+from django.urls import Resolver404, resolve
+from ninja_extra import NinjaExtraAPI
+
+logger = logging.getLogger(__name__)
+
+# границы корзин гистограммы длительности запроса, секунды
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class _Measurement:
+    __slots__ = ("queries", "sql_seconds", "serialize_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    execute_wrapper: вне HTTP-запроса (команды, миграции) ничего не делает.
+    """
+    measurement = _current.get()
+    if measurement is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        measurement.queries += 1
+        measurement.sql_seconds += time.perf_counter() - started
+
+
+def install_query_recorder(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class _RouteStats:
+    __slots__ = ("count", "buckets", "duration", "queries", "sql_seconds", "serialize_seconds",
+                 "response_bytes", "over_budget")
+
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.duration = 0.0
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialize_seconds = 0.0
+        self.response_bytes = 0
+        self.over_budget = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = defaultdict(_RouteStats)
+
+    def observe(self, route: str, status: int, duration: float, measurement: _Measurement, size: int,
+                over_budget: bool):
+        with self._lock:
+            stats = self._routes[(route, status)]
+            stats.count += 1
+            stats.duration += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    stats.buckets[i] += 1
+            stats.queries += measurement.queries
+            stats.sql_seconds += measurement.sql_seconds
+            stats.serialize_seconds += measurement.serialize_seconds
+            stats.response_bytes += size
+            stats.over_budget += over_budget
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: _copy(stats) for key, stats in self._routes.items()}
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def _copy(stats: _RouteStats) -> _RouteStats:
+    copy = _RouteStats()
+    for name in _RouteStats.__slots__:
+        value = getattr(stats, name)
+        setattr(copy, name, list(value) if isinstance(value, list) else value)
+    return copy
+
+
+registry = Registry()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render_prometheus(snapshot: dict) -> str:
+    lines = []
+
+    def family(name, kind, help_text, rows):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(rows)
+
+    def labels(route, status, **extra):
+        pairs = [f'route="{_escape(route)}"', f'status="{status}"']
+        pairs += [f'{key}="{value}"' for key, value in extra.items()]
+        return "{" + ",".join(pairs) + "}"
+
+    items = sorted(snapshot.items())
+    duration_rows = []
+    for (route, status), stats in items:
+        for bound, count in zip(DURATION_BUCKETS, stats.buckets):
+            duration_rows.append(f"api_request_duration_seconds_bucket{labels(route, status, le=bound)} {count}")
+        duration_rows.append(f"api_request_duration_seconds_bucket{labels(route, status, le='+Inf')} {stats.count}")
+        duration_rows.append(f"api_request_duration_seconds_sum{labels(route, status)} {stats.duration:.6f}")
+        duration_rows.append(f"api_request_duration_seconds_count{labels(route, status)} {stats.count}")
+    family("api_request_duration_seconds", "histogram", "Request duration by route", duration_rows)
+
+    for name, attr, help_text in (
+        ("api_db_queries_total", "queries", "SQL queries executed while handling the route"),
+        ("api_db_query_seconds_total", "sql_seconds", "Time spent in SQL"),
+        ("api_serialization_seconds_total", "serialize_seconds", "Time spent rendering response bodies"),
+        ("api_response_bytes_total", "response_bytes", "Response body size"),
+        ("api_query_budget_exceeded_total", "over_budget", "Requests over their QUERY_BUDGETS entry"),
+    ):
+        rows = []
+        for (route, status), stats in items:
+            value = getattr(stats, attr)
+            rows.append(f"{name}{labels(route, status)} {value:.6f}" if isinstance(value, float)
+                        else f"{name}{labels(route, status)} {value}")
+        family(name, "counter", help_text, rows)
+    return "\n".join(lines) + "\n"
+
+
+def route_label(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        # ответ отдан до URL-резолвера (например, из кэша публичного каталога)
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return f"{request.method} unmatched"
+    return f"{request.method} {match.route}"
+
+
+def _response_size(response) -> int:
+    if getattr(response, "streaming", False):
+        return int(response.get("Content-Length") or 0)
+    return len(response.content)
+
+
+class InstrumentedNinjaAPI(NinjaExtraAPI):
+    """
+    NinjaExtraAPI, который замеряет рендеринг тела ответа (сериализацию в JSON).
+    """
+    def create_response(self, request, data, *args, **kwargs):
+        measurement = _current.get()
+        if measurement is None:
+            return super().create_response(request, data, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return super().create_response(request, data, *args, **kwargs)
+        finally:
+            measurement.serialize_seconds += time.perf_counter() - started
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.prefix = getattr(settings, "METRICS_PATH_PREFIX", "/api/")
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        measurement, started = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.set(None)
+        return self._finish(request, response, measurement, started)
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.prefix):
+            return await self.get_response(request)
+        measurement, started = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.set(None)
+        return self._finish(request, response, measurement, started)
+
+    def _start(self):
+        measurement = _Measurement()
+        _current.set(measurement)
+        return measurement, time.perf_counter()
+
+    def _finish(self, request, response, measurement: _Measurement, started: float):
+        duration = time.perf_counter() - started
+        route = route_label(request)
+        budget = getattr(settings, "QUERY_BUDGETS", {}).get(route)
+        over_budget = budget is not None and measurement.queries > budget
+        registry.observe(route, response.status_code, duration, measurement, _response_size(response), over_budget)
+        if over_budget:
+            message = f"{route}: {measurement.queries} SQL queries, budget {budget}"
+            if getattr(settings, "QUERY_BUDGET_MODE", "log") == "raise":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def metrics_view(request):
+    """
+    GET /metrics с заголовком "Authorization: Bearer <METRICS_TOKEN>", остальным 404.
+    Адрес клиента не проверяем: за nginx на той же машине все запросы приходят с 127.0.0.1.
+    """
+    token = getattr(settings, "METRICS_TOKEN", None)
+    given = request.headers.get("Authorization", "")
+    if not token or not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+        raise Http404
+    return HttpResponse(render_prometheus(registry.snapshot()), content_type="text/plain; version=0.0.4")
+
+
+def metrics_urlpatterns() -> list:
+    """
+    [path("metrics", ...)] для urls.py - или ничего, если METRICS_TOKEN не задан.
+    """
+    if not getattr(settings, "METRICS_TOKEN", None):
+        return []
+    return [path("metrics", metrics_view)]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS chapter_fts "
+        "USING fts5(title, body, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS chapter_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_work_rating_character_workcharacter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 01:19
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_chapter_fts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chapter',
+            name='file',
+            field=models.FileField(storage=api.storage.get_content_storage, upload_to='chapters/'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='file',
+            field=models.FileField(storage=api.storage.get_content_storage, upload_to='reviews/'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.4 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+def create_head(apps, schema_editor):
+    apps.get_model('api', 'FacetIndexHead').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetIndexChange',
+            fields=[
+                ('version', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('op', models.CharField(max_length=16)),
+                ('payload', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FacetIndexHead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_head, migrations.RunPython.noop),
+    ]
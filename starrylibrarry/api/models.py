@@ -2,6 +2,8 @@ from django.db import models
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 
+from .storage import get_content_storage
+
 
 class Role(models.Model):
     """
@@ -161,13 +163,23 @@ class WorkCharacter(models.Model):
         unique_together = ("work", "character")
 
 
+class WorkDocument(models.Model):
+    """
+    Готовый JSON произведения (то, что отдаётся как WorkOut), чтобы не собирать его
+    из ORM и pydantic на каждом чтении. Поддерживается сигналами, см. readmodel.py.
+    """
+    work = models.OneToOneField(Work, on_delete=models.CASCADE, primary_key=True, related_name="document")
+    payload = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class Chapter(models.Model):
     """
     Глава - некоторая часть произведения, с большим содержанием текста, который находится в файле - "путь к файлу + название"
     """
     work = models.ForeignKey(Work, on_delete=models.CASCADE, related_name="chapters")
     title = models.CharField(max_length=64)
-    file = models.FileField(upload_to="chapters/")
+    file = models.FileField(upload_to="chapters/", storage=get_content_storage)
 
     def __str__(self):
         return f"{self.work.name}: {self.title}"
@@ -179,7 +191,38 @@ class Review(models.Model):
     """
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="reviews")
     chapter = models.OneToOneField(Chapter, on_delete=models.CASCADE, primary_key=True, related_name="review")
-    file = models.FileField(upload_to="reviews/")
+    file = models.FileField(upload_to="reviews/", storage=get_content_storage)
 
     def __str__(self):
         return f"Review for {self.chapter}"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Докуда дошёл массовый импорт архива (importer.py). Обновляется в той же транзакции,
+    что и очередная пачка, поэтому после обрыва импорт продолжается ровно с места остановки.
+    """
+    source = models.CharField(max_length=255, unique=True)
+    line = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.line}"
+
+
+class FacetIndexHead(models.Model):
+    """
+    Последняя версия журнала фасетного индекса (facets.py). Одна строка; её блокировка при записи
+    выдаёт версии журнала строго по порядку коммитов.
+    """
+    version = models.BigIntegerField(default=0)
+
+
+class FacetIndexChange(models.Model):
+    """
+    Журнал изменений фасетного индекса: каждый процесс доигрывает его до последней версии.
+    Старые записи удаляются (FACET_LOG_KEEP) - отставший процесс перестраивает индекс целиком.
+    """
+    version = models.BigIntegerField(primary_key=True)
+    op = models.CharField(max_length=16)
+    payload = models.JSONField(default=dict)
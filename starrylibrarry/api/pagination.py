@@ -0,0 +1,76 @@
+import base64
+import json
+
+from ninja.errors import HttpError
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(value) -> str:
+    """
+    Кодирует позицию курсора (последний отданный ключ) в непрозрачную строку.
+    """
+    raw = json.dumps(value, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Обратная операция к encode_cursor. На мусор отвечает 400, а не 500.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+
+
+def clamp_limit(limit: int) -> int:
+    if limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _keyset_query(qs, cursor: str = None):
+    if cursor:
+        last_id = decode_cursor(cursor)
+        if not isinstance(last_id, int):
+            raise HttpError(400, "Invalid cursor")
+        qs = qs.filter(pk__gt=last_id)
+    return qs.order_by("pk")
+
+
+def _keyset_result(rows: list, limit: int):
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].pk)
+    return rows, None
+
+
+async def akeyset_page(qs, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """
+    Keyset-пагинация по id: WHERE id > <курсор> ORDER BY id LIMIT n+1 (асинхронный ORM).
+    В отличие от OFFSET стоимость не растёт с номером страницы.
+    Возвращает (список объектов, next_cursor или None).
+    """
+    limit = clamp_limit(limit)
+    return _keyset_result([row async for row in _keyset_query(qs, cursor)[:limit + 1]], limit)
+
+
+def iter_keyset_chunks(qs, chunk_size: int = 500):
+    """
+    Обходит весь queryset пачками по chunk_size через keyset,
+    чтобы в памяти одновременно была только одна пачка (вместе с её prefetch).
+    """
+    last_id = None
+    while True:
+        page = qs if last_id is None else qs.filter(pk__gt=last_id)
+        rows = list(page.order_by("pk")[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1].pk
@@ -0,0 +1,97 @@
+import json
+
+from asgiref.sync import sync_to_async
+
+from .models import Work, WorkDocument
+from .schemas import WorkOut, DirectionOut, TagOut, FandomOut
+
+
+REFRESH_CHUNK = 500
+
+
+def works_queryset():
+    """
+    Базовый queryset для отдачи WorkOut: всё, что нужно сериализатору, одной пачкой запросов.
+    """
+    return Work.objects.select_related("direction", "rating").prefetch_related("tags", "fandoms")
+
+
+def work_out(w: Work) -> WorkOut:
+    return WorkOut(
+        id=w.id,
+        name=w.name,
+        rating_count=w.rating_count,
+        rating=w.rating,
+        direction=DirectionOut.from_orm(w.direction) if w.direction else None,
+        tags=[TagOut.from_orm(t) for t in w.tags.all()],
+        fandoms=[FandomOut.from_orm(f) for f in w.fandoms.all()],
+    )
+
+
+def render(w: Work) -> str:
+    return work_out(w).model_dump_json()
+
+
+def refresh_works(work_ids) -> dict:
+    """
+    Пересобирает документы указанных произведений пачками по REFRESH_CHUNK.
+    Возвращает {work_id: payload} для тех, что существуют.
+    """
+    work_ids = list(dict.fromkeys(work_ids))
+    rendered = {}
+    for i in range(0, len(work_ids), REFRESH_CHUNK):
+        chunk = work_ids[i:i + REFRESH_CHUNK]
+        docs = [WorkDocument(work_id=w.id, payload=render(w)) for w in works_queryset().filter(pk__in=chunk)]
+        WorkDocument.objects.bulk_create(
+            docs, update_conflicts=True, unique_fields=["work"], update_fields=["payload", "updated_at"],
+        )
+        rendered.update((d.work_id, d.payload) for d in docs)
+    return rendered
+
+
+def refresh_related(**lookup):
+    """
+    Пересобирает документы всех произведений, подходящих под фильтр (например tags=tag),
+    когда поменялся сам тег/фэндом/направленность/рейтинг.
+    """
+    refresh_works(Work.objects.filter(**lookup).values_list("id", flat=True).distinct())
+
+
+def documents(work_ids) -> list:
+    """
+    Документы в порядке work_ids. Одна выборка; если документа почему-то нет
+    (например, произведение создано в обход сигналов), он рендерится и сохраняется сразу.
+    """
+    work_ids = list(work_ids)
+    found = dict(WorkDocument.objects.filter(work_id__in=work_ids).values_list("work_id", "payload"))
+    missing = [i for i in work_ids if i not in found]
+    if missing:
+        found.update(refresh_works(missing))
+    return [found[i] for i in work_ids if i in found]
+
+
+async def adocuments(work_ids) -> list:
+    """
+    Асинхронный documents(): выборка через асинхронный ORM, редкая досборка недостающих - в потоке.
+    """
+    work_ids = list(work_ids)
+    found = {
+        work_id: payload
+        async for work_id, payload in WorkDocument.objects.filter(work_id__in=work_ids).values_list("work_id", "payload")
+    }
+    missing = [i for i in work_ids if i not in found]
+    if missing:
+        found.update(await sync_to_async(refresh_works)(missing))
+    return [found[i] for i in work_ids if i in found]
+
+
+def json_array(payloads) -> str:
+    return "[" + ",".join(payloads) + "]"
+
+
+def json_object(items_key: str, payloads, **fields) -> str:
+    """
+    {"items": [<готовые документы>], ...остальные поля} - без повторного парсинга документов.
+    """
+    rest = "".join("," + json.dumps(k) + ":" + json.dumps(v, ensure_ascii=False) for k, v in fields.items())
+    return "{" + json.dumps(items_key) + ":" + json_array(payloads) + rest + "}"
@@ -0,0 +1,151 @@
+"""
+Чтение с реплик БД (DATABASES, кроме 'default', - см. DB_REPLICAS в database.py проекта).
+
+На реплики уходят только чтения моделей из REPLICA_READ_MODELS; запись и всё остальное - в 'default'.
+Чтобы пользователь сразу видел свои изменения, несмотря на отставание реплик, чтение прижимается
+к основной БД:
+- на весь запрос с небезопасным методом (POST/PUT/PATCH/DELETE) и после любой записи через ORM;
+- внутри транзакции на 'default';
+- ещё REPLICA_PIN_SECONDS секунд после успешной записи - через куку REPLICA_PIN_COOKIE.
+
+Одинаков в myproject и starrylibrarry, см. myproject/api/tests/test_shared_modules.py.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+UNSAFE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+
+class _State:
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Состояние текущего запроса (или потока management-команды). Объект изменяемый, а не значение в
+# ContextVar: sync_to_async копирует контекст, и запись внутри ORM-вызова должна быть видна middleware.
+_state = contextvars.ContextVar("replica_state", default=None)
+
+
+def _current() -> _State:
+    state = _state.get()
+    if state is None:
+        state = _State()
+        _state.set(state)
+    return state
+
+
+def mark_write():
+    """
+    Отмечает запись мимо ORM (сырой SQL): дальнейшие чтения - с основной БД, в ответ уйдёт кука.
+    """
+    state = _current()
+    state.pinned = state.wrote = True
+
+
+@contextmanager
+def use_primary():
+    """
+    Все чтения внутри блока - с основной БД.
+    """
+    state = _current()
+    previous, state.pinned = state.pinned, True
+    try:
+        yield
+    finally:
+        state.pinned = previous
+
+
+def replica_aliases():
+    return getattr(settings, "REPLICA_DATABASES", ())
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = replica_aliases()
+        if not replicas or model._meta.label_lower not in getattr(settings, "REPLICA_READ_MODELS", ()):
+            return None
+        state = _state.get()
+        if state is not None and state.pinned:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        mark_write()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # реплики - копии основной БД, связи между объектами из любых из них допустимы
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема на реплики приходит вместе с данными (sync_replicas / репликация СУБД)
+        if db in replica_aliases():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Заводит состояние маршрутизации на запрос и ставит куку прилипания к основной БД после записи.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        self.cookie = getattr(settings, "REPLICA_PIN_COOKIE", "db_pin")
+        self.seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.set(None)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.set(None)
+        return self._finish(request, response, state)
+
+    def _start(self, request) -> _State:
+        state = _State(pinned=request.method in UNSAFE_METHODS or self._cookie_valid(request))
+        _state.set(state)
+        return state
+
+    def _cookie_valid(self, request) -> bool:
+        try:
+            return float(request.COOKIES.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _finish(self, request, response, state: _State):
+        wrote = state.wrote or request.method in UNSAFE_METHODS
+        if wrote and replica_aliases() and response.status_code < 400:
+            response.set_cookie(self.cookie, f"{time.time() + self.seconds:.3f}", max_age=self.seconds,
+                                httponly=True, samesite="Lax")
+        return response
@@ -1,5 +1,5 @@
 from ninja import Schema
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import EmailStr
 
@@ -148,7 +148,7 @@ class WorkOut(Schema):
     id: int
     name: str
     rating_count: int
-    direction: DirectionOut
+    direction: Optional[DirectionOut]
     rating: Optional[RatingOut]
     tags: List[TagOut]
     fandoms: List[FandomOut]
@@ -157,6 +157,37 @@ class WorkOut(Schema):
         orm_mode = True
 
 
+class WorkPageOut(Schema):
+    items: List[WorkOut]
+    next_cursor: Optional[str] = None
+
+
+class FacetCountOut(Schema):
+    id: int
+    count: int
+
+
+class WorkSearchOut(Schema):
+    items: List[WorkOut]
+    total: int
+    next_cursor: Optional[str] = None
+    facets: Dict[str, List[FacetCountOut]]
+
+
+class ImportErrorOut(Schema):
+    line: int
+    error: str
+
+
+class ImportResultOut(Schema):
+    resumed_from: int
+    lines: int
+    works: int
+    chapters: int
+    taxonomy: int
+    errors: List[ImportErrorOut]
+
+
 # ----- Главы -----
 class ChapterIn(Schema):
     title: str
@@ -170,6 +201,14 @@ class ChapterOut(Schema):
     file: str    # URL
 
 
+class ChapterHitOut(Schema):
+    id: int
+    work_id: int
+    title: str
+    rank: float
+    snippet: str
+
+
 # ----- Отзывы -----
 class ReviewIn(Schema):
     chapter_id: int
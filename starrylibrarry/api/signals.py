@@ -1,7 +1,15 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
 from django.dispatch import receiver
 from django.conf import settings
-from .models import Profile
+from . import fulltext, readmodel
+from .auth import invalidate_user, clear_user_cache
+from .cache import bump_taxonomy_version
+from .facets import facet_index
+from .metrics import install_query_recorder
+from .models import Profile, Role, CustomUser, Work, WorkTag, WorkFandom, WorkCharacter, Chapter, Tag, Fandom, Direction, Rating, \
+    TagCategory, FandomCategory
 
 
 # Автоматически создавать Profile при регистрации
@@ -20,3 +28,183 @@ def save_user_profile(sender, instance, **kwargs):
     При каждом сохранении User сохраняем и профиль (если меняли его данные через форму).
     """
     instance.profile.save()
+
+
+# ----- Фасетный индекс произведений (facets.py) -----
+THROUGH_FACETS = {
+    WorkTag: ("tags", "tag_id"),
+    WorkFandom: ("fandoms", "fandom_id"),
+    WorkCharacter: ("characters", "character_id"),
+}
+
+
+@receiver(post_save, sender=Work)
+def index_work(sender, instance, **kwargs):
+    facet_index.set_work(instance)
+
+
+@receiver(post_delete, sender=Work)
+def unindex_work(sender, instance, **kwargs):
+    facet_index.discard_work(instance.id)
+
+
+@receiver(m2m_changed, sender=WorkTag)
+@receiver(m2m_changed, sender=WorkFandom)
+def index_work_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    work.tags.set()/add() создают строки через bulk_create без post_save - ловим их здесь.
+    Удаления приходят через post_delete промежуточной модели (см. ниже).
+    """
+    if action != "post_add" or not pk_set:
+        return
+    facet, _ = THROUGH_FACETS[sender]
+    if reverse:
+        facet_index.add(facet, [instance.pk], pk_set)
+    else:
+        facet_index.add(facet, pk_set, [instance.pk])
+
+
+@receiver(post_save, sender=WorkTag)
+@receiver(post_save, sender=WorkFandom)
+@receiver(post_save, sender=WorkCharacter)
+def index_through_row(sender, instance, **kwargs):
+    facet, field = THROUGH_FACETS[sender]
+    facet_index.add(facet, [getattr(instance, field)], [instance.work_id])
+
+
+@receiver(post_delete, sender=WorkTag)
+@receiver(post_delete, sender=WorkFandom)
+@receiver(post_delete, sender=WorkCharacter)
+def unindex_through_row(sender, instance, **kwargs):
+    facet, field = THROUGH_FACETS[sender]
+    facet_index.remove(facet, [getattr(instance, field)], [instance.work_id])
+
+
+# ----- Полнотекстовый индекс глав (fulltext.py) -----
+@receiver(post_save, sender=Chapter)
+def index_chapter_text(sender, instance, **kwargs):
+    """
+    Файл главы к этому моменту уже сохранён (FileField.pre_save) - индексируем его текст
+    в той же транзакции, что и саму главу.
+    """
+    fulltext.index_chapter(instance)
+
+
+@receiver(post_delete, sender=Chapter)
+def unindex_chapter_text(sender, instance, **kwargs):
+    fulltext.unindex_chapter(instance.pk)
+
+
+# ----- Готовые JSON-документы произведений (readmodel.py) -----
+# Какие произведения затрагивает изменение справочника: фильтр для Work.objects.filter(...)
+RELATED_LOOKUPS = {
+    Tag: "tags",
+    Fandom: "fandoms",
+    Direction: "direction",
+    Rating: "rating",
+}
+
+
+@receiver(post_save, sender=Work)
+def refresh_work_document(sender, instance, **kwargs):
+    readmodel.refresh_works([instance.pk])
+
+
+@receiver(m2m_changed, sender=WorkTag)
+@receiver(m2m_changed, sender=WorkFandom)
+def refresh_work_document_m2m(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # tag.works.clear(): после очистки уже не узнать, кого сняли
+        _, field = THROUGH_FACETS[sender]
+        instance._cleared_work_ids = list(sender.objects.filter(**{field: instance.pk}).values_list("work_id", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        readmodel.refresh_works([instance.pk])
+    elif action == "post_clear":
+        readmodel.refresh_works(getattr(instance, "_cleared_work_ids", []))
+    elif pk_set:
+        readmodel.refresh_works(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Fandom)
+@receiver(post_save, sender=Direction)
+@receiver(post_save, sender=Rating)
+def refresh_documents_for_taxonomy(sender, instance, created, **kwargs):
+    if not created:
+        readmodel.refresh_related(**{RELATED_LOOKUPS[sender]: instance})
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Fandom)
+@receiver(pre_delete, sender=Direction)
+@receiver(pre_delete, sender=Rating)
+def remember_documents_for_taxonomy(sender, instance, **kwargs):
+    """
+    После удаления связи уже стёрты (CASCADE / SET_NULL) - запоминаем затронутые произведения заранее.
+    """
+    lookup = {RELATED_LOOKUPS[sender]: instance}
+    instance._affected_work_ids = list(Work.objects.filter(**lookup).values_list("id", flat=True).distinct())
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Fandom)
+@receiver(post_delete, sender=Direction)
+@receiver(post_delete, sender=Rating)
+def refresh_documents_after_taxonomy_delete(sender, instance, **kwargs):
+    readmodel.refresh_works(getattr(instance, "_affected_work_ids", []))
+
+
+# ----- Кэш справочников (cache.py) -----
+@receiver(post_save, sender=FandomCategory)
+@receiver(post_save, sender=Fandom)
+@receiver(post_save, sender=TagCategory)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Direction)
+@receiver(post_save, sender=Rating)
+@receiver(post_delete, sender=FandomCategory)
+@receiver(post_delete, sender=Fandom)
+@receiver(post_delete, sender=TagCategory)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Direction)
+@receiver(post_delete, sender=Rating)
+def invalidate_taxonomy_cache(sender, **kwargs):
+    """
+    Создание/изменение/удаление в AdminController (и в админке Django) сбрасывает версию кэша справочников.
+    """
+    transaction.on_commit(bump_taxonomy_version)
+
+
+# ----- Кэш пользователей для JWT-аутентификации (auth.py) -----
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=CustomUser.roles.through)
+def invalidate_cached_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        invalidate_user(instance.pk)
+    elif pk_set:
+        for user_id in pk_set:
+            invalidate_user(user_id)
+    else:
+        clear_user_cache()
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_cached_users_on_role_change(sender, **kwargs):
+    # переименование/удаление роли меняет снимки всех её владельцев - роли меняются редко, сбрасываем всё
+    clear_user_cache()
+
+
+# ----- Метрики SQL по маршрутам (metrics.py) -----
+@receiver(connection_created)
+def record_queries(sender, connection, **kwargs):
+    install_query_recorder(connection)
@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+try:
+    import brotli
+except ImportError:  # необязательная зависимость
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # необязательная зависимость
+    zstandard = None
+
+
+def _compressors():
+    """
+    Кодировки, для которых при загрузке создаётся готовый сжатый вариант: {encoding: (суффикс, функция)}.
+    gzip есть всегда, br и zstd - если установлены пакеты brotli / zstandard.
+    """
+    found = {"gzip": (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))}
+    if brotli is not None:
+        found["br"] = (".br", lambda data: brotli.compress(data, quality=11))
+    if zstandard is not None:
+        found["zstd"] = (".zst", lambda data: zstandard.ZstdCompressor(level=19).compress(data))
+    return found
+
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+# Порядок предпочтения сервера при одинаковом q у клиента
+ENCODING_PREFERENCE = ("br", "zstd", "gzip")
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """
+    "br;q=0.9, gzip" → {"br": 0.9, "gzip": 1.0}
+    """
+    accepted = {}
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[token] = q
+    return accepted
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Хранилище для глав и отзывов: файл кладётся под именем <upload_to>/<sha256[:2]>/<sha256><расширение>,
+    поэтому одинаковые загрузки занимают место один раз. Рядом один раз, при загрузке,
+    создаются сжатые варианты (.gz / .br / .zst), которые потом отдаются как есть.
+    """
+    # сжатый вариант не храним, если он выигрывает меньше 10%
+    MIN_RATIO = 0.9
+
+    def content_name(self, name, content) -> str:
+        """
+        Имя, под которым _save положит content, загружаемый как name.
+        """
+        sha = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            sha.update(chunk)
+        digest = sha.hexdigest()
+        directory, filename = posixpath.split(name.replace("\\", "/"))
+        ext = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + ext)
+
+    def _save(self, name, content):
+        target = self.content_name(name, content)
+        if self.exists(target):
+            return target
+        content.seek(0)
+        saved = super()._save(target, content)
+        if saved != target:
+            # параллельная загрузка того же содержимого успела первой - оставляем её файл
+            self.delete(saved)
+            return target
+        self._write_variants(target)
+        return target
+
+    def _write_variants(self, name):
+        with self.open(name, "rb") as f:
+            data = f.read()
+        for encoding, (suffix, compress) in _compressors().items():
+            packed = compress(data)
+            if len(packed) < len(data) * self.MIN_RATIO:
+                super()._save(name + suffix, ContentFile(packed))
+
+    def delete_with_variants(self, name):
+        for suffix in ("", ".gz", ".br", ".zst"):
+            self.delete(name + suffix)
+
+    def variants(self, name) -> dict:
+        """
+        Какие сжатые варианты реально лежат на диске: {encoding: имя файла}.
+        """
+        found = {}
+        for encoding, suffix in (("gzip", ".gz"), ("br", ".br"), ("zstd", ".zst")):
+            if self.exists(name + suffix):
+                found[encoding] = name + suffix
+        return found
+
+    def negotiate(self, name, accept_encoding: str):
+        """
+        Выбирает вариант под Accept-Encoding клиента. Возвращает (имя файла, encoding или None).
+        """
+        accepted = parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for encoding, variant in self.variants(name).items():
+            q = accepted.get(encoding, wildcard)
+            if q <= 0:
+                continue
+            if best is None or q > best_q or (
+                q == best_q and ENCODING_PREFERENCE.index(encoding) < ENCODING_PREFERENCE.index(best[1])
+            ):
+                best, best_q = (variant, encoding), q
+        return best or (name, None)
+
+    def etag(self, name, encoding: str = None):
+        """
+        Имя файла - это хэш содержимого, так что он же служит сильным ETag.
+        Для файлов, загруженных до этого хранилища (имя не хэш), вернёт None.
+        """
+        digest = os.path.splitext(posixpath.basename(name))[0]
+        if not _SHA256.fullmatch(digest):
+            return None
+        return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+
+content_storage = ContentAddressedStorage()
+
+
+def get_content_storage():
+    return content_storage
@@ -0,0 +1,147 @@
+import asyncio
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+
+CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def file_etag(size: int, mtime_ns: int) -> str:
+    return f'"{mtime_ns:x}-{size:x}"'
+
+
+def parse_range(header: str, size: int):
+    """
+    Разбирает заголовок Range для одного диапазона.
+    None - заголовка нет или он нам не подходит (несколько диапазонов, мусор, конец раньше начала):
+           отдаём файл целиком.
+    ()   - диапазон начинается за концом файла: 416.
+    (start, end) - включительные границы.
+    """
+    m = _RANGE.match(header.strip()) if header else None
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first:
+        # bytes=-500 - последние 500 байт
+        length = int(last)
+        if length == 0:
+            return ()
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # bytes=5-2 - синтаксически неверный диапазон, заголовок игнорируется (RFC 9110, 14.1.1)
+        return None
+    if start >= size:
+        return ()
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _if_range_matches(request, etag: str, mtime: float) -> bool:
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    ts = parse_http_date_safe(if_range)
+    return ts is not None and int(mtime) <= ts
+
+
+async def _aread_range(path: str, start: int, length: int):
+    """
+    Байты [start, start + length) файла: каждый блок читается в потоке, а пока медленный клиент
+    принимает предыдущий блок, воркер свободен для других запросов.
+    """
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _prepare(request, path: str, filename: str, etag: str, content_type: str, headers: dict):
+    """
+    Синхронная часть aserve_file (stat, валидаторы, Range). Возвращает (готовый ответ, None), если тело отдавать не нужно
+    (304, X-Accel-Redirect, 416), иначе (None, (start, end, size, content_type, validators)).
+    """
+    st = os.stat(path)
+    size = st.st_size
+    etag = etag or file_etag(size, st.st_mtime_ns)
+    last_modified = int(st.st_mtime)
+    content_type = content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if content_type.startswith("text/") and "charset" not in content_type:
+        content_type += "; charset=utf-8"
+
+    validators = {"ETag": etag, "Last-Modified": http_date(last_modified), "Accept-Ranges": "bytes"}
+    validators.update(headers or {})
+
+    def finish(response):
+        for key, value in validators.items():
+            response[key] = value
+        return response, None
+
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        return finish(conditional)
+
+    accel_prefix = getattr(settings, "CHAPTER_ACCEL_REDIRECT_PREFIX", None)
+    if accel_prefix:
+        rel = os.path.relpath(path, settings.MEDIA_ROOT or os.getcwd()).replace(os.sep, "/")
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + rel
+        return finish(response)
+
+    byte_range = None
+    if _if_range_matches(request, etag, st.st_mtime):
+        byte_range = parse_range(request.headers.get("Range"), size)
+    if byte_range == ():
+        response = HttpResponse(status=416)
+        response["Content-Range"] = f"bytes */{size}"
+        return finish(response)
+    start, end = byte_range or (None, None)
+    return None, (start, end, size, content_type, validators)
+
+
+def _ranged(path: str, start: int, end: int, size: int, content_type: str, validators: dict):
+    length = end - start + 1
+    response = StreamingHttpResponse(_aread_range(path, start, length), status=206, content_type=content_type)
+    response["Content-Length"] = str(length)
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    for key, value in validators.items():
+        response[key] = value
+    return response
+
+
+async def aserve_file(request, path: str, filename: str, etag: str = None, content_type: str = None,
+                      headers: dict = None):
+    """
+    Отдаёт файл с валидаторами (ETag/Last-Modified → 304), поддержкой Range (206/416)
+    и, если настроен CHAPTER_ACCEL_REDIRECT_PREFIX, через X-Accel-Redirect (байты отдаёт nginx).
+    Тело - асинхронный итератор, так что медленный клиент не занимает поток из пула на всё время скачивания.
+    """
+    response, plan = await asyncio.to_thread(_prepare, request, path, filename, etag, content_type, headers)
+    if response is not None:
+        return response
+    start, end, size, content_type, validators = plan
+    if start is None:
+        response = StreamingHttpResponse(_aread_range(path, 0, size), content_type=content_type)
+        response["Content-Length"] = str(size)
+        response["Content-Disposition"] = content_disposition_header(False, filename)
+        for key, value in validators.items():
+            response[key] = value
+        return response
+    return _ranged(path, start, end, size, content_type, validators)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class StrictQueryBudgetRunner(DiscoverRunner):
+    """
+    manage.py test с QUERY_BUDGET_MODE = "raise": превышение QUERY_BUDGETS (api/metrics.py) роняет тест,
+    а не пишет предупреждение в лог - как фикстура strict_query_budgets в тестах myproject.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._budget_mode = settings.QUERY_BUDGET_MODE
+        settings.QUERY_BUDGET_MODE = "raise"
+
+    def teardown_test_environment(self, **kwargs):
+        settings.QUERY_BUDGET_MODE = self._budget_mode
+        super().teardown_test_environment(**kwargs)
@@ -1,3 +1,523 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import random
+import tempfile
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import DatabaseError, transaction
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from ninja_jwt.tokens import AccessToken
+
+from .cache import ataxonomy_version, check_taxonomy_cache
+from .facets import Bitmap, _Probe, facet_index
+from .importer import ArchiveImporter
+from . import benchmark, replicas
+from .metrics import QueryBudgetExceeded, metrics_urlpatterns, metrics_view, registry
+from .models import (
+    CustomUser, Direction, Rating, TagCategory, Tag, FandomCategory, Fandom, Work, Chapter, WorkDocument, Review,
+    ImportCheckpoint, FacetIndexChange,
+)
+
+
+def make_catalogue(n_works: int = 5):
+    """
+    Маленький каталог для тестов: один автор, по одному значению каждой таксономии.
+    """
+    author = CustomUser.objects.create_user(username="author", password="pass12345")
+    direction = Direction.objects.create(name="Джен", description="")
+    rating = Rating.objects.create(name="G", description="")
+    tag = Tag.objects.create(category=TagCategory.objects.create(name="Жанры"), name="Флафф", description="")
+    fandom = Fandom.objects.create(category=FandomCategory.objects.create(name="Книги"), name="Ведьмак")
+    works = []
+    for i in range(n_works):
+        w = Work.objects.create(author=author, direction=direction, rating=rating, name=f"Работа {i}")
+        w.tags.set([tag])
+        w.fandoms.set([fandom])
+        works.append(w)
+    return works
+
+
+class WorksListTestCase(TestCase):
+    def setUp(self):
+        self.works = make_catalogue(5)
+
+    def test_keyset_pages_cover_all_works(self):
+        seen = []
+        cursor = None
+        while True:
+            url = "/api/works/list?limit=2" + (f"&cursor={cursor}" if cursor else "")
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            seen.extend(item["id"] for item in data["items"])
+            cursor = data["next_cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, [w.id for w in self.works])
+
+    def test_bad_cursor(self):
+        response = self.client.get("/api/works/list?cursor=%21%21%21")
+        self.assertEqual(response.status_code, 400)
+
+    def test_stream_ndjson_and_json(self):
+        response = self.client.get("/api/works/stream?chunk=2")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["id"] for line in lines], [w.id for w in self.works])
+
+        response = self.client.get("/api/works/stream?format=json&chunk=2")
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data[0]["tags"][0]["name"], "Флафф")
+
+
+class WorkSearchTestCase(TestCase):
+    def setUp(self):
+        # индекс живёт в памяти процесса и не откатывается вместе с транзакцией теста
+        facet_index.invalidate()
+        self.works = make_catalogue(4)
+        self.warning = Tag.objects.create(category=TagCategory.objects.first(), name="Смерть персонажа", description="")
+        self.works[0].tags.add(self.warning)
+        self.works[1].tags.add(self.warning)
+        self.works[3].delete()
+
+    def test_include_exclude_and_counts(self):
+        fluff = Tag.objects.get(name="Флафф")
+        response = self.client.get(f"/api/works/search?tags={fluff.id}&exclude_tags={self.warning.id}")
+        data = response.json()
+        self.assertEqual([w["id"] for w in data["items"]], [self.works[2].id])
+        self.assertEqual(data["total"], 1)
+
+        response = self.client.get(f"/api/works/search?tags={fluff.id}&limit=1")
+        data = response.json()
+        self.assertEqual(data["total"], 3)
+        self.assertIsNotNone(data["next_cursor"])
+        tag_counts = {f["id"]: f["count"] for f in data["facets"]["tags"]}
+        self.assertEqual(tag_counts, {fluff.id: 3, self.warning.id: 2})
+
+    def test_removed_tag_is_unindexed(self):
+        self.works[0].tags.remove(self.warning)
+        response = self.client.get(f"/api/works/search?tags={self.warning.id}")
+        self.assertEqual([w["id"] for w in response.json()["items"]], [self.works[1].id])
+
+    def search_ids(self, tag):
+        return [w["id"] for w in self.client.get(f"/api/works/search?tags={tag.id}&facets=tags").json()["items"]]
+
+    def test_committed_changes_are_replayed_without_rebuild(self):
+        self.search_ids(self.warning)
+        generation = facet_index._generation
+        with self.captureOnCommitCallbacks(execute=True):
+            self.works[2].tags.add(self.warning)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.works[0].tags.remove(self.warning)
+        self.assertEqual(self.search_ids(self.warning), [self.works[1].id, self.works[2].id])
+        self.assertEqual(facet_index._generation, generation)
+
+    def test_rolled_back_change_is_not_indexed(self):
+        self.search_ids(self.warning)
+        last = FacetIndexChange.objects.order_by("-version").first()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.works[2].tags.add(self.warning)
+            # запись журнала - в той же транзакции, что и данные; сама транзакция её не доигрывает
+            self.assertEqual(FacetIndexChange.objects.latest("version").op, "add")
+            self.assertEqual(self.search_ids(self.warning), [self.works[0].id, self.works[1].id])
+            raise RuntimeError
+        self.assertEqual(FacetIndexChange.objects.order_by("-version").first(), last)
+        self.assertEqual(self.search_ids(self.warning), [self.works[0].id, self.works[1].id])
+
+    @override_settings(FACET_LOG_KEEP=2, FACET_LOG_PRUNE_EVERY=0)
+    def test_prune_log_keeps_last_changes(self):
+        for work in self.works[:3]:
+            work.tags.remove(self.warning)
+        versions = list(FacetIndexChange.objects.order_by("version").values_list("version", flat=True))
+        self.assertGreater(len(versions), 2)
+        call_command("prune_facet_log", stdout=io.StringIO())
+        self.assertEqual(list(FacetIndexChange.objects.values_list("version", flat=True)), versions[-2:])
+
+    @override_settings(FACET_LOG_KEEP=1, FACET_LOG_PRUNE_EVERY=1)
+    def test_log_is_pruned_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.works[0].tags.remove(self.warning)
+        self.assertEqual(FacetIndexChange.objects.count(), 1)
+
+    def test_only_requested_facets_are_counted(self):
+        data = self.client.get("/api/works/search?facets=ratings").json()
+        self.assertEqual(list(data["facets"]), ["ratings"])
+        self.assertEqual(self.client.get("/api/works/search?facets=colour").status_code, 400)
+
+
+class BitmapTestCase(SimpleTestCase):
+    def test_operations_match_sets(self):
+        rng = random.Random(1)
+        # плотный блок (битовая карта), редкий блок (массив) и блоки, которые есть только у одного
+        a = set(rng.sample(range(70_000), 9000)) | {200_000, 300_001}
+        b = set(rng.sample(range(140_000), 3000)) | {300_001}
+        x, y = Bitmap.from_ids(a), Bitmap.from_ids(b)
+        self.assertEqual(list((x & y).iter_ids()), sorted(a & b))
+        self.assertEqual(list((x | y).iter_ids()), sorted(a | b))
+        self.assertEqual(list((x - y).iter_ids()), sorted(a - b))
+        self.assertEqual(x.intersection_size(y), len(a & b))
+        # подсчёт в counts(): редкий, плотный и почти полный блок результата
+        for result in (set(rng.sample(range(140_000), 40)), a, set(range(65_536)) - {7, 9}):
+            probe = _Probe(Bitmap.from_ids(result))
+            self.assertEqual(probe.intersection_size(y), len(result & b))
+            self.assertEqual(probe.intersection_size(x), len(result & a))
+        self.assertEqual(list(x.iter_ids(after=65_000)), sorted(i for i in a if i > 65_000))
+
+        x.discard(list(a)[:8000])
+        x.add([5, 400_000])
+        expected = (a - set(list(a)[:8000])) | {5, 400_000}
+        self.assertEqual(list(x.iter_ids()), sorted(expected))
+        self.assertEqual(len(x), len(expected))
+        self.assertIn(400_000, x)
+        self.assertNotIn(6, x - Bitmap.from_ids([6]))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ChapterSearchTestCase(TestCase):
+    def setUp(self):
+        work = make_catalogue(1)[0]
+        self.dragon = Chapter.objects.create(
+            work=work, title="Пещера", file=ContentFile("Старый дракон спал в пещере.".encode(), name="c1.txt"))
+        self.sea = Chapter.objects.create(
+            work=work, title="Море", file=ContentFile("Корабль плыл по морю.".encode(), name="c2.txt"))
+
+    def test_search_ranks_and_snippets(self):
+        response = self.client.get("/api/chapters/search?q=дракон")
+        hits = response.json()
+        self.assertEqual([h["id"] for h in hits], [self.dragon.id])
+        self.assertIn("<b>дракон</b>", hits[0]["snippet"])
+
+        response = self.client.get("/api/chapters/search?q=кораб*")
+        self.assertEqual([h["id"] for h in response.json()], [self.sea.id])
+
+    def test_deleted_chapter_is_unindexed(self):
+        self.sea.delete()
+        response = self.client.get("/api/chapters/search?q=морю")
+        self.assertEqual(response.json(), [])
+
+
+async def read_body(response) -> bytes:
+    return b"".join([chunk async for chunk in response.streaming_content])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ChapterContentTestCase(TestCase):
+    def setUp(self):
+        work = make_catalogue(1)[0]
+        self.chapter = Chapter.objects.create(work=work, title="Глава", file=ContentFile(b"0123456789", name="c.txt"))
+        self.url = f"/api/works/{work.id}/chapters/{self.chapter.id}/content"
+
+    async def test_full_and_conditional(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await read_body(response), b"0123456789")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Length"], "10")
+
+        response = await self.async_client.get(self.url, headers={"If-None-Match": response["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_ranges(self):
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=2-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(await read_body(response), b"2345")
+
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=-3"})
+        self.assertEqual(await read_body(response), b"789")
+
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=20-"})
+        self.assertEqual(response.status_code, 416)
+
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=5-2"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(await read_body(response), b"0123456789")
+
+        response = await self.async_client.get(self.url, headers={"Range": "bytes=2-5", "If-Range": '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ContentStorageTestCase(TestCase):
+    def setUp(self):
+        self.work = make_catalogue(1)[0]
+        self.text = ("Очень длинная глава. " * 200).encode()
+
+    def test_dedup_and_precompressed_variant(self):
+        first = Chapter.objects.create(work=self.work, title="1", file=ContentFile(self.text, name="a.txt"))
+        second = Chapter.objects.create(work=self.work, title="2", file=ContentFile(self.text, name="b.txt"))
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertIn("gzip", first.file.storage.variants(first.file.name))
+
+        url = f"/api/works/{self.work.id}/chapters/{first.id}/content"
+        response = async_to_sync(self.async_client.get)(url, headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(async_to_sync(read_body)(response)), self.text)
+
+        response = async_to_sync(self.async_client.get)(url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(async_to_sync(read_body)(response), self.text)
+
+
+class WorkDocumentTestCase(TestCase):
+    def setUp(self):
+        self.work = make_catalogue(1)[0]
+
+    def test_document_follows_taxonomy_changes(self):
+        tag = Tag.objects.get(name="Флафф")
+        tag.name = "Флафф и уют"
+        tag.save()
+        data = self.client.get(f"/api/works/{self.work.id}").json()
+        self.assertEqual(data["tags"][0]["name"], "Флафф и уют")
+
+        self.work.direction.delete()
+        data = self.client.get(f"/api/works/{self.work.id}").json()
+        self.assertIsNone(data["direction"])
+
+        self.work.tags.clear()
+        data = self.client.get("/api/works/list").json()
+        self.assertEqual(data["items"][0]["tags"], [])
+
+    def test_missing_document_is_rendered_on_read(self):
+        WorkDocument.objects.all().delete()
+        data = self.client.get(f"/api/works/{self.work.id}").json()
+        self.assertEqual(data["name"], "Работа 0")
+        self.assertTrue(WorkDocument.objects.filter(work=self.work).exists())
+        self.assertEqual(self.client.get("/api/works/999999").status_code, 404)
+
+
+class TaxonomyCacheTestCase(TestCase):
+    def setUp(self):
+        make_catalogue(1)
+
+    def test_cached_with_etag_and_invalidated_on_change(self):
+        first = self.client.get("/api/directions")
+        self.assertEqual(first.json()[0]["name"], "Джен")
+        with self.assertNumQueries(0):
+            again = self.client.get("/api/directions", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Direction.objects.create(name="Слэш", description="")
+        fresh = self.client.get("/api/directions", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertEqual([d["name"] for d in fresh.json()], ["Джен", "Слэш"])
+
+    def test_version_bumped_only_after_commit(self):
+        version = async_to_sync(ataxonomy_version)()
+        with self.captureOnCommitCallbacks() as callbacks:
+            Direction.objects.create(name="Слэш", description="")
+        self.assertEqual(async_to_sync(ataxonomy_version)(), version)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(async_to_sync(ataxonomy_version)(), version + 1)
+
+    @override_settings(TAXONOMY_LOCAL_TTL=0)
+    def test_local_entries_expire_without_shared_cache(self):
+        # изменение из соседнего процесса: версия здесь не сдвигается, спасает только TTL
+        self.client.get("/api/directions")
+        Direction.objects.create(name="Слэш", description="")
+        self.assertEqual(len(self.client.get("/api/directions").json()), 2)
+
+    def test_process_local_shared_cache_fails_check(self):
+        with override_settings(TAXONOMY_SHARED_CACHE="default"):
+            self.assertEqual([e.id for e in check_taxonomy_cache(None)], ["api.E002"])
+        self.assertEqual(check_taxonomy_cache(None), [])
+
+    def test_missing_category_is_404(self):
+        self.assertEqual(self.client.get("/api/tag-categories/999999/tags").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportArchiveTestCase(TestCase):
+    RECORDS = [
+        {"kind": "fandom_category", "name": "Книги"},
+        {"kind": "fandom", "category": "Книги", "name": "Ведьмак"},
+        {"kind": "tag_category", "name": "Жанры"},
+        {"kind": "tag", "category": "Жанры", "name": "Флафф", "description": ""},
+        {"kind": "direction", "name": "Джен", "description": ""},
+        {"kind": "work", "name": "Первая", "direction": "Джен", "tags": ["Флафф"], "fandoms": ["Ведьмак"],
+         "chapters": [{"title": "Глава 1", "file": "ch/1.txt"}]},
+        {"kind": "work", "name": "Сломанная", "tags": ["Нет такого"]},
+        {"kind": "work", "name": "Вторая", "chapters": [{"title": "Пролог", "text": "Грифон над рекой"}]},
+    ]
+
+    def setUp(self):
+        self.author = CustomUser.objects.create_user(username="importer", password="pass12345")
+
+    def archive(self, records):
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w") as zf:
+            zf.writestr("works.jsonl", "\n".join(json.dumps(r, ensure_ascii=False) for r in records))
+            zf.writestr("ch/1.txt", "Ведьмак встретил дракона".encode())
+        buf.seek(0)
+        return buf
+
+    def run_import(self, records):
+        importer = ArchiveImporter("test-archive", default_author=self.author.pk, batch_size=3)
+        return importer.run(self.archive(records), "archive.zip")
+
+    def test_import_and_resume(self):
+        stats = self.run_import(self.RECORDS)
+        self.assertEqual((stats.works, stats.chapters, stats.taxonomy), (2, 2, 5))
+        self.assertEqual([e["line"] for e in stats.errors], [7])
+
+        first = Work.objects.get(name="Первая")
+        self.assertEqual([t.name for t in first.tags.all()], ["Флафф"])
+        self.assertEqual(self.client.get(f"/api/works/{first.id}").json()["fandoms"][0]["name"], "Ведьмак")
+        hits = self.client.get("/api/chapters/search?q=грифон").json()
+        self.assertEqual([h["title"] for h in hits], ["Пролог"])
+
+        more = self.RECORDS + [{"kind": "work", "name": "Третья"}]
+        stats = self.run_import(more)
+        self.assertEqual((stats.resumed_from, stats.works), (len(self.RECORDS), 1))
+        self.assertEqual(Work.objects.count(), 3)
+
+    def test_taxonomy_without_parent_is_reported_not_crashed(self):
+        stats = self.run_import([
+            {"kind": "fandom", "name": "Сирота"},
+            {"kind": "tag", "category": None, "name": "Без категории"},
+            {"kind": "character", "fandom": "Нет такого", "name": "Геральт"},
+            {"kind": "direction", "name": "Джен", "description": ""},
+        ])
+        self.assertEqual([e["line"] for e in stats.errors], [1, 2, 3])
+        self.assertIn("needs 'category'", stats.errors[0]["error"])
+        self.assertEqual(stats.taxonomy, 1)
+        self.assertFalse(Fandom.objects.filter(name="Сирота").exists())
+
+    def stored_files(self):
+        storage = Chapter._meta.get_field("file").storage
+        found = set()
+        if storage.exists("chapters"):
+            for directory in storage.listdir("chapters")[0]:
+                found |= {f"chapters/{directory}/{name}" for name in storage.listdir(f"chapters/{directory}")[1]}
+        return found
+
+    def failing_import(self, records):
+        with mock.patch.object(ImportCheckpoint.objects, "update_or_create", side_effect=DatabaseError("boom")):
+            with self.assertRaises(DatabaseError):
+                ArchiveImporter("other-archive", default_author=self.author.pk).run(self.archive(records), "a.zip")
+
+    def test_failed_batch_removes_written_chapter_files(self):
+        before = self.stored_files()
+        self.failing_import([{"kind": "work", "name": "Откат", "chapters": [{"title": "Глава", "text": "Новый текст " * 50}]}])
+        self.assertFalse(Work.objects.filter(name="Откат").exists())
+        # вместе с файлом уходят и его сжатые варианты
+        self.assertEqual(self.stored_files(), before)
+
+    def test_failed_batch_keeps_files_shared_with_committed_chapters(self):
+        self.run_import([{"kind": "work", "name": "Первая", "chapters": [{"title": "Глава", "file": "ch/1.txt"}]}])
+        committed = Chapter.objects.get(work__name="Первая")
+        before = self.stored_files()
+        self.assertIn(committed.file.name, before)
+
+        # то же содержимое главы - хранилище отдаёт уже существующий файл
+        self.failing_import([{"kind": "work", "name": "Откат", "chapters": [{"title": "Копия", "file": "ch/1.txt"}]}])
+        self.assertEqual(self.stored_files(), before)
+        with committed.file.open("rb") as f:
+            self.assertEqual(f.read().decode(), "Ведьмак встретил дракона")
+
+
+class CachedJWTAuthTestCase(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username="reader", email="reader@example.com", password="pass12345")
+        self.headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_second_request_skips_user_lookup(self):
+        self.assertEqual(self.client.get("/api/users/me", **self.headers).status_code, 200)
+        # остаётся только запрос ролей самого эндпоинта users/me
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get("/api/users/me", **self.headers).status_code, 200)
+
+    def test_user_changes_invalidate_snapshot(self):
+        self.client.get("/api/users/me", **self.headers)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/users/me", **self.headers).status_code, 401)
+
+
+@override_settings(REPLICA_DATABASES=["replica1"])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        replicas._state.set(None)
+        self.addCleanup(replicas._state.set, None)
+        self.router = replicas.ReplicaRouter()
+
+    def test_reads_go_to_replica_until_write(self):
+        self.assertEqual(self.router.db_for_read(Work), "replica1")
+        self.assertEqual(self.router.db_for_read(Chapter), "replica1")
+        self.assertIsNone(self.router.db_for_read(Review))
+        with replicas.use_primary():
+            self.assertIsNone(self.router.db_for_read(Work))
+        self.assertEqual(self.router.db_for_write(Work), "default")
+        self.assertIsNone(self.router.db_for_read(Work))
+
+
+# "реплика" - та же тестовая БД: проверяется только прилипание к основной после записи
+@override_settings(REPLICA_DATABASES=["default"])
+class ReplicaPinCookieTestCase(TestCase):
+    def test_write_sets_pin_cookie(self):
+        work = make_catalogue(1)[0]
+        headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(work.author)}"}
+        body = {"name": "Новая", "direction_id": work.direction_id, "rating_id": work.rating_id,
+                "tag_ids": [], "fandom_ids": []}
+        self.assertNotIn("db_pin", self.client.get("/api/works").cookies)
+        response = self.client.post("/api/content/work/create", body, content_type="application/json", **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("db_pin", response.cookies)
+        response = self.client.post("/api/content/work/create", body, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+        self.assertNotIn("db_pin", response.cookies)
+
+
+class MetricsTestCase(TestCase):
+    def setUp(self):
+        make_catalogue(2)
+        registry.clear()
+        self.addCleanup(registry.clear)
+
+    def test_route_metrics_exposed(self):
+        self.assertEqual(self.client.get("/api/works/list").status_code, 200)
+        stats = registry.snapshot()[("GET api/works/list", 200)]
+        self.assertEqual(stats.count, 1)
+        self.assertGreater(stats.queries, 0)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            body = metrics_view(RequestFactory().get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")).content.decode()
+        self.assertIn(f'api_db_queries_total{{route="GET api/works/list",status="200"}} {stats.queries}', body)
+
+    def test_metrics_need_token(self):
+        # без METRICS_TOKEN маршрута нет вовсе
+        self.assertEqual(metrics_urlpatterns(), [])
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with override_settings(METRICS_TOKEN="s3cret"):
+            self.assertEqual(len(metrics_urlpatterns()), 1)
+            for headers in ({}, {"HTTP_AUTHORIZATION": "Bearer wrong"}):
+                # адрес не в счёт: за локальным nginx он всегда 127.0.0.1
+                with self.assertRaises(Http404):
+                    metrics_view(RequestFactory().get("/metrics", REMOTE_ADDR="127.0.0.1", **headers))
+
+    @override_settings(QUERY_BUDGETS={"GET api/works/list": 1})
+    def test_budget_exceeded(self):
+        # "raise" включает TEST_RUNNER (api/testing.py)
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get("/api/works/list")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BenchmarkTestCase(TestCase):
+    def test_scenarios_run_in_process(self):
+        work = make_catalogue(3)[0]
+        Chapter.objects.create(work=work, title="Глава 1", file=ContentFile(b"text", name="c.txt"))
+        CustomUser.objects.create_user(username=benchmark.BENCH_USERNAME, email="bench@example.com", password="x")
+
+        results = benchmark.run(benchmark.build_scenarios(), "client", requests=5, warmup=1)
+        self.assertEqual(set(results), {s.name for s in benchmark.build_scenarios()})
+        self.assertEqual({name: r["errors"] for name, r in results.items() if r["errors"]}, {})
+        self.assertEqual(results["work_detail"]["queries_per_request"], 1)
+        self.assertIsNotNone(results["work_create"]["queries_per_request"])
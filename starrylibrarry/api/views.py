@@ -1,32 +1,53 @@
+import asyncio
+import hashlib
+import json
 from typing import List
 
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import Group
-from django.http import FileResponse
-from django.shortcuts import get_object_or_404
-
-
-from .auth import CookieJWTAuth
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404
+
+
+from . import fulltext, readmodel
+from .auth import CookieJWTAuth, CachedJWTAuth
+from .cache import ataxonomy_response
+from .facets import facet_index
+from .importer import ArchiveImporter, ArchiveError, DEFAULT_BATCH_SIZE
+from .metrics import InstrumentedNinjaAPI
+from .storage import ContentAddressedStorage
+from .streaming import aserve_file
+from .pagination import akeyset_page, iter_keyset_chunks, clamp_limit, encode_cursor, decode_cursor, DEFAULT_PAGE_SIZE
 from .schemas import *
 
 from .models import Role, Profile, FandomCategory, Fandom, TagCategory, Tag, Direction, Work, Chapter, Review, Rating
 
 from ninja.responses import Response
-from ninja import Form, File, UploadedFile
+from ninja import Form, File, UploadedFile, Query
 from ninja.errors import HttpError
-from ninja_extra import NinjaExtraAPI, api_controller, route, permissions
+from ninja_extra import api_controller, route, permissions
 from ninja_jwt.controller import NinjaJWTDefaultController, TokenVerificationController
-from ninja_jwt.authentication import JWTAuth
 from ninja_jwt.tokens import RefreshToken
 
 
 
 User = get_user_model()
 
-api = NinjaExtraAPI(auth=[CookieJWTAuth()])
+api = InstrumentedNinjaAPI(auth=[CookieJWTAuth()])
 api.register_controllers(NinjaJWTDefaultController)
-api.auth = [JWTAuth]
+api.auth = [CachedJWTAuth]
+
+
+def dump_values(qs, *fields) -> str:
+    return json.dumps(list(qs.order_by("pk").values(*fields)), ensure_ascii=False)
+
+
+def json_response(body: str) -> HttpResponse:
+    """
+    Ответ из уже готового JSON (документы readmodel) - минуя сериализацию ninja/pydantic.
+    """
+    return HttpResponse(body, content_type="application/json; charset=utf-8")
 
 
 # =====================
@@ -83,95 +104,209 @@ class AuthController:
 @api_controller("/", auth=None, permissions=[permissions.AllowAny])
 class PublicController:
 
+    # Справочники меняются редко, а запрашиваются на каждой странице фронтенда:
+    # отдаём их из cache.ataxonomy_response (LRU + версия, которую сбрасывают сигналы на изменения).
+    # Горячие публичные чтения - async: под uvicorn они не держат поток из пула, пока ждут БД или клиента.
     @route.get("fandom-categories", response=List[FandomCategoryOut])
-    def list_fandom_categories(self, request):
-        return [FandomCategoryOut.from_orm(fc) for fc in FandomCategory.objects.all()]
+    async def list_fandom_categories(self, request):
+        return await ataxonomy_response(request, "fandom-categories", lambda: dump_values(FandomCategory.objects.all(), "id", "name"))
 
     @route.get("fandom-categories/{fan_cat_id}/fandoms", response=List[FandomOut])
-    def list_fandoms(self, request, fan_cat_id: int):
-        cat = get_object_or_404(FandomCategory, pk=fan_cat_id)
-        return [FandomOut.from_orm(f) for f in cat.fandoms.all()]
+    async def list_fandoms(self, request, fan_cat_id: int):
+        def build():
+            cat = get_object_or_404(FandomCategory, pk=fan_cat_id)
+            return dump_values(cat.fandoms.all(), "id", "name")
+        return await ataxonomy_response(request, f"fandoms:{fan_cat_id}", build)
 
     @route.get("tag-categories", response=List[TagCategoryOut])
-    def list_tag_categories(self, request):
-        return [TagCategoryOut.from_orm(tc) for tc in TagCategory.objects.all()]
+    async def list_tag_categories(self, request):
+        return await ataxonomy_response(request, "tag-categories", lambda: dump_values(TagCategory.objects.all(), "id", "name"))
 
     @route.get("tag-categories/{cat_id}/tags", response=List[TagOut])
-    def list_tags(self, request, cat_id: int):
-        tc = get_object_or_404(TagCategory, pk=cat_id)
-        return [TagOut.from_orm(t) for t in tc.tags.all()]
+    async def list_tags(self, request, cat_id: int):
+        def build():
+            tc = get_object_or_404(TagCategory, pk=cat_id)
+            return dump_values(tc.tags.all(), "id", "name", "description")
+        return await ataxonomy_response(request, f"tags:{cat_id}", build)
 
     @route.get("directions", response=List[DirectionOut])
-    def list_directions(self, request):
-        return [DirectionOut.from_orm(d) for d in Direction.objects.all()]
+    async def list_directions(self, request):
+        return await ataxonomy_response(request, "directions", lambda: dump_values(Direction.objects.all(), "id", "name", "description"))
 
     @route.get("rating", response=List[RatingOut])
-    def list_rating(self, request):
-        return [RatingOut.from_orm(d) for d in Rating.objects.all()]
-
-    @route.get("works/list", response=List[WorkOut])
-    def list_works(self, request):
-        items = []
-        for w in Work.objects.select_related("direction").prefetch_related("tags", "fandoms").all():
-            items.append(WorkOut(
-                id=w.id,
-                name=w.name,
-                rating_count=w.rating_count,
-                rating=w.rating,
-                direction=DirectionOut.from_orm(w.direction),
-                tags=[TagOut.from_orm(t) for t in w.tags.all()],
-                fandoms=[FandomOut.from_orm(f) for f in w.fandoms.all()],
-            ))
-        return items
+    async def list_rating(self, request):
+        return await ataxonomy_response(request, "rating", lambda: dump_values(Rating.objects.all(), "id", "name", "description"))
 
-    @route.get("works/{work_id}", response=WorkOut)
-    def get_work(self, request, work_id: int):
-        w = get_object_or_404(Work.objects.select_related("direction").prefetch_related("tags", "fandoms"), pk=work_id)
-        return WorkOut(
-            id=w.id,
-            name=w.name,
-            rating_count=w.rating_count,
-            rating=w.rating,
-            direction=DirectionOut.from_orm(w.direction),
-            tags=[TagOut.from_orm(t) for t in w.tags.all()],
-            fandoms=[FandomOut.from_orm(f) for f in w.fandoms.all()],
+    @route.get("works/list", response=WorkPageOut)
+    async def list_works(self, request, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+        """
+        GET /api/works/list?limit=50&cursor=...
+        ↪ страница произведений по возрастанию id, next_cursor - для следующей страницы.
+        """
+        rows, next_cursor = await akeyset_page(Work.objects.only("id"), cursor, limit)
+        docs = await readmodel.adocuments(w.id for w in rows)
+        return json_response(readmodel.json_object("items", docs, next_cursor=next_cursor))
+
+    @route.get("works/stream")
+    def stream_works(self, request, format: str = "ndjson", chunk: int = 500):
+        """
+        GET /api/works/stream?format=ndjson|json
+        ↪ весь каталог потоком: пачками по chunk произведений, память не растёт с размером таблицы.
+        """
+        if format not in ("ndjson", "json"):
+            raise HttpError(400, "format must be 'ndjson' or 'json'")
+        chunk = max(1, min(chunk, 2000))
+
+        def chunks():
+            for rows in iter_keyset_chunks(Work.objects.only("id"), chunk):
+                yield readmodel.documents(w.id for w in rows)
+
+        def ndjson():
+            for docs in chunks():
+                yield "".join(doc + "\n" for doc in docs)
+
+        def json_array():
+            yield "["
+            first = True
+            for docs in chunks():
+                if docs:
+                    yield ("" if first else ",") + ",".join(docs)
+                    first = False
+            yield "]"
+
+        if format == "ndjson":
+            return StreamingHttpResponse(ndjson(), content_type="application/x-ndjson")
+        return StreamingHttpResponse(json_array(), content_type="application/json")
+
+    @route.get("works/search", response=WorkSearchOut)
+    def search_works(
+        self, request,
+        tags: List[int] = Query(None),
+        exclude_tags: List[int] = Query(None),
+        fandoms: List[int] = Query(None),
+        exclude_fandoms: List[int] = Query(None),
+        characters: List[int] = Query(None),
+        direction: List[int] = Query(None),
+        rating: List[int] = Query(None),
+        cursor: str = None,
+        limit: int = DEFAULT_PAGE_SIZE,
+        facet_limit: int = 50,
+        facets: List[str] = Query(None),
+    ):
+        """
+        GET /api/works/search?tags=1&tags=2&exclude_tags=7&fandoms=3&rating=1&rating=2&facets=tags
+        ↪ произведения со ВСЕМИ tags/fandoms/characters, без exclude_*, с любой из direction/rating,
+          плюс количество совпадений по каждому значению фасетов facets (по умолчанию - всех).
+          Считается по facets.facet_index.
+        """
+        unknown = set(facets or ()) - set(facet_index.FACETS)
+        if unknown:
+            raise HttpError(400, f"Unknown facets: {', '.join(sorted(unknown))}")
+        result = facet_index.search(
+            include={"tags": tags or [], "fandoms": fandoms or [], "characters": characters or []},
+            exclude={"tags": exclude_tags or [], "fandoms": exclude_fandoms or []},
+            any_of={"directions": direction or [], "ratings": rating or []},
         )
+        limit = clamp_limit(limit)
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None and not isinstance(after, int):
+            raise HttpError(400, "Invalid cursor")
+
+        ids = []
+        for work_id in result.iter_ids(after):
+            ids.append(work_id)
+            if len(ids) > limit:
+                break
+        next_cursor = None
+        if len(ids) > limit:
+            ids = ids[:limit]
+            next_cursor = encode_cursor(ids[-1])
+
+        counts = facet_index.counts(result, max(1, facet_limit), facets)
+        return json_response(readmodel.json_object(
+            "items", readmodel.documents(ids),
+            total=len(result),
+            next_cursor=next_cursor,
+            facets={
+                facet: [{"id": key, "count": count} for key, count in pairs]
+                for facet, pairs in counts.items()
+            },
+        ))
+
+    @route.get("works/{work_id}", response=WorkOut)
+    async def get_work(self, request, work_id: int):
+        docs = await readmodel.adocuments([work_id])
+        if not docs:
+            raise HttpError(404, "Not Found")
+        return json_response(docs[0])
 
     @route.get("works/{work_id}/chapters", response=List[ChapterOut])
-    def list_chapters(self, request, work_id: int):
+    async def list_chapters(self, request, work_id: int):
         qs = Chapter.objects.filter(work_id=work_id)
         return [
             ChapterOut(id=ch.id, work_id=ch.work_id, title=ch.title, file=request.build_absolute_uri(ch.file.url))
-            for ch in qs
+            async for ch in qs
+        ]
+
+    @route.get("chapters/search", response=List[ChapterHitOut])
+    def search_chapters(self, request, q: str, limit: int = 20, offset: int = 0):
+        """
+        GET /api/chapters/search?q=дракон пещер*
+        ↪ главы, в тексте или названии которых есть все слова запроса, по релевантности (bm25),
+          со сниппетом вокруг совпадения. Файлы глав при этом не читаются.
+        """
+        if not fulltext.is_available():
+            raise HttpError(501, "Full-text search is not available on this database")
+        hits = fulltext.search(q, clamp_limit(limit), max(0, offset))
+        chapters = Chapter.objects.only("id", "work_id", "title").in_bulk([h[0] for h in hits])
+        return [
+            ChapterHitOut(id=ch_id, work_id=chapters[ch_id].work_id, title=chapters[ch_id].title, rank=rank, snippet=snippet)
+            for ch_id, rank, snippet in hits if ch_id in chapters
         ]
 
     @route.get("chapters/{ch_id}", response=ChapterOut)
-    def get_chapter(self, request, ch_id: int):
-        ch = get_object_or_404(Chapter, pk=ch_id)
+    async def get_chapter(self, request, ch_id: int):
+        ch = await aget_object_or_404(Chapter, pk=ch_id)
         return ChapterOut(id=ch.id, work_id=ch.work_id, title=ch.title, file=request.build_absolute_uri(ch.file.url))
 
     @route.get("works/{work_id}/chapters/{ch_id}/content")
-    def get_chapter_content(self, request, work_id: int, ch_id: int):
+    async def get_chapter_content(self, request, work_id: int, ch_id: int):
         """
-        GET /api/chapters/{ch_id}/content
-        ↪ возвращает сам файл главы (streaming response).
+        GET /api/works/{work_id}/chapters/{ch_id}/content
+        ↪ возвращает сам файл главы (streaming response, Range/If-None-Match поддерживаются).
+        Тело читается и отправляется асинхронно (streaming.aserve_file).
         """
         qs = Chapter.objects.filter(work_id=work_id)
-        ch = get_object_or_404(qs, pk=ch_id)
-
-        # Открываем файл в бинарном режиме и отдаём потоково.
-        # FileResponse сам выставит корректный Content-Type.
-        return FileResponse(
-            ch.file.open("rb"),
-            as_attachment=False,  # скачивать не заставляем
-            filename=ch.file.name.rsplit("/", 1)[-1],
-        )
+        ch = await aget_object_or_404(qs, pk=ch_id)
+
+        # Отдаём с ETag/Last-Modified и поддержкой Range: читалка может докачать главу
+        # с места обрыва, а неизменившуюся главу не качать вовсе (304).
+        # Если есть заранее сжатый вариант (см. storage.ContentAddressedStorage) под Accept-Encoding
+        # клиента - отдаём его как есть, ничего не пережимая на лету.
+        storage = ch.file.storage
+        name, encoding, etag = ch.file.name, None, None
+        headers = {"Vary": "Accept-Encoding"}
+        if isinstance(storage, ContentAddressedStorage):
+            name, encoding = await asyncio.to_thread(
+                storage.negotiate, ch.file.name, request.headers.get("Accept-Encoding"))
+            etag = storage.etag(ch.file.name, encoding)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        try:
+            return await aserve_file(
+                request, storage.path(name),
+                filename=ch.file.name.rsplit("/", 1)[-1],
+                etag=etag,
+                headers=headers,
+            )
+        except FileNotFoundError:
+            raise HttpError(404, "Chapter file not found")
 
 
 # =====================
 # AUTH END-POINTS heh ;0 --- --- --- АВТОРИЗОВАННЫЕ ЭНД-ПОИНТЫ
 # =====================
-@api_controller("/", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated])
+@api_controller("/", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated])
 class UserController:
 
     # ----- Профиль -----
@@ -228,7 +363,7 @@ class UserController:
 # =====================
 # AUTHOR END-POINTS heh ;0 --- --- --- АВТОРСКИЕ ЭНД-ПОИНТЫ
 # =====================
-@api_controller("/content", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated],)
+@api_controller("/content", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated],)
 class ContentController:
     @route.get("", response=List[WorkOut])
     def list_my_works(self, request):
@@ -236,20 +371,8 @@ class ContentController:
         GET /api/works/
         ➔ список произведений текущего пользователя
         """
-        qs = Work.objects.filter(author=request.user) \
-            .select_related("direction") \
-            .prefetch_related("tags", "fandoms")
-        return [
-            WorkOut(
-                id=w.id,
-                name=w.name,
-                rating_count=w.rating_count,
-                rating=w.rating,
-                direction=DirectionOut.from_orm(w.direction),
-                tags=[TagOut.from_orm(t) for t in w.tags.all()],
-                fandoms=[FandomOut.from_orm(f) for f in w.fandoms.all()],
-            ) for w in qs
-        ]
+        ids = Work.objects.filter(author=request.user).order_by("pk").values_list("id", flat=True)
+        return json_response(readmodel.json_array(readmodel.documents(ids)))
 
     @route.post("work/create", response=WorkOut)
     def create_work(self, request, data: WorkIn):
@@ -334,7 +457,7 @@ class ContentController:
 # =====================
 # ADMIN END-POINTS heh ;0 --- --- --- АДМИНИСТРАТИВНЫЕ ЭНД-ПОИНТЫ
 # =====================
-@api_controller("/admin", auth=[JWTAuth()], permissions=[permissions.IsAuthenticated])
+@api_controller("/admin", auth=[CachedJWTAuth()], permissions=[permissions.IsAuthenticated])
 class AdminController:
 
     # --- Категории фэндомов ---
@@ -555,6 +678,30 @@ class AdminController:
         w.delete()
         return 204, None
 
+    @route.post("import", response=ImportResultOut)
+    def import_archive(self, request, file: UploadedFile = File(...), batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        POST /api/admin/import  (multipart, file=<archive.jsonl | archive.zip>)
+        Массовый импорт (см. importer.py). Записи без известного автора достаются текущему пользователю.
+        Повторная загрузка того же архива продолжает импорт с последней сохранённой пачки.
+        """
+        if not request.user.is_staff:
+            raise HttpError(403, "Forbidden")
+        digest = hashlib.sha256()
+        for chunk in file.chunks():
+            digest.update(chunk)
+        file.seek(0)
+        importer = ArchiveImporter(
+            source=f"upload:{digest.hexdigest()}",
+            default_author=request.user.pk,
+            batch_size=max(1, min(batch_size, 5000)),
+        )
+        try:
+            stats = importer.run(file, file.name)
+        except ArchiveError as e:
+            raise HttpError(400, str(e))
+        return ImportResultOut(**stats.__dict__)
+
 #
 # =====================
 # AUTH END-POINTS heh ;0 --- --- --- АВТОРИЗОВАННЫЕ ЭНД-ПОИНТЫ для группы... (УЖЕ НЕ НАДО!!!)
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'starrylibrarry.settings')
 
 application = get_asgi_application()
+
+# фасетный индекс поиска (api/facets.py) строится в фоне, а не на первом запросе
+from api.facets import facet_index  # noqa: E402
+
+facet_index.warm_in_background()
@@ -10,9 +10,12 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
+from .database import database_config, replica_configs
+
 NINJA_JWT = {
   "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
   "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
@@ -21,6 +24,12 @@ NINJA_JWT = {
   "AUTH_COOKIE_SAMESITE": "Lax",
 }
 
+# Кэш проверенных JWT и снимков пользователей (api/auth.py), в каждом процессе свой.
+# Сигналы сбрасывают снимок при изменении пользователя/ролей в этом процессе,
+# JWT_USER_CACHE_TTL ограничивает, насколько устаревшим он может быть в соседних.
+JWT_TOKEN_CACHE_TTL = 300
+JWT_USER_CACHE_TTL = 60
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +64,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +73,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'ninja.compatibility.files.fix_request_files_middleware',
+    'api.replicas.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'starrylibrarry.urls'
@@ -88,11 +99,46 @@ WSGI_APPLICATION = 'starrylibrarry.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Профиль (SQLite в WAL или PostgreSQL с пулом) выбирается переменной DB_ENGINE, см. database.py
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(BASE_DIR),
+}
+DATABASES.update(replica_configs(DATABASES['default']))
+
+# Чтение моделей REPLICA_READ_MODELS - с реплик (api/replicas.py); после записи пользователь ещё
+# REPLICA_PIN_SECONDS секунд читает с основной БД, чтобы видеть свои изменения.
+REPLICA_DATABASES = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+REPLICA_READ_MODELS = [
+    'api.fandomcategory', 'api.fandom', 'api.character', 'api.tagcategory', 'api.tag',
+    'api.direction', 'api.rating', 'api.work', 'api.worktag', 'api.workfandom', 'api.workcharacter',
+    'api.workdocument', 'api.chapter',
+]
+REPLICA_PIN_SECONDS = 5
+REPLICA_PIN_COOKIE = 'db_pin'
+
+# Метрики маршрутов (api/metrics.py): /metrics в формате Prometheus. Без METRICS_TOKEN не подключается,
+# с ним - только для "Authorization: Bearer <METRICS_TOKEN>" (скрейпер Prometheus: authorization.credentials).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN') or None
+# Сколько SQL-запросов можно маршруту ("МЕТОД шаблон-URL"); превышение - в лог или исключение (в тестах).
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log')
+# manage.py test переключает QUERY_BUDGET_MODE в "raise" (api/testing.py)
+TEST_RUNNER = 'api.testing.StrictQueryBudgetRunner'
+QUERY_BUDGETS = {
+    'GET api/fandom-categories': 1,
+    'GET api/fandom-categories/<fan_cat_id>/fandoms': 2,
+    'GET api/tag-categories': 1,
+    'GET api/tag-categories/<cat_id>/tags': 2,
+    'GET api/directions': 1,
+    'GET api/rating': 1,
+    'GET api/works/list': 3,
+    'GET api/works/search': 7,  # 2 при свежем индексе, 7 - если его пришлось перестроить
+    'GET api/works/<work_id>': 5,  # 2 при готовом документе, 5 - если его пришлось пересобрать
+    'GET api/works/<work_id>/chapters': 2,
+    'GET api/chapters/search': 3,
+    'GET api/chapters/<ch_id>': 1,
+    'GET api/works/<work_id>/chapters/<ch_id>/content': 2,
 }
 
 
@@ -133,7 +179,34 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Файлы глав и отзывов. Пусто - относительно текущего каталога (как было всегда);
+# seed_bench удобно направлять в отдельный каталог: MEDIA_ROOT=/tmp/bench-media
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Отдача файлов глав через nginx (X-Accel-Redirect): например "/protected-media/",
+# location которого в nginx помечен internal и указывает на MEDIA_ROOT.
+# None - файлы отдаёт сам Django (FileResponse / 206 для Range).
+CHAPTER_ACCEL_REDIRECT_PREFIX = None
+
+# Фасетный индекс (api/facets.py): сколько записей журнала изменений хранить в БД и сколько
+# доигрывать за раз - процесс, отставший сильнее, перестраивает индекс целиком.
+# Лишнее удаляет команда prune_facet_log и сам процесс после каждых FACET_LOG_PRUNE_EVERY своих записей
+# (0 - только командой, например из cron).
+FACET_LOG_KEEP = 10_000
+FACET_LOG_REPLAY_LIMIT = 1000
+FACET_LOG_PRUNE_EVERY = 1000
+
+# Кэш справочников (api/cache.py): локальный LRU в каждом процессе + необязательный общий кэш.
+# TAXONOMY_SHARED_CACHE - алиас общего для процессов кэша из CACHES (например, "redis"); в нём же
+# счётчик версии, так что сброс сразу виден всем воркерам. LocMem здесь не пропустит check.
+# None - всё в памяти процесса: изменение видно сразу только в нём, в остальных - через
+# TAXONOMY_LOCAL_TTL секунд.
+TAXONOMY_SHARED_CACHE = None
+TAXONOMY_CACHE_SIZE = 256
+TAXONOMY_CACHE_TIMEOUT = 24 * 3600
+TAXONOMY_LOCAL_TTL = 30
@@ -16,9 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
+from api.metrics import metrics_urlpatterns
 from api.views import api
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/", api.urls),
-]
+] + metrics_urlpatterns()
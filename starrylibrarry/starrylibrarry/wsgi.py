@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'starrylibrarry.settings')
 
 application = get_wsgi_application()
+
+# фасетный индекс поиска (api/facets.py) строится в фоне, а не на первом запросе
+from api.facets import facet_index  # noqa: E402
+
+facet_index.warm_in_background()